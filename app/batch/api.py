@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+
+from app.user.security import get_current_user
+
+from .schemas import BatchReport, BatchRequest
+from .services import manager
+
+api_router = APIRouter()
+
+
+@api_router.post("/", response_model=BatchReport)
+async def run_batch(
+    batch: BatchRequest,
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.run_batch(current_user, batch)
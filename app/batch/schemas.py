@@ -0,0 +1,104 @@
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field, validator
+
+from app.group.schemas import AddGroup, GroupUsersManage
+from app.org.schemas import AddOrganizationUnit
+from app.user.schemas import AddUser, MoveUserOU, UpdateUserPassword, UserReconcile
+
+
+class BatchMode(str, Enum):
+    # one transaction, the first failure undoes what ran before it
+    atomic = "atomic"
+    # every operation stands on its own
+    independent = "independent"
+
+
+class BatchOp(str, Enum):
+    create_user = "create_user"
+    modify_user = "modify_user"
+    delete_user = "delete_user"
+    update_user_password = "update_user_password"
+    move_user_ou = "move_user_ou"
+    add_group = "add_group"
+    delete_group = "delete_group"
+    add_users_to_group = "add_users_to_group"
+    remove_users_from_group = "remove_users_from_group"
+    set_group_members = "set_group_members"
+    create_organization_unit = "create_organization_unit"
+    delete_organization_unit = "delete_organization_unit"
+
+
+class UsernameArgs(BaseModel):
+    username: str
+
+
+class GroupnameArgs(BaseModel):
+    groupname: str
+
+
+class OrganizationUnitArgs(BaseModel):
+    ou_dn: str
+
+
+# the body of the single endpoint is the arguments of each operation
+OPERATION_ARGS = {
+    BatchOp.create_user: AddUser,
+    BatchOp.modify_user: UserReconcile,
+    BatchOp.delete_user: UsernameArgs,
+    BatchOp.update_user_password: UpdateUserPassword,
+    BatchOp.move_user_ou: MoveUserOU,
+    BatchOp.add_group: AddGroup,
+    BatchOp.delete_group: GroupnameArgs,
+    BatchOp.add_users_to_group: GroupUsersManage,
+    BatchOp.remove_users_from_group: GroupUsersManage,
+    BatchOp.set_group_members: GroupUsersManage,
+    BatchOp.create_organization_unit: AddOrganizationUnit,
+    BatchOp.delete_organization_unit: OrganizationUnitArgs,
+}
+
+
+class BatchOperation(BaseModel):
+    op: BatchOp
+    args: Any = Field(default_factory=dict, example={"username": "jdoe"})
+
+    @validator("args", always=True)
+    def parse_args(cls, v, values):
+        if "op" not in values:
+            return v
+        return OPERATION_ARGS[values["op"]].parse_obj(v)
+
+
+class BatchRequest(BaseModel):
+    mode: BatchMode = BatchMode.atomic
+    operations: List[BatchOperation]
+
+
+class BatchOperationResult(BaseModel):
+    index: int
+    op: BatchOp
+    status: str
+    error: Optional[str] = None
+    # what the operation reports, e.g. the counts of set_group_members
+    result: Optional[Dict[str, Any]] = None
+
+
+class BatchReport(BaseModel):
+    mode: BatchMode
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    rolled_back: int = 0
+    not_rolled_back: int = 0
+    results: List[BatchOperationResult] = []
+
+    @classmethod
+    def from_results(
+        cls, mode: BatchMode, results: List[BatchOperationResult]
+    ) -> "BatchReport":
+        report = cls(mode=mode, total=len(results), results=results)
+        for result in results:
+            setattr(report, result.status, getattr(report, result.status) + 1)
+        return report
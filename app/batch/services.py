@@ -0,0 +1,88 @@
+from typing import Callable, Dict
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.config.settings import BATCH_MAX_OPERATIONS
+from app.core.samba import PASSTHROUGH_ERRORS, SambaClient
+
+from .schemas import (
+    BatchMode,
+    BatchOp,
+    BatchOperationResult,
+    BatchReport,
+    BatchRequest,
+)
+
+
+def _create_user(args) -> dict:
+    return {
+        "user_data": args.to_user_request(),
+        "userAccountControl": (
+            int(args.userAccountControl) if args.userAccountControl else None
+        ),
+        "pwdLastSet": None,
+        "accountExpires": None,
+    }
+
+
+def _modify_user(args) -> dict:
+    # the read back after the modify is not needed here
+    return dict(args.to_request(), username=args.username, attrs=["dn"])
+
+
+def _group_members(args) -> dict:
+    return {"groupname": args.groupname, "members": args.members}
+
+
+# operation -> kwargs of the SambaClient method of the same name
+CALL_KWARGS: Dict[BatchOp, Callable[..., dict]] = {
+    BatchOp.create_user: _create_user,
+    BatchOp.modify_user: _modify_user,
+    BatchOp.delete_user: lambda args: {"username": args.username},
+    BatchOp.update_user_password: lambda args: {
+        "username": args.username,
+        "new_password": args.password,
+    },
+    BatchOp.move_user_ou: lambda args: {"from_ou": args.from_ou, "to_ou": args.to_ou},
+    BatchOp.add_group: lambda args: {"group_request": args.to_request()},
+    BatchOp.delete_group: lambda args: {"groupname": args.groupname},
+    BatchOp.add_users_to_group: _group_members,
+    BatchOp.remove_users_from_group: _group_members,
+    BatchOp.set_group_members: _group_members,
+    BatchOp.create_organization_unit: lambda args: args.to_request(),
+    BatchOp.delete_organization_unit: lambda args: {"ou_dn": args.ou_dn},
+}
+
+
+class BatchService(object):
+    async def run_batch(self, current_user: dict, batch: BatchRequest) -> BatchReport:
+        if len(batch.operations) > BATCH_MAX_OPERATIONS:
+            raise HTTPException(
+                400, f"at most {BATCH_MAX_OPERATIONS} operations per batch."
+            )
+        calls = [
+            (operation.op.value, CALL_KWARGS[operation.op](operation.args))
+            for operation in batch.operations
+        ]
+        # one token check and one bind for the whole batch
+        client = SambaClient(**current_user)
+        try:
+            # up to BATCH_MAX_OPERATIONS writes, kept off the event loop
+            rows = await run_in_threadpool(
+                client.run_batch, calls, batch.mode == BatchMode.atomic
+            )
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        return BatchReport.from_results(
+            batch.mode,
+            [
+                BatchOperationResult(index=i, op=operation.op, **row)
+                for i, (operation, row) in enumerate(zip(batch.operations, rows))
+            ],
+        )
+
+
+manager = BatchService()
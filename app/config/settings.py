@@ -21,6 +21,38 @@ if SECRET_SALT and len(SECRET_SALT) != 16:
 SAMBA_HOST = os.getenv("SAMBA_HOST")
 if not SAMBA_HOST:
     raise RuntimeError("SAMBA_HOST cant be empty.")
+# comma separated list of DC urls, reads are balanced across all of them
+SAMBA_HOSTS = [h.strip() for h in SAMBA_HOST.split(",") if h.strip()]
+SAMBA_WRITE_HOST = os.getenv("SAMBA_WRITE_HOST", SAMBA_HOSTS[0])
+if SAMBA_WRITE_HOST not in SAMBA_HOSTS:
+    SAMBA_HOSTS.insert(0, SAMBA_WRITE_HOST)
+SAMBA_READ_STRATEGY = os.getenv("SAMBA_READ_STRATEGY", "round_robin")
+if SAMBA_READ_STRATEGY not in ("round_robin", "least_latency"):
+    raise RuntimeError("SAMBA_READ_STRATEGY must be `round_robin` or `least_latency`")
+SAMBA_READ_YOUR_WRITES_SECONDS = int(os.getenv("SAMBA_READ_YOUR_WRITES_SECONDS", 0))
+SAMBA_DC_RETRY_SECONDS = int(os.getenv("SAMBA_DC_RETRY_SECONDS", 30))
+SAMBA_BREAKER_FAILURES = int(os.getenv("SAMBA_BREAKER_FAILURES", 3))
+SAMBA_READ_RETRIES = int(os.getenv("SAMBA_READ_RETRIES", 2))
+SAMBA_RETRY_BACKOFF = float(os.getenv("SAMBA_RETRY_BACKOFF", 0.1))
+# path of the DC's own sam.ldb; when set, reads skip LDAP and open it directly
+SAMBA_LOCAL_SAM_PATH = os.getenv("SAMBA_LOCAL_SAM_PATH", "")
+SAMBA_LOCAL_AUTH_TTL = int(os.getenv("SAMBA_LOCAL_AUTH_TTL", 300))
+SAMBA_PAGE_SIZE = int(os.getenv("SAMBA_PAGE_SIZE", 500))
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 100))
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", 1000))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 1000))
+OU_TREE_CACHE_SIZE = int(os.getenv("OU_TREE_CACHE_SIZE", 64))
+# the user list hides accounts once they expire, so its ETags expire as well
+USER_LIST_ETAG_SECONDS = int(os.getenv("USER_LIST_ETAG_SECONDS", 60))
+if USER_LIST_ETAG_SECONDS < 1:
+    raise RuntimeError("USER_LIST_ETAG_SECONDS must be at least 1")
+TYPEAHEAD_CACHE_SIZE = int(os.getenv("TYPEAHEAD_CACHE_SIZE", 16))
+# how long typeahead answers from its index before checking the DC for changes
+TYPEAHEAD_REFRESH_SECONDS = float(os.getenv("TYPEAHEAD_REFRESH_SECONDS", 5))
+# requests in flight against the directory per worker, and the wait queues
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", 16))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 5))
 BASE_PREFIX = os.environ.get("URL_HOST_PATH_PREFIX", "/")
 if BASE_PREFIX and not BASE_PREFIX.endswith("/"):
     raise RuntimeError("URL_HOST_PATH_PREFIX must be endswith `/`, like `app/`")
@@ -33,3 +65,58 @@ STATIC_URL = f"{BASE_PREFIX}static/"
 
 ACCESS_TOKEN_EXPIRE_SECONDS = int(os.getenv("ACCESS_TOKEN_EXPIRE_SECONDS", 300))
 REFRESH_TOKEN_EXPIRE_SECONDS = int(os.getenv("REFRESH_TOKEN_EXPIRE_SECONDS", 86400))
+
+# account of the change feed watcher and of the service bind mode,
+# the feed is disabled without it
+SAMBA_SERVICE_USERNAME = os.getenv("SAMBA_SERVICE_USERNAME", "")
+SAMBA_SERVICE_PASSWORD = os.getenv("SAMBA_SERVICE_PASSWORD", "")
+# `user` binds every request as its caller; `service` binds a pool of service
+# account connections and checks the rights of the caller by group here
+SAMBA_BIND_MODE = os.getenv("SAMBA_BIND_MODE", "user")
+if SAMBA_BIND_MODE not in ("user", "service"):
+    raise RuntimeError("SAMBA_BIND_MODE must be `user` or `service`")
+if SAMBA_BIND_MODE == "service" and not SAMBA_SERVICE_USERNAME:
+    raise RuntimeError("SAMBA_BIND_MODE `service` needs SAMBA_SERVICE_USERNAME")
+# idle pooled connections kept per DC, and for how long
+SAMBA_POOL_SIZE = int(os.getenv("SAMBA_POOL_SIZE", 4))
+SAMBA_POOL_IDLE_SECONDS = float(os.getenv("SAMBA_POOL_IDLE_SECONDS", 60))
+# in service mode readers see everything the service account can read, e.g.
+# confidential attributes through /search/, so who reads is chosen explicitly
+AUTHZ_READ_GROUPS = [
+    g.strip() for g in os.getenv("AUTHZ_READ_GROUPS", "").split(",") if g.strip()
+]
+if SAMBA_BIND_MODE == "service" and not AUTHZ_READ_GROUPS:
+    raise RuntimeError("SAMBA_BIND_MODE `service` needs AUTHZ_READ_GROUPS")
+AUTHZ_WRITE_GROUPS = [
+    g.strip()
+    for g in os.getenv("AUTHZ_WRITE_GROUPS", "Domain Admins").split(",")
+    if g.strip()
+]
+FEED_ALLOWED_GROUP = os.getenv("FEED_ALLOWED_GROUP", "Domain Admins")
+FEED_POLL_SECONDS = float(os.getenv("FEED_POLL_SECONDS", 2))
+FEED_BACKLOG_SIZE = int(os.getenv("FEED_BACKLOG_SIZE", 10000))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", 1000))
+FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", 15))
+
+SYSVOL_PATH = os.getenv("SAMBA_SYSVOL_PATH", "/var/lib/samba/sysvol")
+
+# requests sent with `X-Profile: <PROFILE_TOKEN>` are profiled, empty disables it
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+# profiles kept in PROFILE_DIR, the oldest go first
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 100))
+if PROFILE_KEEP < 1:
+    raise RuntimeError("PROFILE_KEEP must be at least 1")
+
+# LMDB file shared by the gunicorn workers of this host, empty disables it;
+# it holds pickles, so its directory must be private to the API's user
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH", os.path.join(BASE_DIR, "run", "shared_cache.lmdb")
+)
+SHARED_CACHE_SIZE_MB = int(os.getenv("SHARED_CACHE_SIZE_MB", 256))
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(BASE_DIR, "jobs.sqlite3"))
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", 2))
+# finished jobs are deleted this many days after they ended
+JOBS_KEEP_DAYS = float(os.getenv("JOBS_KEEP_DAYS", 7))
@@ -0,0 +1,166 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config.settings import (
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+    API_V1_STR,
+)
+
+__all__ = ("AdmissionController", "AdmissionMiddleware", "Overloaded", "admission")
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# paths below API_V1_STR; the first matching prefix wins, the rest is NORMAL
+ROUTE_PRIORITIES = (
+    ("/user/token_auth/", HIGH),
+    ("/user/refresh_token/", HIGH),
+    ("/user/me/", HIGH),
+    ("/user/list_users/", LOW),
+    ("/user/import_users/", LOW),
+    ("/user/reconcile_users/", LOW),
+    ("/user/delta/", LOW),
+    ("/group/list/", LOW),
+    ("/group/users_by_group/", LOW),
+    ("/group/delta/", LOW),
+    ("/org/list/", LOW),
+    ("/org/tree/", LOW),
+    ("/org/delta/", LOW),
+    # the GPO list is the router root, so every other GPO route goes first
+    ("/gpo/detail/", NORMAL),
+    ("/gpo/", LOW),
+    ("/search/", LOW),
+    ("/export/", LOW),
+    ("/batch/", LOW),
+    ("/jobs/", LOW),
+)
+
+# long lived streams which would hold a slot for their whole life
+EXEMPT_ROUTES = ("/feed/changes/",)
+
+# weight of the newest sample in the service time moving average
+SERVICE_TIME_ALPHA = 0.2
+
+
+def route_priority(path: str) -> int:
+    for prefix, priority in ROUTE_PRIORITIES:
+        if path.startswith(prefix):
+            return priority
+    return NORMAL
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController(object):
+    """Bounds the requests a worker runs against the directory at once.
+
+    Up to `max_concurrency` requests run; the rest wait in one bounded FIFO
+    per priority and a freed slot goes to the oldest waiter of the highest
+    priority. A request is shed with `Overloaded` when its queue is full or
+    it waited longer than `queue_timeout` seconds.
+    """
+
+    def __init__(self, max_concurrency: int, queue_size: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._queues: List[Deque[asyncio.Future]] = [
+            deque() for _ in (HIGH, NORMAL, LOW)
+        ]
+        self._service_time = 0.1
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues)
+
+    def retry_after(self) -> int:
+        """Rough time until the current backlog drains."""
+        backlog = self.queued + self._active
+        return max(1, math.ceil(self._service_time * backlog / self.max_concurrency))
+
+    async def acquire(self, priority: int):
+        if self._active < self.max_concurrency and not self.queued:
+            self._active += 1
+            return
+        queue = self._queues[priority]
+        if len(queue) >= self.queue_size:
+            raise Overloaded("too many requests queued", self.retry_after())
+        waiter = asyncio.get_event_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as we gave up
+                self.release()
+            elif waiter in queue:
+                queue.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded("request timed out in queue", self.retry_after())
+            raise
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            self._service_time = (
+                SERVICE_TIME_ALPHA * service_time
+                + (1 - SERVICE_TIME_ALPHA) * self._service_time
+            )
+        for queue in self._queues:
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    # hand the slot over, the active count stays the same
+                    waiter.set_result(None)
+                    return
+        self._active -= 1
+
+
+class AdmissionMiddleware(object):
+    def __init__(self, app: ASGIApp, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        path = scope.get("path", "")
+        route = path[len(API_V1_STR) :]
+        if (
+            scope["type"] != "http"
+            or not path.startswith(API_V1_STR)
+            or route.startswith(EXEMPT_ROUTES)
+        ):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.controller.acquire(route_priority(route))
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": str(e)},
+                status_code=503,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - started)
+
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT
+)
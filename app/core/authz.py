@@ -0,0 +1,35 @@
+from typing import Dict, List
+
+from app.config.settings import AUTHZ_READ_GROUPS, AUTHZ_WRITE_GROUPS
+
+__all__ = ("READ", "WRITE", "Authorizer", "authorizer")
+
+READ = "read"
+WRITE = "write"
+
+
+class Authorizer(object):
+    """Rights of a user from its groups, for the service bind mode.
+
+    The directory ACLs only see the service account then, so the API grants
+    each permission to the members of its groups, nested ones included.
+    Rights are resolved when a token is issued or refreshed and travel in
+    it, so they are cached for the session and follow group changes at the
+    next refresh.
+    """
+
+    def __init__(self, policies: Dict[str, List[str]]):
+        self.policies = policies
+
+    def permissions(self, client, username: str) -> List[str]:
+        granted = {
+            permission
+            for permission, groups in self.policies.items()
+            if any(client.is_member_of(username, group) for group in groups)
+        }
+        if WRITE in granted:
+            granted.add(READ)
+        return sorted(granted)
+
+
+authorizer = Authorizer({READ: AUTHZ_READ_GROUPS, WRITE: AUTHZ_WRITE_GROUPS})
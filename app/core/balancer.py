@@ -0,0 +1,154 @@
+import itertools
+import threading
+import time
+from hashlib import sha1
+from typing import Dict, List, Optional
+
+from app.config.settings import (
+    SAMBA_BREAKER_FAILURES,
+    SAMBA_DC_RETRY_SECONDS,
+    SAMBA_HOSTS,
+    SAMBA_READ_STRATEGY,
+    SAMBA_READ_YOUR_WRITES_SECONDS,
+    SAMBA_WRITE_HOST,
+)
+
+from .breaker import CircuitBreaker
+
+__all__ = ("DCBalancer", "balancer", "dc_tag")
+
+# weight of the newest sample in the bind latency moving average
+LATENCY_ALPHA = 0.3
+
+
+def dc_tag(url: str) -> str:
+    """Short stable id of a DC, embedded in ETags since USNs are per DC."""
+    return sha1(url.encode()).hexdigest()[:8]
+
+
+class _DCState(object):
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.tag = dc_tag(url)
+        self.latency: Optional[float] = None
+        self.breaker = breaker
+
+    @property
+    def healthy(self) -> bool:
+        return self.breaker.available
+
+
+class DCBalancer(object):
+    """Chooses the DC for reads and writes of a SambaClient.
+
+    Writes always go to the preferred write DC. Reads are spread over the
+    healthy DCs either round robin or by the lowest bind latency seen so far.
+    Each DC has a circuit breaker: after `failure_threshold` connection
+    failures it is skipped for `retry_seconds`, then probed again. With
+    `sticky_seconds` a session which just wrote reads from the write DC for
+    that long, so it sees its own changes before replication catches up.
+    """
+
+    def __init__(
+        self,
+        hosts: List[str],
+        write_host: str,
+        strategy: str,
+        sticky_seconds: int = 0,
+        retry_seconds: int = 30,
+        failure_threshold: int = 3,
+    ):
+        self._dcs: Dict[str, _DCState] = {
+            url: _DCState(url, CircuitBreaker(failure_threshold, retry_seconds))
+            for url in hosts
+        }
+        self.write_host = write_host
+        self.strategy = strategy
+        self.sticky_seconds = sticky_seconds
+        self._counter = itertools.count()
+        self._writes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def host_for_tag(self, tag: str) -> Optional[str]:
+        for dc in self._dcs.values():
+            if dc.tag == tag:
+                return dc.url
+        return None
+
+    def _ordered(self) -> List[_DCState]:
+        dcs = list(self._dcs.values())
+        if self.strategy == "least_latency":
+            # unmeasured DCs first so every DC gets a latency sample
+            return sorted(
+                dcs, key=lambda dc: -1.0 if dc.latency is None else dc.latency
+            )
+        start = next(self._counter) % len(dcs)
+        return dcs[start:] + dcs[:start]
+
+    def read_hosts(self, session: Optional[str] = None) -> List[str]:
+        """DC urls to try for reads, best candidate first."""
+        ordered = self._ordered()
+        if session and self._is_sticky(session):
+            ordered.sort(key=lambda dc: dc.url != self.write_host)
+        healthy = [dc.url for dc in ordered if dc.healthy]
+        unhealthy = [dc.url for dc in ordered if not dc.healthy]
+        return healthy + unhealthy
+
+    def _is_sticky(self, session: str) -> bool:
+        if not self.sticky_seconds:
+            return False
+        with self._lock:
+            wrote_at = self._writes.get(session)
+        return (
+            wrote_at is not None and time.monotonic() - wrote_at < self.sticky_seconds
+        )
+
+    def mark_write(self, session: str):
+        if not self.sticky_seconds:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._writes[session] = now
+            if len(self._writes) > 10000:
+                expired = now - self.sticky_seconds
+                self._writes = {s: t for s, t in self._writes.items() if t > expired}
+
+    def has_other_healthy(self, url: str) -> bool:
+        """Whether a read failing on `url` has a healthy DC to fail over to."""
+        return any(dc.healthy for dc in self._dcs.values() if dc.url != url)
+
+    def allow(self, url: str) -> bool:
+        dc = self._dcs.get(url)
+        return dc is None or dc.breaker.allow()
+
+    def retry_after(self) -> int:
+        """Seconds until the first open breaker lets a probe through."""
+        waits = [dc.breaker.retry_after for dc in self._dcs.values()]
+        return max(1, int(min(waits)) + 1) if waits else 1
+
+    def record_success(self, url: str, latency: Optional[float] = None):
+        dc = self._dcs.get(url)
+        if dc is None:
+            return
+        dc.breaker.record_success()
+        if latency is None:
+            return
+        if dc.latency is None:
+            dc.latency = latency
+        else:
+            dc.latency = LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * dc.latency
+
+    def record_failure(self, url: str):
+        dc = self._dcs.get(url)
+        if dc is not None:
+            dc.breaker.record_failure()
+
+
+balancer = DCBalancer(
+    SAMBA_HOSTS,
+    SAMBA_WRITE_HOST,
+    SAMBA_READ_STRATEGY,
+    sticky_seconds=SAMBA_READ_YOUR_WRITES_SECONDS,
+    retry_seconds=SAMBA_DC_RETRY_SECONDS,
+    failure_threshold=SAMBA_BREAKER_FAILURES,
+)
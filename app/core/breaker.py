@@ -0,0 +1,66 @@
+import threading
+import time
+
+__all__ = ("CircuitBreaker",)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker(object):
+    """Stops traffic to a DC after repeated connection failures.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    `allow()` fails fast for `reset_timeout` seconds. Then a single probe is
+    let through; its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    @property
+    def available(self) -> bool:
+        return self.state != OPEN or self.retry_after == 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now < self._opened_at + self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probe_started_at = now
+                return True
+            # half open: one probe at a time, unless the probe got lost
+            if now - self._probe_started_at >= self.reset_timeout:
+                self._probe_started_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
@@ -0,0 +1,32 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+__all__ = ("LRUCache",)
+
+
+class LRUCache(object):
+    """Thread safe mapping which drops the least recently used entries."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._items.pop(key, None)
@@ -0,0 +1,99 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import ldb
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+__all__ = ("DeltaQuery", "Tombstone", "delta_query", "check_delta_dc", "read_delta")
+
+
+class Tombstone(BaseModel):
+    """An object which left the list: deleted, or no longer matching it."""
+
+    objectGUID: str
+    dn: str
+    name: Optional[str] = None
+    sAMAccountName: Optional[str] = None
+    isDeleted: bool
+    lastKnownParent: Optional[str] = None
+    uSNChanged: Optional[str] = None
+
+    @classmethod
+    def from_samba_message(cls, entry: ldb.Message) -> "Tombstone":
+        guid = entry.get("objectGUID", idx=0)
+        if isinstance(guid, bytes) and len(guid) == 16:
+            guid = uuid.UUID(bytes_le=guid)
+        return cls(
+            objectGUID=str(guid),
+            dn=str(entry.dn),
+            name=entry.get("name", idx=0),
+            sAMAccountName=entry.get("sAMAccountName", idx=0),
+            isDeleted=str(entry.get("isDeleted", idx=0)).upper() == "TRUE",
+            lastKnownParent=entry.get("lastKnownParent", idx=0),
+            uSNChanged=entry.get("uSNChanged", idx=0),
+        )
+
+
+class DeltaQuery(object):
+    """Where an incremental sync left off: a USN on a DC, or a time.
+
+    USNs are per DC, so `since_usn` comes with the `dc` which issued it.
+    Without either bound the delta is the full list, which is how a sync
+    client starts.
+    """
+
+    def __init__(
+        self,
+        since_usn: Optional[int] = None,
+        since_time: Optional[datetime] = None,
+        dc: Optional[str] = None,
+    ):
+        self.since_usn = since_usn
+        self.since_time = since_time
+        self.dc = dc
+
+    @property
+    def active(self) -> bool:
+        return self.since_usn is not None or self.since_time is not None
+
+
+def delta_query(
+    since_usn: Optional[int] = Query(None, ge=0),
+    since_time: Optional[datetime] = None,
+    dc: Optional[str] = Query(None, regex=r"^[0-9a-f]{8}$"),
+) -> DeltaQuery:
+    if since_usn is not None and dc is None:
+        raise HTTPException(400, "`since_usn` needs the `dc` it was issued by.")
+    return DeltaQuery(since_usn=since_usn, since_time=since_time, dc=dc)
+
+
+def read_delta(
+    client,
+    delta: DeltaQuery,
+    object_filter: str,
+    list_filter: str,
+    attrs: List[str],
+    expiring: bool = False,
+) -> Tuple[str, int, List[ldb.Message], List[ldb.Message]]:
+    """Return `(dc, high-water mark, changed entries, removed entries)`."""
+    if delta.dc:
+        client.pin_reader(delta.dc)
+    usn, changed, removed = client.delta_search(
+        object_filter,
+        list_filter,
+        attrs,
+        since_usn=delta.since_usn,
+        since_time=delta.since_time,
+        expiring=expiring,
+    )
+    return client.read_dc, usn, changed, removed
+
+
+def check_delta_dc(delta: DeltaQuery, dc: str):
+    """The delta must come from the DC of the cursor, USNs mean nothing elsewhere."""
+    if delta.since_usn is not None and dc != delta.dc:
+        raise HTTPException(
+            409, f"dc `{delta.dc}` is unavailable, resync without `since_usn`."
+        )
@@ -0,0 +1,131 @@
+import threading
+import uuid
+from base64 import b64encode
+from typing import Any, Callable, Collection, Dict, Optional
+
+import ldb
+from samba import dsdb  # type: ignore
+from samba.dcerpc import security
+from samba.ndr import ndr_unpack
+
+__all__ = ("DomainInfo", "DirectoryRegistry", "registry")
+
+Decoder = Callable[[bytes], Any]
+
+
+def _text(value: bytes) -> str:
+    return value.decode("utf-8", errors="replace")
+
+
+def _integer(value: bytes) -> int:
+    # also NT times and intervals, 100ns units since 1601 as clients expect
+    return int(value)
+
+
+def _guid(value: bytes) -> str:
+    return str(uuid.UUID(bytes_le=value))
+
+
+def _sid(value: bytes) -> str:
+    return str(ndr_unpack(security.dom_sid, value))
+
+
+def _octets(value: bytes) -> str:
+    return b64encode(value).decode()
+
+
+# attributeSyntax -> decoder, anything not listed is text
+SYNTAX_DECODERS: Dict[str, Decoder] = {
+    "2.5.5.9": _integer,
+    "2.5.5.10": _octets,
+    "2.5.5.15": _octets,
+    "2.5.5.16": _integer,
+    "2.5.5.17": _sid,
+}
+
+# decoders known without the schema, for entries decoded before it is loaded
+WELL_KNOWN_DECODERS: Dict[str, Decoder] = {
+    "objectguid": _guid,
+    "objectsid": _sid,
+    "usnchanged": _integer,
+    "usncreated": _integer,
+}
+
+
+def _decoder_for(name: str, syntax: str) -> Decoder:
+    if syntax == "2.5.5.10" and name.lower().endswith("guid"):
+        # GUIDs are plain octet strings in the schema
+        return _guid
+    return SYNTAX_DECODERS.get(syntax, _text)
+
+
+class DomainInfo(object):
+    """Constants of the domain, the same on every DC and for every user."""
+
+    def __init__(self, domain_dn: str, users_dn: str, dns_domain: str):
+        self.domain_dn = domain_dn
+        self.users_dn = users_dn
+        self.dns_domain = dns_domain
+
+
+class DirectoryRegistry(object):
+    """Per process cache of the domain constants and the attribute schema.
+
+    Loaded from the first client which asks, then every attribute has its
+    decoder picked once from its schema syntax, so decoding an entry is a
+    single pass of dictionary lookups instead of guessing per value.
+    """
+
+    def __init__(self):
+        self.domain: Optional[DomainInfo] = None
+        self._decoders: Dict[str, Decoder] = dict(WELL_KNOWN_DECODERS)
+        self._lock = threading.Lock()
+
+    def load(self, samdb, paged_search: Callable) -> DomainInfo:
+        """Read the constants and the schema of `samdb`, once per process."""
+        if self.domain is not None:
+            return self.domain
+        with self._lock:
+            if self.domain is None:
+                decoders = dict(WELL_KNOWN_DECODERS)
+                for entry in paged_search(
+                    "(objectClass=attributeSchema)",
+                    ["lDAPDisplayName", "attributeSyntax"],
+                    base=str(samdb.get_schema_basedn()),
+                    scope=ldb.SCOPE_ONELEVEL,
+                ):
+                    name = str(entry.get("lDAPDisplayName", idx=0))
+                    syntax = str(entry.get("attributeSyntax", idx=0))
+                    decoders.setdefault(name.lower(), _decoder_for(name, syntax))
+                domain_dn = samdb.domain_dn()
+                self._decoders = decoders
+                self.domain = DomainInfo(
+                    str(domain_dn),
+                    str(
+                        samdb.get_wellknown_dn(
+                            samdb.get_default_basedn(), dsdb.DS_GUID_USERS_CONTAINER
+                        )
+                    ),
+                    ldb.Dn(samdb, str(domain_dn)).canonical_str().replace("/", ""),
+                )
+        return self.domain
+
+    def decode_entry(
+        self, entry: ldb.Message, list_attrs: Collection[str] = ()
+    ) -> Dict[str, Any]:
+        """Decode every attribute of `entry`, the first value unless listed."""
+        decoders = self._decoders
+        obj: Dict[str, Any] = {"dn": str(entry.dn)}
+        for name in entry.keys():
+            if name == "dn":
+                continue
+            decode = decoders.get(name.lower(), _text)
+            values = entry[name]
+            if name in list_attrs:
+                obj[name] = [decode(v) for v in values]
+            elif len(values):
+                obj[name] = decode(values[0])
+        return obj
+
+
+registry = DirectoryRegistry()
@@ -0,0 +1,111 @@
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from hashlib import sha1
+from typing import List, Optional, Tuple
+
+import ldb
+
+from .samba import SambaClientError
+
+__all__ = (
+    "NotModified",
+    "make_etag",
+    "parse_etag",
+    "list_etag",
+    "time_bucket",
+    "check_list_not_modified",
+    "check_object_not_modified",
+)
+
+
+def make_etag(dn: str, usn, dc: str) -> str:
+    """ETag of a single directory object: its `uSNChanged` on DC `dc` and its DN."""
+    token = urlsafe_b64encode(dn.encode()).decode().rstrip("=")
+    return f'"{usn}.{dc}.{token}"'
+
+
+def parse_etag(etag: str) -> Optional[Tuple[str, str, str]]:
+    """Return the `(dn, uSNChanged, dc)` encoded by `make_etag` or None."""
+    value = etag.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    parts = value.split(".", 2)
+    if len(parts) != 3 or not parts[0].isdigit():
+        return None
+    usn, dc, token = parts
+    try:
+        dn = urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    except ValueError:
+        return None
+    if not dn:
+        return None
+    return dn, usn, dc
+
+
+class NotModified(Exception):
+    """Raised when `If-None-Match` still matches; rendered as an empty 304."""
+
+    def __init__(self, etag: str):
+        super().__init__(etag)
+        self.etag = etag
+
+
+def _candidates(if_none_match: str) -> List[str]:
+    candidates = []
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate:
+            candidates.append(candidate)
+    return candidates
+
+
+def list_etag(server: str, usn, *query) -> str:
+    """ETag of a list response: the DC's `highestCommittedUSN` plus the query."""
+    digest = sha1(repr((server,) + query).encode()).hexdigest()[:16]
+    return f'"{usn}-{digest}"'
+
+
+def time_bucket(seconds: int) -> int:
+    """Changes every `seconds`, for lists which depend on the clock as well."""
+    return int(time.time() // seconds)
+
+
+def check_list_not_modified(if_none_match: Optional[str], etag: str):
+    if if_none_match and etag in _candidates(if_none_match):
+        raise NotModified(etag)
+
+
+def check_object_not_modified(
+    client, if_none_match: Optional[str], name_attr: str, name: str
+):
+    """Compare `If-None-Match` with the object through a base read of `uSNChanged`.
+
+    USNs are per DC, so each ETag is checked on the DC which issued it. When
+    that check fails for any reason the object is just re-read.
+    """
+    if not if_none_match:
+        return
+    for candidate in _candidates(if_none_match):
+        parsed = parse_etag(candidate)
+        if not parsed:
+            continue
+        dn, usn, dc = parsed
+        host = client.host_for_tag(dc)
+        if host is None:
+            continue
+        try:
+            current = client.get_object_by_dn(
+                dn, [name_attr, "uSNChanged"], samdb=client.connection(host)
+            )
+        except (ldb.LdbError, SambaClientError):
+            return
+        if (
+            current
+            and str(current.get(name_attr, idx=0)).lower() == name.lower()
+            and str(current.get("uSNChanged", idx=0)) == usn
+        ):
+            raise NotModified(make_etag(dn, usn, dc))
+        return
@@ -0,0 +1,144 @@
+import hmac
+import os
+import threading
+import time
+from hashlib import sha256
+from typing import Dict, Optional, Tuple
+
+import ldb
+from samba import dsdb  # type: ignore
+from samba.auth import (  # type: ignore
+    AUTH_SESSION_INFO_AUTHENTICATED,
+    AUTH_SESSION_INFO_DEFAULT_GROUPS,
+    AUTH_SESSION_INFO_SIMPLE_PRIVILEGES,
+    system_session,
+    user_session,
+)
+from samba.param import LoadParm
+from samba.samdb import SamDB
+
+from app.config.settings import SAMBA_LOCAL_AUTH_TTL, SAMBA_LOCAL_SAM_PATH
+
+__all__ = ("LocalSam", "local_sam")
+
+SESSION_INFO_FLAGS = (
+    AUTH_SESSION_INFO_DEFAULT_GROUPS
+    | AUTH_SESSION_INFO_AUTHENTICATED
+    | AUTH_SESSION_INFO_SIMPLE_PRIVILEGES
+)
+
+# account states in which a bind as the user is refused
+REFUSED_UAC = dsdb.UF_ACCOUNTDISABLE | dsdb.UF_LOCKOUT | dsdb.UF_PASSWORD_EXPIRED
+NEVER_EXPIRES = (0, 0x7FFFFFFFFFFFFFFF)
+
+
+class LocalSam(object):
+    """Direct access to the sam.ldb of the DC this API runs on.
+
+    Reads go straight to the tdb/mdb database instead of through LDAP
+    encoding, a bind and the network stack. The database does not check
+    passwords, so a user's password is verified with one LDAP bind and then
+    remembered for `auth_ttl` seconds, together with its `pwdLastSet`. A
+    remembered password only counts while the account may still sign in
+    and `pwdLastSet` is unchanged. Handles are opened with the user's own
+    session so the directory ACLs still apply.
+    """
+
+    def __init__(self, path: str, auth_ttl: int):
+        self.path = path
+        self.auth_ttl = auth_ttl
+        self._key = os.urandom(32)
+        self._verified: Dict[str, Tuple[bytes, str, float]] = {}
+        self._system: Optional[SamDB] = None
+        self._lock = threading.Lock()
+
+    def _digest(self, password: str) -> bytes:
+        return hmac.new(self._key, password.encode(), sha256).digest()
+
+    def is_verified(self, username: str, password: str) -> bool:
+        with self._lock:
+            entry = self._verified.get(username)
+        if entry is None or entry[2] < time.monotonic():
+            return False
+        if not hmac.compare_digest(entry[0], self._digest(password)):
+            return False
+        return self.sign_in_state(username) == entry[1]
+
+    def remember(self, username: str, password: str, pwd_last_set: str):
+        """Remember a password a bind accepted, read `pwd_last_set` before it."""
+        now = time.monotonic()
+        with self._lock:
+            self._verified[username] = (
+                self._digest(password),
+                pwd_last_set,
+                now + self.auth_ttl,
+            )
+            if len(self._verified) > 10000:
+                self._verified = {u: e for u, e in self._verified.items() if e[2] > now}
+
+    def sign_in_state(self, username: str) -> Optional[str]:
+        """`pwdLastSet` of `username` while the account may sign in.
+
+        None once it is disabled, locked out, expired or gone, or when
+        sam.ldb cannot be read.
+        """
+        try:
+            with self._lock:
+                system = self._system_db(LoadParm())
+                lookup = system.search(
+                    system.domain_dn(),
+                    scope=ldb.SCOPE_SUBTREE,
+                    expression=f"(sAMAccountName={ldb.binary_encode(username)})",
+                    attrs=[
+                        "userAccountControl",
+                        "msDS-User-Account-Control-Computed",
+                        "accountExpires",
+                        "pwdLastSet",
+                    ],
+                )
+                nttime = system.get_nttime()
+        except ldb.LdbError:
+            return None
+        if len(lookup) == 0:
+            return None
+        user = lookup[0]
+        uac = int(user.get("userAccountControl", idx=0) or 0)
+        # lockout and password expiry are only in the computed flags
+        uac |= int(user.get("msDS-User-Account-Control-Computed", idx=0) or 0)
+        expires = int(user.get("accountExpires", idx=0) or 0)
+        if uac & REFUSED_UAC or (expires not in NEVER_EXPIRES and expires < nttime):
+            return None
+        return str(user.get("pwdLastSet", idx=0) or 0)
+
+    def _system_db(self, lp: LoadParm) -> SamDB:
+        if self._system is None:
+            self._system = SamDB(url=self.path, session_info=system_session(), lp=lp)
+        return self._system
+
+    def open(self, username: str) -> SamDB:
+        """Open sam.ldb with the session of `username`."""
+        lp = LoadParm()
+        with self._lock:
+            system = self._system_db(lp)
+            lookup = system.search(
+                system.domain_dn(),
+                scope=ldb.SCOPE_SUBTREE,
+                expression=f"(sAMAccountName={ldb.binary_encode(username)})",
+                attrs=["dn"],
+            )
+            if len(lookup) == 0:
+                raise ldb.LdbError(ldb.ERR_NO_SUCH_OBJECT, f"no user `{username}`")
+            session = user_session(
+                system,
+                lp_ctx=lp,
+                dn=str(lookup[0].dn),
+                session_info_flags=SESSION_INFO_FLAGS,
+            )
+        return SamDB(url=self.path, session_info=session, lp=lp)
+
+
+local_sam = (
+    LocalSam(SAMBA_LOCAL_SAM_PATH, SAMBA_LOCAL_AUTH_TTL)
+    if SAMBA_LOCAL_SAM_PATH
+    else None
+)
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import ldb
+from samba.samdb import SamDB
+
+from app.config.settings import (
+    SAMBA_BIND_MODE,
+    SAMBA_POOL_IDLE_SECONDS,
+    SAMBA_POOL_SIZE,
+    SAMBA_SERVICE_PASSWORD,
+    SAMBA_SERVICE_USERNAME,
+)
+
+__all__ = ("ConnectionPool", "pool")
+
+
+class ConnectionPool(object):
+    """Idle connections bound as the service account, per DC, for every user.
+
+    A `SambaClient` in service bind mode takes its connections from here
+    instead of binding, and hands them back once it is garbage collected.
+    Connections a client dropped after an error never come back, idle ones
+    older than `idle_seconds` are let go, and the others are probed with a
+    rootDSE read before reuse since the DC may have closed them.
+    """
+
+    def __init__(self, username: str, password: str, size: int, idle_seconds: float):
+        self.username = username
+        self.password = password
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self._idle: Dict[str, Deque[Tuple[SamDB, float]]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str) -> Optional[SamDB]:
+        """A live idle connection to `url`, None to bind a new one."""
+        while True:
+            with self._lock:
+                idle = self._idle.get(url)
+                if not idle:
+                    return None
+                samdb, released_at = idle.pop()
+                if time.monotonic() - released_at >= self.idle_seconds:
+                    # the others were released even earlier
+                    idle.clear()
+                    return None
+            if self._alive(samdb):
+                return samdb
+
+    @staticmethod
+    def _alive(samdb: SamDB) -> bool:
+        # writes are not retried, so a dropped connection must not get there
+        try:
+            samdb.search("", scope=ldb.SCOPE_BASE, attrs=["dsServiceName"])
+        except Exception:
+            return False
+        return True
+
+    def release(self, connections: Dict[str, SamDB]):
+        now = time.monotonic()
+        with self._lock:
+            for url, samdb in connections.items():
+                idle = self._idle.setdefault(url, deque())
+                if len(idle) < self.size:
+                    idle.append((samdb, now))
+        connections.clear()
+
+
+# only in service bind mode
+pool = (
+    ConnectionPool(
+        SAMBA_SERVICE_USERNAME,
+        SAMBA_SERVICE_PASSWORD,
+        SAMBA_POOL_SIZE,
+        SAMBA_POOL_IDLE_SECONDS,
+    )
+    if SAMBA_BIND_MODE == "service"
+    else None
+)
@@ -0,0 +1,241 @@
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Dict, Tuple
+
+import samba
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.settings import (
+    PROFILE_DIR,
+    PROFILE_KEEP,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_TOKEN,
+)
+
+__all__ = ("StackSampler", "ProfilingMiddleware")
+
+Frame = Tuple[str, str]
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMBA_DIR = os.path.dirname(os.path.abspath(samba.__file__))
+# the python side of the ldb calls, most of the time in there is the DC
+LDAP_FILES = (
+    os.path.join(APP_DIR, "core", "samba.py"),
+    os.path.join(APP_DIR, "core", "localsam.py"),
+)
+DECODE_FUNCTIONS = {"from_samba_message", "decode_entry"}
+SERIALIZE_FUNCTIONS = {"serialize_response", "jsonable_encoder", "render"}
+# innermost frames of a thread with nothing to do
+IDLE_FILES = {"selectors.py", "threading.py", "queue.py", "thread.py"}
+
+ALLOCATION_LINES = 25
+# files written by `_write`, nothing else in PROFILE_DIR is pruned
+PROFILE_FILE = re.compile(r"[0-9a-f]{32}\.json")
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    """`(file, function)` pairs of a thread, outermost first."""
+    stack = []
+    while frame is not None:
+        stack.append((frame.f_code.co_filename, frame.f_code.co_name))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def phase(stack: Tuple[Frame, ...]) -> str:
+    """Where a sample went: `ldap`, `decode`, `serialize` or `other`.
+
+    The innermost frame which tells decides, so pydantic validating inside
+    `from_samba_message` is decoding and inside `serialize_response` it is
+    serialization.
+    """
+    for filename, function in reversed(stack):
+        if filename in LDAP_FILES or filename.startswith(SAMBA_DIR):
+            return "ldap"
+        if function in DECODE_FUNCTIONS:
+            return "decode"
+        if function in SERIALIZE_FUNCTIONS:
+            return "serialize"
+    return "other"
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks of every other thread each `interval` seconds.
+
+    Handlers run on the event loop and in the thread pool, so all threads
+    are sampled and idle ones are skipped. Other requests which run on the
+    worker at the same time show up too.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._done.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = _stack(frame)
+                if stack and os.path.basename(stack[-1][0]) not in IDLE_FILES:
+                    self.stacks[stack] += 1
+
+    def stop(self) -> Counter:
+        self._done.set()
+        self.join()
+        return self.stacks
+
+
+class ProfilingMiddleware(object):
+    """Profiles the requests sent with `X-Profile: <PROFILE_TOKEN>`.
+
+    The request gets a sampled CPU profile split into LDAP, decoding and
+    serialization time, plus the top allocations with `X-Profile-Memory: 1`.
+    The profile is written to `PROFILE_DIR` as `<id>.json`, the id is
+    returned in `X-Profile-Id`. One request per worker is profiled at a
+    time, the others run as usual.
+    """
+
+    def __init__(self, app: ASGIApp, token: str = PROFILE_TOKEN):
+        self.app = app
+        self.token = token
+        self._busy = False
+
+    def _wanted(self, scope: Scope) -> bool:
+        if not self.token or scope["type"] != "http" or self._busy:
+            return False
+        given = Headers(scope=scope).get("x-profile", "")
+        return hmac.compare_digest(given.encode(), self.token.encode())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        self._busy = True
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile_id
+            await send(message)
+
+        memory = Headers(scope=scope).get("x-profile-memory") == "1"
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        before = None
+        if memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        sampler = StackSampler(PROFILE_SAMPLE_INTERVAL)
+        sampler.start()
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.monotonic() - started
+            stacks = sampler.stop()
+            allocations = None
+            if before is not None:
+                allocations = self._allocations(before, tracemalloc.take_snapshot())
+            if tracing:
+                tracemalloc.stop()
+            self._busy = False
+            profile = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode(errors="replace"),
+                "status": status,
+                "duration": duration,
+                **self._summary(stacks),
+            }
+            if allocations is not None:
+                profile.update(allocations)
+            await run_in_threadpool(self._write, profile)
+
+    @staticmethod
+    def _summary(stacks: Counter) -> dict:
+        samples = sum(stacks.values())
+        phases: Dict[str, int] = Counter()
+        for stack, count in stacks.items():
+            phases[phase(stack)] += count
+        return {
+            "interval": PROFILE_SAMPLE_INTERVAL,
+            "samples": samples,
+            "phases": {
+                name: {
+                    "samples": count,
+                    "seconds": count * PROFILE_SAMPLE_INTERVAL,
+                    "share": round(count / samples, 4),
+                }
+                for name, count in phases.most_common()
+            },
+            # collapsed stacks, the input of flamegraph tools
+            "stacks": [
+                "%s %d"
+                % (";".join(f"{os.path.basename(f)}:{fn}" for f, fn in stack), count)
+                for stack, count in stacks.most_common()
+            ],
+        }
+
+    @staticmethod
+    def _allocations(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> dict:
+        # the snapshots themselves and the sampler are not the request's
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        stats = after.filter_traces(ignore).compare_to(
+            before.filter_traces(ignore), "lineno"
+        )
+        return {
+            "memory_peak": tracemalloc.get_traced_memory()[1],
+            # memory still held at the end of the request, per line
+            "allocations": [
+                {
+                    "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in stats[:ALLOCATION_LINES]
+            ],
+        }
+
+    @staticmethod
+    def _write(profile: dict):
+        os.makedirs(PROFILE_DIR, mode=0o700, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{profile['id']}.json"), "w") as f:
+            json.dump(profile, f, indent=1)
+        # other workers prune the same directory, files may vanish meanwhile
+        stamped = []
+        for name in os.listdir(PROFILE_DIR):
+            if not PROFILE_FILE.fullmatch(name):
+                continue
+            path = os.path.join(PROFILE_DIR, name)
+            try:
+                stamped.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+        stamped.sort()
+        for _, path in stamped[:-PROFILE_KEEP]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
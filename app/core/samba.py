@@ -1,8 +1,18 @@
-from typing import Optional, List
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple
+from base64 import b64encode
 from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from itertools import islice
+import asyncio
+import random
+import time
+import weakref
 
 import ldb
-from samba import dsdb  # type: ignore
+from samba import dsdb, unix2nttime  # type: ignore
+from samba.dcerpc import drsblobs  # type: ignore
+from samba.ndr import ndr_unpack  # type: ignore
 from samba.netcmd.gpo import get_gpo_info, attr_default, gpo_flags_string
 from samba.auth import system_session
 from samba.credentials import Credentials
@@ -11,68 +21,512 @@ from samba.samdb import SamDB
 
 from fastapi import HTTPException
 
-from app.config.settings import SAMBA_HOST
+from app.config.settings import (
+    SAMBA_PAGE_SIZE,
+    SAMBA_READ_RETRIES,
+    SAMBA_RETRY_BACKOFF,
+)
+
+from .authz import READ, WRITE
+from .balancer import balancer, dc_tag
+from .directory import DomainInfo, registry
+from .localsam import LocalSam, local_sam
+from .pool import pool
+
+
+SEARCH_SCOPES = {
+    "base": ldb.SCOPE_BASE,
+    "onelevel": ldb.SCOPE_ONELEVEL,
+    "subtree": ldb.SCOPE_SUBTREE,
+}
+GROUP_LIST_ATTRS = [
+    "sAMAccountName",
+    "groupType",
+    "description",
+    "mail",
+    "info",
+    "uSNChanged",
+]
+# what a tombstone still carries once the DC stripped it
+TOMBSTONE_ATTRS = [
+    "objectGUID",
+    "name",
+    "sAMAccountName",
+    "isDeleted",
+    "lastKnownParent",
+    "uSNChanged",
+]
+# sAMAccountNames resolved per search when setting group members
+MEMBER_LOOKUP_CHUNK = 200
+# write calls a failed atomic batch can undo, method -> kwargs of the undo call
+BATCH_UNDO = {
+    "create_user": lambda kw: (
+        "delete_user",
+        {"username": kw["user_data"]["username"]},
+    ),
+    "add_group": lambda kw: (
+        "delete_group",
+        {"groupname": kw["group_request"]["groupname"]},
+    ),
+    "create_organization_unit": lambda kw: (
+        "delete_organization_unit",
+        {"ou_dn": kw["ou_dn"]},
+    ),
+    "move_user_ou": lambda kw: (
+        "move_user_ou",
+        {"from_ou": kw["to_ou"], "to_ou": kw["from_ou"]},
+    ),
+    "add_users_to_group": lambda kw: ("remove_users_from_group", kw),
+    "remove_users_from_group": lambda kw: ("add_users_to_group", kw),
+}
+# object classes a depth limited search descends into
+CONTAINER_CLASSES = {"organizationalunit", "container", "builtindomain", "domaindns"}
+
+
+def object_classes(entry: ldb.Message) -> set:
+    """Lower-cased objectClass values of an entry."""
+    return {
+        (oc.decode() if isinstance(oc, bytes) else str(oc)).lower()
+        for oc in entry.get("objectClass", [])
+    }
+
+
+def _values(value) -> List[str]:
+    """Values of an attribute as strings, from a request or an ldb element."""
+    if isinstance(value, (str, bytes)):
+        value = [value]
+    return [v.decode() if isinstance(v, bytes) else str(v) for v in value]
+
+
+def _replicated_version(entry) -> frozenset:
+    """The originating stamps of an object's attributes, equal on every DC.
+
+    `uSNChanged` is local to a DC, while the `(version, invocation id, USN)` of
+    the originating write of each attribute replicates as is.
+    """
+    value = entry.get("replPropertyMetaData", idx=0)
+    if value is None:
+        return frozenset()
+    blob = ndr_unpack(drsblobs.replPropertyMetaDataBlob, bytes(value))
+    return frozenset(
+        (m.attid, m.version, str(m.originating_invocation_id), m.originating_usn)
+        for m in blob.ctr.array
+    )
 
 
 class SambaClientError(Exception):
     pass
 
 
+class PreconditionFailed(SambaClientError):
+    pass
+
+
+class Forbidden(SambaClientError):
+    pass
+
+
+class DirectoryUnavailable(SambaClientError):
+    """No DC could serve the request; clients should retry later."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# errors with their own handler in `app.main`; services re-raise them
+# instead of turning them into a 400 like the other samba errors
+PASSTHROUGH_ERRORS = (DirectoryUnavailable, Forbidden)
+
+
+# bind errors which mean the credentials are wrong rather than the DC is down
+AUTH_ERROR_MARKERS = (
+    "LDAP_INVALID_CREDENTIALS",
+    "NT_STATUS_LOGON_FAILURE",
+    "NT_STATUS_WRONG_PASSWORD",
+    "NT_STATUS_NO_SUCH_USER",
+    "NT_STATUS_ACCOUNT_",
+    "NT_STATUS_PASSWORD_",
+)
+
+
+def is_auth_error(e: Exception) -> bool:
+    if isinstance(e, ldb.LdbError) and e.args[0] == ldb.ERR_INVALID_CREDENTIALS:
+        return True
+    message = str(e)
+    return any(marker in message for marker in AUTH_ERROR_MARKERS)
+
+
+# errors which mean the DC went away, as opposed to a bad request
+CONNECTION_ERROR_MARKERS = (
+    "NT_STATUS_CONNECTION_REFUSED",
+    "NT_STATUS_CONNECTION_RESET",
+    "NT_STATUS_CONNECTION_DISCONNECTED",
+    "NT_STATUS_IO_TIMEOUT",
+    "NT_STATUS_HOST_UNREACHABLE",
+    "NT_STATUS_NETWORK_UNREACHABLE",
+    "NT_STATUS_END_OF_FILE",
+    "Connection refused",
+    "timed out",
+)
+
+
+def is_connection_error(e: Exception) -> bool:
+    if isinstance(e, DirectoryUnavailable):
+        return True
+    if isinstance(e, ldb.LdbError) and e.args[0] in (
+        ldb.ERR_UNAVAILABLE,
+        ldb.ERR_BUSY,
+    ):
+        return True
+    message = str(e)
+    return any(marker in message for marker in CONNECTION_ERROR_MARKERS)
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def idempotent(method):
+    """Retry a read on another DC when the current one drops the connection.
+
+    Only for methods without side effects: a retried call must not be able
+    to apply anything twice. Backoff is exponential with full jitter so
+    that workers retrying after the same outage do not do it in lockstep.
+
+    Most reads are called straight from the handlers on the event loop,
+    where sleeping would stall every other request of the worker. There a
+    read only fails over at once to another healthy DC; with none left it
+    raises `DirectoryUnavailable` and the backoff is left to the client,
+    through `Retry-After`. Only reads run in the thread pool back off here.
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(SAMBA_READ_RETRIES + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                if not isinstance(e, DirectoryUnavailable):
+                    balancer.record_failure(self.read_host)
+                on_loop = _on_event_loop()
+                if attempt == SAMBA_READ_RETRIES or (
+                    on_loop and not balancer.has_other_healthy(self.read_host)
+                ):
+                    raise DirectoryUnavailable(
+                        f"directory unavailable: {e}", balancer.retry_after()
+                    ) from e
+            if not on_loop:
+                time.sleep(random.uniform(0, SAMBA_RETRY_BACKOFF * 2 ** attempt))
+            self._failover()
+
+    return wrapper
+
+
 class SambaClient(object):
-    def __init__(self, username: str, password: str):
+    def __init__(
+        self,
+        username: str,
+        password: Optional[str] = None,
+        permissions: Iterable[str] = (),
+        local_sam: Optional[LocalSam] = local_sam,
+    ):
         self.username = username
         self.password = password
-        self._client = self._init_client()
+        # without a password the pooled service account connections are used
+        # and the rights of `username` are checked here instead of by the DC
+        self.pooled = password is None
+        self.permissions = frozenset(permissions)
+        self.local_sam = None if self.pooled else local_sam
+        self._connections: Dict[str, SamDB] = {}
+        if self.pooled:
+            if pool is None:
+                raise HTTPException(
+                    status_code=401, detail="Invalid username or password"
+                )
+            self._require(READ)
+            # back to the pool when the client is gone, minus dropped ones
+            weakref.finalize(self, pool.release, self._connections)
+        if self.local_sam is not None:
+            self.read_host = self._connect_local()
+        else:
+            self.read_host = self._connect(balancer.read_hosts(username))
+        self._reader = self._connections[self.read_host]
+        self.domain_info()
+
+    @property
+    def _client(self) -> SamDB:
+        """Connection to the write DC, bound on first use."""
+        self._require(WRITE)
+        balancer.mark_write(self.username)
+        writer = self.connection(balancer.write_host)
+        # reads following a write on this client must see it
+        self._reader, self.read_host = writer, balancer.write_host
+        return writer
+
+    @property
+    def read_dc(self) -> str:
+        return dc_tag(self.read_host)
+
+    @property
+    def write_dc(self) -> str:
+        return dc_tag(balancer.write_host)
+
+    def _require(self, permission: str):
+        if self.pooled and permission not in self.permissions:
+            raise Forbidden(f"`{self.username}` has no `{permission}` permission")
+
+    def connection(self, url: str) -> SamDB:
+        if url not in self._connections:
+            if self.local_sam is not None and url == self.local_sam.path:
+                self._connections[url] = self.local_sam.open(self.username)
+            else:
+                self._connect([url])
+        return self._connections[url]
+
+    def host_for_tag(self, tag: str) -> Optional[str]:
+        if self.local_sam is not None and tag == dc_tag(self.local_sam.path):
+            return self.local_sam.path
+        return balancer.host_for_tag(tag)
+
+    def pin_reader(self, tag: str):
+        """Read from the DC behind `tag`, e.g. for a USN it issued."""
+        if tag == self.read_dc:
+            return
+        url = self.host_for_tag(tag)
+        if url is None:
+            raise SambaClientError(f"unknown dc `{tag}`")
+        self._reader = self.connection(url)
+        self.read_host = url
+
+    def _connect_local(self) -> str:
+        if not self.local_sam.is_verified(self.username, self.password):
+            # read first: a password changed during the bind is not remembered
+            pwd_last_set = self.local_sam.sign_in_state(self.username)
+            # sam.ldb does not check passwords, a bind against the DC does
+            self._connect(balancer.read_hosts(self.username))
+            if pwd_last_set is not None:
+                self.local_sam.remember(self.username, self.password, pwd_last_set)
+        try:
+            self._connections[self.local_sam.path] = self.local_sam.open(self.username)
+        except ldb.LdbError as e:
+            if e.args[0] == ldb.ERR_NO_SUCH_OBJECT:
+                raise HTTPException(
+                    status_code=401, detail="Invalid username or password"
+                )
+            # sam.ldb unusable (e.g. locked by an upgrade), read over LDAP
+            if self._connections:
+                return next(iter(self._connections))
+            return self._connect(balancer.read_hosts(self.username))
+        return self.local_sam.path
+
+    def _connect(self, urls: List[str]) -> str:
+        errors = []
+        for url in urls:
+            if not balancer.allow(url):
+                continue
+            samdb = pool.acquire(url) if self.pooled else None
+            if samdb is not None:
+                self._connections[url] = samdb
+                return url
+            started = time.monotonic()
+            try:
+                self._connections[url] = self._init_client(url)
+            except Exception as e:
+                if is_auth_error(e):
+                    raise HTTPException(
+                        status_code=401, detail="Invalid username or password"
+                    )
+                balancer.record_failure(url)
+                errors.append(str(e))
+                continue
+            balancer.record_success(url, time.monotonic() - started)
+            return url
+        raise DirectoryUnavailable(
+            "no domain controller available: %s" % "; ".join(errors or ["all open"]),
+            balancer.retry_after(),
+        )
 
-    def _init_client(self) -> SamDB:
+    def _failover(self):
+        """Rebind the reader to the next DC after the current one failed."""
+        failed = self.read_host
+        # also drops the write connection when reads were pinned to it
+        self._connections.pop(failed, None)
+        hosts = [url for url in balancer.read_hosts(self.username) if url != failed]
+        self.read_host = self._connect(hosts or [failed])
+        self._reader = self._connections[self.read_host]
+
+    def _url_of(self, samdb: SamDB) -> Optional[str]:
+        for url, conn in self._connections.items():
+            if conn is samdb:
+                return url
+        return None
+
+    def _init_client(self, url: str) -> SamDB:
         lp = LoadParm()
         creds = Credentials()
         creds.guess(lp)
-        creds.set_username(self.username)
-        creds.set_password(self.password)
-        try:
-            samdb = SamDB(
-                url=SAMBA_HOST,
-                session_info=system_session(),
-                credentials=creds,
-                lp=lp,
-            )
-            return samdb
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid username or password")
+        if self.pooled:
+            creds.set_username(pool.username)
+            creds.set_password(pool.password)
+        else:
+            creds.set_username(self.username)
+            creds.set_password(self.password)
+        return SamDB(
+            url=url,
+            session_info=system_session(),
+            credentials=creds,
+            lp=lp,
+        )
 
     @contextmanager
-    def transaction(self):
+    def transaction(self, samdb: Optional[SamDB] = None):
+        samdb = samdb or self._client
         try:
-            self._client.transaction_start()
+            samdb.transaction_start()
             yield
-        except:
-            self._client.transaction_cancel()
+        except Exception as e:
+            try:
+                samdb.transaction_cancel()
+            except ldb.LdbError as cancel_error:
+                # the failure which made us cancel is the one to report
+                if not is_connection_error(e):
+                    raise e from cancel_error
+            if is_connection_error(e) and not isinstance(e, DirectoryUnavailable):
+                url = self._url_of(samdb)
+                if url is not None:
+                    balancer.record_failure(url)
+                    self._connections.pop(url, None)
+                raise DirectoryUnavailable(
+                    f"directory unavailable: {e}", balancer.retry_after()
+                ) from e
+            raise
+        except BaseException:
+            samdb.transaction_cancel()
             raise
         else:
-            self._client.transaction_commit()
+            samdb.transaction_commit()
 
-    def list_users(self) -> list:
-        with self.transaction():
-            search_dn = self._client.domain_dn()
-            filter_expires = ""
-            current_nttime = self._client.get_nttime()
-            filter_expires = "(|(accountExpires=0)(accountExpires>=%u))" % (
-                current_nttime
-            )
-            filter_disabled = "(!(userAccountControl:%s:=%u))" % (
-                ldb.OID_COMPARATOR_AND,
-                dsdb.UF_ACCOUNTDISABLE,
+    def paged_search(
+        self,
+        expression: str,
+        attrs: List[str],
+        base: Optional[str] = None,
+        scope: int = ldb.SCOPE_SUBTREE,
+        page_size: int = SAMBA_PAGE_SIZE,
+        controls: Optional[List[str]] = None,
+    ):
+        """Yield entries page by page, holding at most one page in memory."""
+        search_dn = base or self._reader.domain_dn()
+        cookie = ""
+        while True:
+            page_control = f"paged_results:1:{page_size}"
+            if cookie:
+                page_control = f"{page_control}:{cookie}"
+            lookup = self._reader.search(
+                search_dn,
+                scope=scope,
+                expression=expression,
+                attrs=attrs,
+                controls=[page_control] + (controls or []),
             )
+            for entry in lookup:
+                yield entry
+            cookie = self._paged_results_cookie(lookup)
+            if not cookie:
+                break
 
-            filter_ = "(&(objectClass=user)(userAccountControl:%s:=%u)%s%s)" % (
-                ldb.OID_COMPARATOR_AND,
-                dsdb.UF_NORMAL_ACCOUNT,
-                filter_disabled,
-                filter_expires,
+    @idempotent
+    def window_search(
+        self,
+        expression: str,
+        attrs: List[str],
+        sort: str,
+        descending: bool = False,
+        offset: int = 0,
+        count: Optional[int] = None,
+        base: Optional[str] = None,
+    ) -> Tuple[List[ldb.Message], int]:
+        """Return one window of the sorted result and the size of the result.
+
+        Sorting happens on the DC through the server side sort control, the
+        window is cut there by the VLV control, so only `count` entries are
+        sent and decoded however deep the offset is.
+        """
+        controls = [f"server_sort:1:{int(descending)}:{sort}"]
+        if count is not None:
+            # VLV offsets are 1-based; no entries before, count - 1 after
+            controls.append(f"vlv:1:0:{count - 1}:{offset + 1}:0")
+        with self.transaction(self._reader):
+            lookup = self._reader.search(
+                base or self._reader.domain_dn(),
+                scope=ldb.SCOPE_SUBTREE,
+                expression=expression,
+                attrs=attrs,
+                controls=controls,
             )
+            entries = [entry for entry in lookup]
+        if count is None:
+            return entries[offset:], len(entries)
+        return entries[:count], self._vlv_content_count(lookup, len(entries))
+
+    @staticmethod
+    def _vlv_content_count(lookup, default: int) -> int:
+        for control in lookup.controls or []:
+            # `vlv_resp:<critical>:<target>:<content count>:<result>:<len>:<ctx>`
+            control_str = str(control)
+            if control_str.startswith("vlv_resp"):
+                return int(control_str.split(":")[3])
+        return default
+
+    @staticmethod
+    def _paged_results_cookie(lookup) -> str:
+        for control in lookup.controls or []:
+            # response control string: `paged_results:<critical>:<cookie>`
+            control_str = str(control)
+            if control_str.startswith("paged_results"):
+                return control_str.split(":")[-1]
+        return ""
+
+    def entry_to_ldif(self, entry: ldb.Message) -> str:
+        return self._reader.write_ldif(entry, ldb.CHANGETYPE_NONE)
+
+    @staticmethod
+    def _uac_filter(flag: int) -> str:
+        return "(userAccountControl:%s:=%u)" % (ldb.OID_COMPARATOR_AND, flag)
+
+    @staticmethod
+    def _not_expired_filter(nttime: int) -> str:
+        return "(|(accountExpires=0)(accountExpires>=%u))" % nttime
+
+    def accounts_filter(self) -> str:
+        """Normal user accounts, whether enabled or not."""
+        return "(&(objectClass=user)%s)" % self._uac_filter(dsdb.UF_NORMAL_ACCOUNT)
+
+    def users_filter(self) -> str:
+        current_nttime = self._reader.get_nttime()
+        filter_expires = self._not_expired_filter(current_nttime)
+        filter_disabled = "(!%s)" % self._uac_filter(dsdb.UF_ACCOUNTDISABLE)
 
-            lookup = self._client.search(
+        return "(&(objectClass=user)%s%s%s)" % (
+            self._uac_filter(dsdb.UF_NORMAL_ACCOUNT),
+            filter_disabled,
+            filter_expires,
+        )
+
+    @idempotent
+    def list_users(self) -> list:
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
+            filter_ = self.users_filter()
+
+            lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=filter_,
@@ -83,6 +537,96 @@ class SambaClient(object):
 
         return users
 
+    @idempotent
+    def count(self, expression: str, base: Optional[str] = None) -> int:
+        """Number of entries matching `expression`.
+
+        The `1.1` attribute list asks for no attributes, so only the DNs of
+        the matches are sent, one page at a time.
+        """
+        with self.transaction(self._reader):
+            return self._count(expression, base=base)
+
+    def _count(self, expression: str, base: Optional[str] = None) -> int:
+        return sum(1 for _ in self.paged_search(expression, ["1.1"], base=base))
+
+    @idempotent
+    def facet_counts(self, expression: str, attr: str) -> Dict[Optional[str], int]:
+        """Count the matches of `expression` per value of `attr`.
+
+        Only `attr` is fetched; the pseudo attribute `ou` groups the matches
+        by the container they are in, which comes with the DN.
+        """
+        counts: Dict[Optional[str], int] = {}
+        attrs = ["1.1"] if attr == "ou" else [attr]
+        with self.transaction(self._reader):
+            for entry in self.paged_search(expression, attrs):
+                if attr == "ou":
+                    value = str(entry.dn.parent())
+                else:
+                    value = entry.get(attr, idx=0)
+                    if value is not None:
+                        value = str(value)
+                counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def _lockout_filter(self, nttime: int) -> str:
+        """Accounts whose lockout has not run out yet."""
+        domain = self.get_object_by_dn(self.domain_dn(), ["lockoutDuration"])
+        # a negative interval in 100ns units, 0 locks out until unlocked
+        duration = int(domain.get("lockoutDuration", idx=0) or 0) if domain else 0
+        return "(lockoutTime>=%u)" % max(1, nttime + duration if duration else 1)
+
+    @idempotent
+    def sign_in_state(self, username: str) -> Optional[str]:
+        """`pwdLastSet` of `username` while the account may sign in.
+
+        None once it is disabled, locked out, expired or gone, which is
+        what a bind as the user would refuse.
+        """
+        with self.transaction(self._reader):
+            nttime = self._reader.get_nttime()
+            lookup = self._reader.search(
+                self.domain_dn(),
+                scope=ldb.SCOPE_SUBTREE,
+                expression="(&(objectClass=user)(sAMAccountName=%s)(!%s)%s(!%s))"
+                % (
+                    ldb.binary_encode(username),
+                    self._uac_filter(dsdb.UF_ACCOUNTDISABLE),
+                    self._not_expired_filter(nttime),
+                    self._lockout_filter(nttime),
+                ),
+                attrs=["pwdLastSet"],
+            )
+            if len(lookup) == 0:
+                return None
+            if "pwdLastSet" not in lookup[0]:
+                return "0"
+            return str(lookup[0]["pwdLastSet"])
+
+    @idempotent
+    def user_stats(self, expiring_days: int) -> Dict[str, int]:
+        """Counts of the normal user accounts by state, without fetching them."""
+        nttime = self._reader.get_nttime()
+        soon = nttime + expiring_days * 86400 * 10**7
+        disabled = self._uac_filter(dsdb.UF_ACCOUNTDISABLE)
+        states = {
+            "total": "",
+            "enabled": "(!%s)%s" % (disabled, self._not_expired_filter(nttime)),
+            "disabled": disabled,
+            "expired": "(!(accountExpires=0))(accountExpires<=%u)" % nttime,
+            "expiring": "(accountExpires>=%u)(accountExpires<=%u)" % (nttime, soon),
+            "locked_out": self._lockout_filter(nttime),
+        }
+        accounts = self.accounts_filter()
+        # counts of separate searches, best-effort: over LDAP the transaction
+        # is no snapshot, so they need not add up under concurrent changes
+        with self.transaction(self._reader):
+            return {
+                state: self._count("(&%s%s)" % (accounts, filter_))
+                for state, filter_ in states.items()
+            }
+
     def _new_user(
         self,
         username: str,
@@ -97,28 +641,20 @@ class SambaClient(object):
         initials: Optional[str] = None,
         force_password_change_at_next_login_req: bool = False,
         setpassword: bool = False,
+        created: Optional[List[str]] = None,
         **kwargs,
     ):
         displayname = self._client.fullname_from_names(
             given_name=givenName, initials=initials, surname=sn
         )
         cn = username
+        domain = self.domain_info()
         if userou:
-            user_dn = "CN=%s,%s,%s" % (cn, userou, self._client.domain_dn())
+            user_dn = "CN=%s,%s,%s" % (cn, userou, domain.domain_dn)
         else:
-            user_dn = "CN=%s,%s" % (
-                cn,
-                self._client.get_wellknown_dn(
-                    self._client.get_default_basedn(), dsdb.DS_GUID_USERS_CONTAINER
-                ),
-            )
+            user_dn = "CN=%s,%s" % (cn, domain.users_dn)
 
-        dnsdomain = (
-            ldb.Dn(self._client, self._client.domain_dn())
-            .canonical_str()
-            .replace("/", "")
-        )
-        user_principal_name = "%s@%s" % (username, dnsdomain)
+        user_principal_name = "%s@%s" % (username, domain.dns_domain)
         # The new user record. Note the reliance on the SAMLDB module which
         # fills in the default information
         ldbmessage = {
@@ -155,12 +691,149 @@ class SambaClient(object):
 
         # with self.transaction():
         self._client.add(ldbmessage)
+        if created is not None:
+            # known before setpassword, which may still fail
+            created.append(user_dn)
         if setpassword:
             self._client.setpassword(
                 f"(distinguishedName={ldb.binary_encode(user_dn)})",
                 password,
                 force_password_change_at_next_login_req,
             )
+        return user_dn
+
+    def import_users(
+        self, rows: Iterable[Tuple[int, dict]], chunk_size: int
+    ) -> Iterator[dict]:
+        """Create users from `(line, user_data)` rows, one transaction per chunk."""
+        chunk: List[Tuple[int, dict]] = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield from self._import_users_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self._import_users_chunk(chunk)
+
+    def _import_users_chunk(self, chunk: List[Tuple[int, dict]]) -> List[dict]:
+        created: List[str] = []
+        done = 0
+        try:
+            with self.transaction():
+                for _, user_data in chunk:
+                    self._new_user(
+                        setpassword=bool(user_data.get("password")),
+                        created=created,
+                        **user_data,
+                    )
+                    done += 1
+        except Exception as e:
+            # ldap backend commits every add immediately, so undo them by hand,
+            # including the add of the failed row when its setpassword failed
+            left: Dict[str, str] = {}
+            for user_dn in created:
+                try:
+                    self._client.delete(user_dn)
+                except Exception as undo_error:
+                    left[user_dn] = str(undo_error)
+            results = []
+            for idx, (line, user_data) in enumerate(chunk):
+                user_dn = created[idx] if idx < len(created) else None
+                if idx < done and user_dn in left:
+                    status, error = "not_rolled_back", left[user_dn]
+                elif idx < done:
+                    status, error = "rolled_back", None
+                elif idx == done:
+                    status, error = "failed", str(e)
+                    if user_dn in left:
+                        error += f"; `{user_dn}` was left behind: {left[user_dn]}"
+                else:
+                    status, error = "skipped", None
+                results.append(
+                    {
+                        "line": line,
+                        "username": user_data.get("username"),
+                        "status": status,
+                        "error": error,
+                    }
+                )
+            return results
+        return [
+            {
+                "line": line,
+                "username": user_data.get("username"),
+                "status": "created",
+                "error": None,
+            }
+            for line, user_data in chunk
+        ]
+
+    def reconcile_users(
+        self, desired: List[Tuple[str, dict]], chunk_size: int
+    ) -> Iterator[dict]:
+        """Bring users to the `(username, attributes)` states in `desired`.
+
+        Current values are read per chunk with one OR search projected on the
+        attributes in play, on the write DC so the diff is not made against a
+        lagging replica. Only users whose values differ get a modify, and it
+        replaces only the differing attributes.
+        """
+        for i in range(0, len(desired), chunk_size):
+            yield from self._reconcile_users_chunk(desired[i : i + chunk_size])
+
+    def _reconcile_users_chunk(self, chunk: List[Tuple[str, dict]]) -> Iterator[dict]:
+        samdb = self._client
+        attrs = {"sAMAccountName"}
+        wanted = []
+        for username, user_data in chunk:
+            changes = self._user_changes(**user_data)
+            attrs.update(changes)
+            wanted.append((username, changes))
+        terms = "".join(
+            f"(sAMAccountName={ldb.binary_encode(username)})" for username, _ in wanted
+        )
+        current = {
+            str(entry["sAMAccountName"]).lower(): entry
+            for entry in samdb.search(
+                self.domain_dn(),
+                scope=ldb.SCOPE_SUBTREE,
+                expression=f"(&(objectClass=user)(|{terms}))",
+                attrs=sorted(attrs),
+            )
+        }
+        for username, changes in wanted:
+            entry = current.get(username.lower())
+            if entry is None:
+                yield {
+                    "username": username,
+                    "status": "failed",
+                    "error": f"user `{username}` not found",
+                }
+                continue
+            diff = {
+                k: v
+                for k, v in changes.items()
+                if sorted(_values(v)) != sorted(_values(entry.get(k, [])))
+            }
+            if not diff:
+                yield {"username": username, "status": "unchanged"}
+                continue
+            ldbmessage = ldb.Message()
+            ldbmessage.dn = entry.dn
+            for k, v in diff.items():
+                ldbmessage[k] = ldb.MessageElement(v, ldb.FLAG_MOD_REPLACE, k)
+            try:
+                samdb.modify(ldbmessage)
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                yield {"username": username, "status": "failed", "error": str(e)}
+                continue
+            yield {
+                "username": username,
+                "status": "changed",
+                "attributes": sorted(diff),
+            }
 
     def create_user(
         self,
@@ -186,11 +859,12 @@ class SambaClient(object):
         with self.transaction():
             self._client.deleteuser(username=username)
 
+    @idempotent
     def get_user_by_username(self, username: str) -> Optional[ldb.Message]:
-        with self.transaction():
-            search_dn = self._client.domain_dn()
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
             search_filter = f"(sAMAccountName={username})"
-            lookup = self._client.search(
+            lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=search_filter,
@@ -200,11 +874,12 @@ class SambaClient(object):
                 return None
             return lookup[0]
 
+    @idempotent
     def get_group_by_name(self, name: str) -> Optional[ldb.Message]:
-        with self.transaction():
-            search_dn = self._client.domain_dn()
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
             search_filter = f"(&(objectclass=group)(sAMAccountName={name}))"
-            lookup = self._client.search(
+            lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=search_filter,
@@ -214,6 +889,38 @@ class SambaClient(object):
                 return None
             return lookup[0]
 
+    @idempotent
+    def is_member_of(self, username: str, groupname: str) -> bool:
+        """Whether `username` is in `groupname`, directly, through nesting or
+        as its primary group."""
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
+            group_lookup = self._reader.search(
+                search_dn,
+                scope=ldb.SCOPE_SUBTREE,
+                expression="(&(objectclass=group)(sAMAccountName=%s))"
+                % ldb.binary_encode(groupname),
+                attrs=["primaryGroupToken"],
+            )
+            if len(group_lookup) == 0:
+                return False
+            group_dn = ldb.binary_encode(str(group_lookup[0].dn))
+            # the primary group (e.g. Domain Users) is never in `member`, it
+            # is the group's RID in the user's primaryGroupID
+            rid = str(group_lookup[0]["primaryGroupToken"])
+            # LDAP_MATCHING_RULE_IN_CHAIN walks nested groups on the DC
+            lookup = self._reader.search(
+                search_dn,
+                scope=ldb.SCOPE_SUBTREE,
+                expression=(
+                    f"(&(sAMAccountName={ldb.binary_encode(username)})"
+                    f"(|(memberOf:1.2.840.113556.1.4.1941:={group_dn})"
+                    f"(primaryGroupID={rid})))"
+                ),
+                attrs=["dn"],
+            )
+            return len(lookup) > 0
+
     def update_user_password(self, username: str, new_password: str):
         with self.transaction():
             search_filter = f"(sAMAccountName={username})"
@@ -224,24 +931,34 @@ class SambaClient(object):
                 username=None,
             )
 
+    def _gpo_to_dict(self, m: ldb.Message) -> dict:
+        return {
+            # str(m['name'][0]).split("'")[1::2]
+            "gpo": str(m["name"][0]),
+            "displayname": str(m["displayName"][0]),
+            "path": str(m["gPCFileSysPath"][0]),
+            "dn": str(m.dn),
+            "version": str(attr_default(m, "versionNumber", "0")),
+            "flags": gpo_flags_string(int(attr_default(m, "flags", 0))),
+        }
+
+    @idempotent
     def list_gpo(self) -> list:
         gpos = []
-        msg = get_gpo_info(self._client, None)
+        msg = get_gpo_info(self._reader, None)
 
         for m in msg:
             # print("DEBUG: " + str(m['name'][0]))
-            gpo = {
-                # str(m['name'][0]).split("'")[1::2]
-                "gpo": str(m["name"][0]),
-                "displayname": str(m["displayName"][0]),
-                "path": str(m["gPCFileSysPath"][0]),
-                "dn": str(m.dn),
-                "version": str(attr_default(m, "versionNumber", "0")),
-                "flags": gpo_flags_string(int(attr_default(m, "flags", 0))),
-            }
-            gpos.append(gpo)
+            gpos.append(self._gpo_to_dict(m))
         return gpos
 
+    @idempotent
+    def get_gpo(self, name: str) -> Optional[dict]:
+        msg = get_gpo_info(self._reader, name)
+        if len(msg) == 0:
+            return None
+        return self._gpo_to_dict(msg[0])
+
     def create_organization_unit(
         self,
         ou_dn: str,
@@ -291,31 +1008,169 @@ class SambaClient(object):
             groupname=groupname, members=members, to_add=False
         )
 
-    def list_groups(self) -> list:
+    def _group_members(self, samdb: SamDB, group_dn: str) -> List[str]:
+        """All `member` values of a group, with ranged retrieval when the DC
+        caps the values returned per attribute (MaxValRange)."""
+        members: List[str] = []
+        start = 0
+        while True:
+            lookup = samdb.search(
+                group_dn, scope=ldb.SCOPE_BASE, attrs=[f"member;range={start}-*"]
+            )
+            name = next(
+                (k for k in lookup[0].keys() if k.lower().startswith("member")), None
+            )
+            if name is None:
+                return members
+            members.extend(
+                m.decode() if isinstance(m, bytes) else str(m) for m in lookup[0][name]
+            )
+            # `member;range=<start>-<end>`, `*` as end on the last chunk
+            end = name.rpartition("-")[2] if ";range=" in name.lower() else "*"
+            if end == "*":
+                return members
+            start = int(end) + 1
+
+    def _member_dns(self, samdb: SamDB, names: List[str]) -> Dict[str, str]:
+        """Map sAMAccountNames to DNs, in chunks of one OR filter each."""
+        found: Dict[str, str] = {}
+        for i in range(0, len(names), MEMBER_LOOKUP_CHUNK):
+            terms = "".join(
+                f"(sAMAccountName={ldb.binary_encode(name)})"
+                for name in names[i : i + MEMBER_LOOKUP_CHUNK]
+            )
+            for entry in samdb.search(
+                samdb.domain_dn(),
+                scope=ldb.SCOPE_SUBTREE,
+                expression=f"(|{terms})",
+                attrs=["sAMAccountName"],
+            ):
+                found[str(entry["sAMAccountName"]).lower()] = str(entry.dn)
+        return found
+
+    def set_group_members(self, groupname: str, members: List[str]) -> Dict[str, int]:
+        """Make `members` the exact member list of `groupname`.
+
+        The current members are read once and only the difference is sent,
+        adds and removes in one modify, so a large group is not rewritten.
+        """
         with self.transaction():
-            search_dn = self._client.domain_dn()
+            samdb = self._client
+            group = samdb.search(
+                samdb.domain_dn(),
+                scope=ldb.SCOPE_SUBTREE,
+                expression="(&(objectClass=group)(sAMAccountName=%s))"
+                % ldb.binary_encode(groupname),
+                attrs=["1.1"],
+            )
+            if len(group) == 0:
+                raise SambaClientError(f"group `{groupname}` not found")
+            group_dn = str(group[0].dn)
+            wanted = {name.lower(): name for name in members}
+            found = self._member_dns(samdb, list(wanted))
+            missing = [name for key, name in wanted.items() if key not in found]
+            if missing:
+                raise SambaClientError(
+                    "members not found: %s" % ", ".join(sorted(missing))
+                )
+            desired = {dn.lower(): dn for dn in found.values()}
+            current = {dn.lower(): dn for dn in self._group_members(samdb, group_dn)}
+            to_add = [dn for key, dn in desired.items() if key not in current]
+            to_remove = [dn for key, dn in current.items() if key not in desired]
+            if to_add or to_remove:
+                ldif = ["dn:: " + b64encode(group_dn.encode()).decode()]
+                ldif.append("changetype: modify")
+                for op, dns in (("add", to_add), ("delete", to_remove)):
+                    if dns:
+                        ldif.append(f"{op}: member")
+                        # base64, DNs may hold anything plain LDIF would trip on
+                        ldif.extend(
+                            "member:: " + b64encode(dn.encode()).decode() for dn in dns
+                        )
+                        ldif.append("-")
+                samdb.modify_ldif("\n".join(ldif) + "\n")
+        return {
+            "added": len(to_add),
+            "removed": len(to_remove),
+            "unchanged": len(desired) - len(to_add),
+        }
+
+    def run_batch(self, calls: List[Tuple[str, dict]], atomic: bool) -> List[dict]:
+        """Run `(method, kwargs)` write calls in order, on this one client.
+
+        Atomic batches run in one transaction and stop at the first failure.
+        The ldap backend commits every write as it is sent, so the calls
+        done before it are undone by hand, in reverse order, when they have
+        an undo in `BATCH_UNDO`. Otherwise every call runs on its own and a
+        failure only fails that call, unless the DC went away.
+        """
+        results: List[dict] = []
+        if atomic:
+            try:
+                with self.transaction():
+                    for name, kwargs in calls:
+                        results.append(
+                            self._batch_result(getattr(self, name)(**kwargs))
+                        )
+            except Exception as e:
+                failed = len(results)
+                self._undo_batch(calls[:failed], results)
+                results.append({"status": "failed", "error": str(e)})
+                results.extend({"status": "skipped"} for _ in calls[failed + 1 :])
+            return results
+        for name, kwargs in calls:
+            try:
+                results.append(self._batch_result(getattr(self, name)(**kwargs)))
+            except Exception as e:
+                results.append({"status": "failed", "error": str(e)})
+                if is_connection_error(e):
+                    results.extend({"status": "skipped"} for _ in calls[len(results) :])
+                    break
+        return results
+
+    @staticmethod
+    def _batch_result(value) -> dict:
+        # reports like the one of set_group_members are passed on
+        return {
+            "status": "succeeded",
+            "result": value if isinstance(value, dict) else None,
+        }
+
+    def _undo_batch(self, calls: List[Tuple[str, dict]], results: List[dict]):
+        for (name, kwargs), result in reversed(list(zip(calls, results))):
+            undo = BATCH_UNDO.get(name)
+            if undo is None:
+                result.update(status="not_rolled_back", error="cannot be undone")
+                continue
+            undo_name, undo_kwargs = undo(kwargs)
+            try:
+                getattr(self, undo_name)(**undo_kwargs)
+            except Exception as e:
+                result.update(status="not_rolled_back", error=str(e))
+            else:
+                result.update(status="rolled_back", result=None)
+
+    @idempotent
+    def list_groups(self) -> list:
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
             # filter_str = "(objectclass=group)"
             filter_str = "(objectclass=group)"
-            lookup = self._client.search(
+            lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=filter_str,
-                attrs=[
-                    "sAMAccountName",
-                    "groupType",
-                    "description",
-                    "mail",
-                    "info",
-                ],
+                attrs=GROUP_LIST_ATTRS,
             )
             return [entry for entry in lookup]
 
+    @idempotent
     def list_users_by_group(self, groupname: str) -> list:
         result = []
-        with self.transaction():
-            search_dn = self._client.domain_dn()
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
             group_str = f"(sAMAccountName={groupname})"
-            group_lookup = self._client.search(
+            group_lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=group_str,
@@ -325,7 +1180,7 @@ class SambaClient(object):
                 return []
             dn = group_lookup[0].get("distinguishedName", idx=0)
             filter_query = f"(&(objectclass=user)(memberOf={dn}))"
-            lookup = self._client.search(
+            lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=filter_query,
@@ -345,11 +1200,12 @@ class SambaClient(object):
                 result.append(obj)
         return result
 
+    @idempotent
     def search_criteria(self, search: str, search_target: List[str]) -> list:
-        search_dn = self._client.domain_dn()
+        search_dn = self._reader.domain_dn()
         result = []
-        with self.transaction():
-            lookup = self._client.search(
+        with self.transaction(self._reader):
+            lookup = self._reader.search(
                 search_dn,
                 scope=ldb.SCOPE_SUBTREE,
                 expression=search,
@@ -360,9 +1216,8 @@ class SambaClient(object):
                 result.append(row)
         return result
 
-    def modify_user(
+    def _user_changes(
         self,
-        username: str,
         sn: Optional[str] = None,
         telephoneNumber: Optional[str] = None,
         cn: Optional[str] = None,
@@ -372,50 +1227,134 @@ class SambaClient(object):
         userAccountControl: Optional[str] = None,
         **kwargs,
     ) -> dict:
-        user_obj = self.get_user_by_username(username)
-        if not user_obj:
-            raise SambaClientError(f"user with this `{username}` exists")
-        ldbmessage = ldb.Message()
-        ldbmessage.dn = ldb.Dn(self._client, str(user_obj["dn"]))
-        if sn is not None:
-            ldbmessage["sn"] = ldb.MessageElement(str(sn), ldb.FLAG_MOD_REPLACE, "sn")
-        if telephoneNumber is not None:
-            ldbmessage["telephoneNumber"] = ldb.MessageElement(
-                str(telephoneNumber), ldb.FLAG_MOD_REPLACE, "telephoneNumber"
-            )
-        if cn is not None:
-            ldbmessage["cn"] = ldb.MessageElement(str(cn), ldb.FLAG_MOD_REPLACE, "cn")
-        if displayName is not None:
-            ldbmessage["displayName"] = ldb.MessageElement(
-                str(displayName), ldb.FLAG_MOD_REPLACE, "displayName"
-            )
-        if givenName is not None:
-            ldbmessage["givenName"] = ldb.MessageElement(
-                str(givenName), ldb.FLAG_MOD_REPLACE, "givenName"
-            )
-        if mail is not None:
-            ldbmessage["mail"] = ldb.MessageElement(
-                str(mail), ldb.FLAG_MOD_REPLACE, "mail"
-            )
-        if userAccountControl is not None:
-            ldbmessage["userAccountControl"] = ldb.MessageElement(
-                str(userAccountControl), ldb.FLAG_MOD_REPLACE, "userAccountControl"
-            )
-
+        changes = {
+            "sn": sn,
+            "telephoneNumber": telephoneNumber,
+            "cn": cn,
+            "displayName": displayName,
+            "givenName": givenName,
+            "mail": mail,
+            "userAccountControl": userAccountControl,
+        }
+        changes = {k: str(v) for k, v in changes.items() if v is not None}
         for k, v in kwargs.items():
             if v is not None:
-                ldbmessage[k] = ldb.MessageElement(v, ldb.FLAG_MOD_REPLACE, k)
+                changes[k] = v
+        return changes
+
+    def get_object_by_dn(
+        self, dn: str, attrs: List[str], samdb: Optional[SamDB] = None
+    ) -> Optional[ldb.Message]:
+        samdb = samdb or self._reader
+        try:
+            lookup = samdb.search(dn, scope=ldb.SCOPE_BASE, attrs=attrs)
+        except ldb.LdbError as e:
+            if e.args[0] == ldb.ERR_NO_SUCH_OBJECT:
+                return None
+            raise
+        if len(lookup) == 0:
+            return None
+        return lookup[0]
+
+    @idempotent
+    def highest_committed_usn(self) -> Tuple[str, str]:
+        """Return `(dsServiceName, highestCommittedUSN)` of the connected DC."""
+        lookup = self._reader.search(
+            "",
+            scope=ldb.SCOPE_BASE,
+            attrs=["dsServiceName", "highestCommittedUSN"],
+        )
+        root = lookup[0]
+        return (
+            str(root.get("dsServiceName", idx=0)),
+            str(root.get("highestCommittedUSN", idx=0)),
+        )
+
+    def _user_dn(self, username: str) -> Optional[str]:
+        lookup = self._client.search(
+            self._client.domain_dn(),
+            scope=ldb.SCOPE_SUBTREE,
+            expression=f"(sAMAccountName={username})",
+            attrs=["dn"],
+        )
+        if len(lookup) == 0:
+            return None
+        return str(lookup[0].dn)
+
+    def _check_precondition(self, username: str, if_match: Tuple[str, str, str]):
+        dn, usn, dc = if_match
+        writer = self._client
+        attrs = ["sAMAccountName", "uSNChanged", "replPropertyMetaData"]
+        if dc == self.write_dc:
+            issued = current = self.get_object_by_dn(dn, attrs, samdb=writer)
+        else:
+            host = self.host_for_tag(dc)
+            if not host:
+                raise PreconditionFailed("`If-Match` was issued by an unknown DC")
+            issued = self.get_object_by_dn(dn, attrs, samdb=self.connection(host))
+            current = self.get_object_by_dn(dn, attrs, samdb=writer)
+        if (
+            not issued
+            or not current
+            or str(current.get("sAMAccountName", idx=0)).lower() != username.lower()
+        ):
+            raise SambaClientError(f"user with this `{username}` not found")
+        if str(issued.get("uSNChanged", idx=0)) != usn or (
+            issued is not current
+            and _replicated_version(issued) != _replicated_version(current)
+        ):
+            raise PreconditionFailed(
+                f"user `{username}` was modified by another request"
+            )
+
+    def modify_user(
+        self,
+        username: str,
+        attrs: Optional[List[str]] = None,
+        if_match: Optional[Tuple[str, str, str]] = None,
+        **kwargs,
+    ) -> ldb.Message:
+        """Apply the changes in one modify and return a base-scope read of the user.
 
+        `if_match` is the `(dn, uSNChanged, dc)` the caller last saw. It is
+        checked on the write DC inside the modify's transaction, and a mismatch
+        raises `PreconditionFailed` instead of overwriting a concurrent edit.
+        USNs are per DC, so an ETag issued by another DC must still match there
+        and the write DC must hold the very same replicated version.
+        """
         with self.transaction():
-            self._client.modify(ldbmessage)
-        user_obj = self.get_user_by_username(username)
+            if if_match:
+                dn = if_match[0]
+                self._check_precondition(username, if_match)
+            else:
+                dn = self._user_dn(username)
+                if not dn:
+                    raise SambaClientError(f"user with this `{username}` exists")
+            changes = self._user_changes(**kwargs)
+            if changes:
+                ldbmessage = ldb.Message()
+                ldbmessage.dn = ldb.Dn(self._client, dn)
+                for k, v in changes.items():
+                    ldbmessage[k] = ldb.MessageElement(v, ldb.FLAG_MOD_REPLACE, k)
+                self._client.modify(ldbmessage)
+            user_obj = self.get_object_by_dn(dn, attrs or ["*"], samdb=self._client)
         if not user_obj:
             raise SambaClientError(
                 f"user with this `{username}` exists after update..."
             )
         return user_obj
 
-    def search_by_dn(self, dn: str, object_classes: list, attrs: Optional[list] = None):
+    @idempotent
+    def search_by_dn(
+        self,
+        dn: str,
+        object_classes: list,
+        attrs: Optional[list] = None,
+        scope: str = "subtree",
+        max_depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ):
         object_classese_query = "".join(f"(objectclass={oc})" for oc in object_classes)
         if len(object_classes) == 1:
             search_filter = f"{object_classese_query}"
@@ -426,32 +1365,160 @@ class SambaClient(object):
             query_attrs = list(set(default_attrs + attrs))
         else:
             query_attrs = default_attrs
-        with self.transaction():
-            lookup = self._client.search(
-                dn,
-                scope=ldb.SCOPE_SUBTREE,
-                expression=search_filter,
-                attrs=query_attrs,
+        if scope == "subtree" and max_depth == 0:
+            scope = "base"
+        with self.transaction(self._reader):
+            if scope == "subtree" and max_depth is not None:
+                entries = self._search_levels(
+                    dn, search_filter, query_attrs, object_classes, max_depth
+                )
+            else:
+                entries = self.paged_search(
+                    search_filter, query_attrs, base=dn, scope=SEARCH_SCOPES[scope]
+                )
+            stop = None if limit is None else offset + limit
+            return list(islice(entries, offset, stop))
+
+    def _search_levels(
+        self,
+        dn: str,
+        search_filter: str,
+        attrs: List[str],
+        wanted_classes: List[str],
+        max_depth: int,
+    ) -> Iterator[ldb.Message]:
+        """Breadth first search below `dn`, at most `max_depth` levels deep.
+
+        Only containers are descended into, so the cost is proportional to
+        the entries within the depth rather than to the whole subtree.
+        """
+        wanted = {oc.lower() for oc in wanted_classes}
+        containers = "".join(f"(objectclass={oc})" for oc in CONTAINER_CLASSES)
+        level_filter = f"(|{search_filter}{containers})"
+        yield from self.paged_search(
+            search_filter, attrs, base=dn, scope=ldb.SCOPE_BASE
+        )
+        level = [dn]
+        for depth in range(1, max_depth + 1):
+            next_level = []
+            for parent in level:
+                for entry in self.paged_search(
+                    level_filter, attrs, base=parent, scope=ldb.SCOPE_ONELEVEL
+                ):
+                    classes = object_classes(entry)
+                    if classes & wanted:
+                        yield entry
+                    if depth < max_depth and classes & CONTAINER_CLASSES:
+                        next_level.append(str(entry.dn))
+            level = next_level
+
+    @idempotent
+    def domain_info(self) -> DomainInfo:
+        """Domain constants and attribute decoders, read once per process."""
+        return registry.load(self._reader, self.paged_search)
+
+    def domain_dn(self) -> str:
+        return self.domain_info().domain_dn
+
+    def changed_since(
+        self, expression: str, attrs: List[str], since_usn: Optional[int] = None
+    ) -> Iterator[ldb.Message]:
+        """Paged scan of `expression` below the domain.
+
+        With `since_usn` only entries changed after that USN are returned,
+        tombstones of deleted entries included.
+        """
+        controls = None
+        if since_usn is not None:
+            expression = f"(&(uSNChanged>={since_usn + 1}){expression})"
+            controls = ["show_deleted:1"]
+        return self.paged_search(expression, attrs, controls=controls)
+
+    @staticmethod
+    def _since_filter(
+        since_usn: Optional[int] = None, since_time: Optional[datetime] = None
+    ) -> str:
+        terms = ""
+        if since_usn is not None:
+            terms += f"(uSNChanged>={since_usn + 1})"
+        if since_time is not None:
+            terms += "(whenChanged>=%s)" % ldb.timestring(int(since_time.timestamp()))
+        return terms
+
+    @idempotent
+    def delta_search(
+        self,
+        object_filter: str,
+        list_filter: str,
+        attrs: List[str],
+        since_usn: Optional[int] = None,
+        since_time: Optional[datetime] = None,
+        expiring: bool = False,
+    ) -> Tuple[int, List[ldb.Message], List[ldb.Message]]:
+        """Entries of `list_filter` changed after `since_usn` / since `since_time`.
+
+        Also returns the entries of `object_filter` which left the list in
+        that time: tombstones of deleted ones and ones which changed so they
+        no longer match `list_filter`. The highestCommittedUSN returned as
+        the next cursor is read first, so a change racing with the scan is
+        sent again next time instead of being lost.
+
+        With `expiring`, `list_filter` drops expired accounts. Expiry does not
+        change an entry, so accounts whose `accountExpires` passed since
+        `since_time` are returned as removed too. A USN has no time, so
+        deltas by `since_usn` alone do not see expiry.
+        """
+        since = self._since_filter(since_usn, since_time)
+        with self.transaction(self._reader):
+            root = self.get_object_by_dn("", ["highestCommittedUSN"])
+            usn = int(root.get("highestCommittedUSN", idx=0))
+            changed = list(self.paged_search(f"(&{list_filter}{since})", attrs))
+            if not since:
+                return usn, changed, []
+            left = f"(&{since}(|(isDeleted=TRUE)(!{list_filter})))"
+            if expiring and since_time is not None:
+                left = "(|%s(&(accountExpires>=%u)(accountExpires<%u)))" % (
+                    left,
+                    unix2nttime(since_time.timestamp()),
+                    self._reader.get_nttime(),
+                )
+            removed = list(
+                self.paged_search(
+                    f"(&{object_filter}{left})",
+                    TOMBSTONE_ATTRS,
+                    controls=["show_deleted:1"],
+                )
             )
-            return [entry for entry in lookup]
+        return usn, changed, removed
+
+    def ou_tree_objects(self, since_usn: Optional[int] = None) -> Iterator[ldb.Message]:
+        """Projected scan of the OUs and the users, groups and computers in them."""
+        # computers are users too
+        return self.changed_since(
+            "(|(objectClass=organizationalUnit)(objectClass=user)(objectClass=group))",
+            ["objectClass", "objectGUID", "name", "description", "isDeleted"],
+            since_usn=since_usn,
+        )
 
+    @idempotent
     def list_ou(self) -> list:
         result = []
-        with self.transaction():
-            search_dn = self._client.domain_dn()
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
             filter_str = "(objectclass=organizationalUnit)"
-            lookup = self._client.search(
+            lookup = self._reader.search(
                 search_dn, scope=ldb.SCOPE_SUBTREE, expression=filter_str, attrs=[]
             )
             return [entry for entry in lookup]
 
         return result
 
+    @idempotent
     def get_ou(self, name) -> Optional[ldb.Message]:
-        with self.transaction():
-            search_dn = self._client.domain_dn()
+        with self.transaction(self._reader):
+            search_dn = self._reader.domain_dn()
             filter_str = f"(&(objectclass=organizationalUnit)(name={name}))"
-            lookup = self._client.search(
+            lookup = self._reader.search(
                 search_dn, scope=ldb.SCOPE_SUBTREE, expression=filter_str, attrs=[]
             )
             if len(lookup) == 0:
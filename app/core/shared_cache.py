@@ -0,0 +1,135 @@
+import os
+import pickle
+import stat
+import threading
+import time
+from hashlib import sha256
+from typing import Any, Callable, Hashable, Optional
+
+import lmdb
+
+from app.config.settings import SHARED_CACHE_PATH, SHARED_CACHE_SIZE_MB
+
+__all__ = ("SharedCache", "shared_cache")
+
+# returned by `get` for a key which is not cached, `None` is a cacheable result
+MISSING = object()
+# share of the entries, oldest first, dropped when the map is full
+EVICT_SHARE = 0.25
+
+
+def _private_dir(path: str):
+    """Create `path` as 0700 or check an existing one is ours alone."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise RuntimeError(
+            f"`{path}` must be a directory only the API's own user can access"
+        )
+
+
+class SharedCache(object):
+    """Read cache shared by the worker processes of a host through LMDB.
+
+    Every worker maps the same LMDB file, so a result one worker fetched
+    from the DC is served to the others. Reads unpickle straight from the
+    memory map, nothing is copied out of it first. Keys must pin the
+    directory state they were read at, like the list ETags do with the
+    DC and its `highestCommittedUSN`, so entries never go stale; when the
+    map is full the oldest entries are dropped. With an empty `path` every
+    call just loads.
+
+    Unpickling runs code, so whoever can write the file can run code in the
+    API: the file is only trusted inside a directory private to the API's
+    user, which is created as 0700 and refused when others can get in.
+    """
+
+    def __init__(self, path: str, size_mb: int):
+        self.path = path
+        self.map_size = size_mb * 1024 * 1024
+        self._env: Optional[lmdb.Environment] = None
+        self._values = None
+        # write time + key, so a cursor walks the entries oldest first
+        self._ages = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _open(self) -> lmdb.Environment:
+        # opened on first use, which is after gunicorn forked the workers;
+        # an environment must not be carried across fork
+        if self._env is None:
+            with self._lock:
+                if self._env is None:
+                    _private_dir(os.path.dirname(os.path.abspath(self.path)))
+                    env = lmdb.open(
+                        self.path,
+                        map_size=self.map_size,
+                        mode=0o700,
+                        max_dbs=2,
+                        max_readers=512,
+                        metasync=False,
+                        sync=False,
+                    )
+                    self._values = env.open_db(b"values")
+                    self._ages = env.open_db(b"ages")
+                    self._env = env
+        return self._env
+
+    @staticmethod
+    def _key(key: Hashable) -> bytes:
+        return sha256(repr(key).encode()).digest()
+
+    def get(self, key: Hashable) -> Any:
+        """The cached value of `key`, or `MISSING`."""
+        env = self._open()
+        with env.begin(db=self._values, buffers=True) as txn:
+            value = txn.get(self._key(key))
+            # the buffer points into the map and is only valid in the txn
+            return MISSING if value is None else pickle.loads(value)
+
+    def put(self, key: Hashable, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        env = self._open()
+        try:
+            self._put(env, self._key(key), data)
+        except lmdb.MapFullError:
+            # LMDB keeps the previous snapshot, so the freed pages are only
+            # reusable a transaction later; still full, the value is not kept
+            try:
+                self._evict(env)
+                self._put(env, self._key(key), data)
+            except lmdb.MapFullError:
+                pass
+
+    def _put(self, env: lmdb.Environment, key: bytes, data: bytes):
+        with env.begin(write=True) as txn:
+            txn.put(key, data, db=self._values)
+            txn.put(time.time_ns().to_bytes(8, "big") + key, b"", db=self._ages)
+
+    def _evict(self, env: lmdb.Environment):
+        with env.begin(write=True) as txn:
+            count = max(1, int(txn.stat(self._ages)["entries"] * EVICT_SHARE))
+            cursor = txn.cursor(db=self._ages)
+            cursor.first()
+            for _ in range(count):
+                age_key = cursor.key()
+                if not age_key:
+                    break
+                txn.delete(age_key[8:], db=self._values)
+                cursor.delete()
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return load()
+        value = self.get(key)
+        if value is MISSING:
+            value = load()
+            self.put(key, value)
+        return value
+
+
+# disabled with an empty SHARED_CACHE_PATH
+shared_cache = SharedCache(SHARED_CACHE_PATH, SHARED_CACHE_SIZE_MB)
@@ -0,0 +1,50 @@
+import asyncio
+from hashlib import sha256
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+__all__ = ("SingleFlight", "flight_key", "reads")
+
+
+def flight_key(current_user: dict, *args: Hashable) -> Tuple[Hashable, ...]:
+    """Key of a read under the authorization context of `current_user`.
+
+    The password is part of the key, so a caller only ever shares a result
+    with callers who bound with the same credentials. In service bind mode
+    everyone reads as the service account, so callers with the same
+    permissions share.
+    """
+    if current_user.get("password") is None:
+        return (tuple(current_user.get("permissions", ())),) + args
+    digest = sha256(current_user["password"].encode()).hexdigest()
+    return (current_user["username"], digest) + args
+
+
+class SingleFlight(object):
+    """Runs identical concurrent calls once and hands all callers its result.
+
+    The call runs in the thread pool as its own task, so a caller which goes
+    away does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # mark the error as retrieved when every caller is gone
+            task.exception()
+
+
+reads = SingleFlight()
@@ -0,0 +1,45 @@
+from typing import Optional, Tuple
+
+from fastapi import Query
+
+from app.config.settings import SEARCH_MAX_LIMIT
+
+__all__ = ("ATTR_NAME_REGEX", "ListWindow", "list_window")
+
+# LDAP attribute names; also keeps `:` out of the sort control string
+ATTR_NAME_REGEX = r"^[A-Za-z][A-Za-z0-9-]*$"
+
+
+class ListWindow(object):
+    """Sort order and `offset`/`count` slice requested for a list."""
+
+    def __init__(
+        self,
+        sort: Optional[str] = None,
+        descending: bool = False,
+        offset: int = 0,
+        count: Optional[int] = None,
+    ):
+        self.sort = sort
+        self.descending = descending
+        self.offset = offset
+        self.count = count
+
+    @property
+    def active(self) -> bool:
+        return self.sort is not None or self.count is not None or self.offset > 0
+
+    def key(self) -> Tuple:
+        """Part of cache keys and ETags, empty for the plain full list."""
+        if not self.active:
+            return ()
+        return (self.sort, self.descending, self.offset, self.count)
+
+
+def list_window(
+    sort: Optional[str] = Query(None, regex=ATTR_NAME_REGEX),
+    descending: bool = False,
+    offset: int = Query(0, ge=0),
+    count: Optional[int] = Query(None, ge=1, le=SEARCH_MAX_LIMIT),
+) -> ListWindow:
+    return ListWindow(sort=sort, descending=descending, offset=offset, count=count)
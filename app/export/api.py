@@ -0,0 +1,38 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+
+from app.user.security import get_current_user
+
+from .schemas import EXPORT_MEDIA_TYPES, ExportFormat, ExportObjectType
+from .services import manager
+
+api_router = APIRouter()
+
+
+@api_router.get(
+    "/{object_type}/",
+    response_class=StreamingResponse,
+)
+async def export_objects(
+    object_type: ExportObjectType,
+    format: ExportFormat = ExportFormat.csv,
+    attrs: Optional[List[str]] = Query(None),
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    content = await manager.export(
+        current_user, object_type, format, attrs=attrs, compress=gzip
+    )
+    filename = f"{object_type.value}.{format.value}"
+    if gzip:
+        filename = f"{filename}.gz"
+        media_type = "application/gzip"
+    else:
+        media_type = EXPORT_MEDIA_TYPES[format]
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,45 @@
+from enum import Enum
+
+
+class ExportObjectType(str, Enum):
+    users = "users"
+    groups = "groups"
+    ous = "ous"
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ldif = "ldif"
+
+
+DEFAULT_EXPORT_ATTRS = {
+    ExportObjectType.users: [
+        "sAMAccountName",
+        "userPrincipalName",
+        "displayName",
+        "givenName",
+        "sn",
+        "mail",
+        "telephoneNumber",
+        "department",
+        "title",
+        "userAccountControl",
+    ],
+    ExportObjectType.groups: [
+        "sAMAccountName",
+        "groupType",
+        "description",
+        "mail",
+        "member",
+    ],
+    ExportObjectType.ous: [
+        "ou",
+        "name",
+        "description",
+    ],
+}
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv",
+    ExportFormat.ldif: "text/x-ldif",
+}
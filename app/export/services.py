@@ -0,0 +1,106 @@
+import csv
+import io
+import zlib
+from base64 import b64encode
+from typing import Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.samba import PASSTHROUGH_ERRORS, SambaClient
+
+from .schemas import DEFAULT_EXPORT_ATTRS, ExportFormat, ExportObjectType
+
+# flush the output buffer once it grows past this many characters
+CHUNK_SIZE = 64 * 1024
+MULTI_VALUE_SEPARATOR = ";"
+
+
+def _value_to_str(value) -> str:
+    if isinstance(value, bytes):
+        try:
+            return value.decode()
+        except UnicodeDecodeError:
+            return b64encode(value).decode()
+    return str(value)
+
+
+class ExportService(object):
+    def _filter(self, client: SambaClient, object_type: ExportObjectType) -> str:
+        if object_type == ExportObjectType.users:
+            return client.users_filter()
+        if object_type == ExportObjectType.groups:
+            return "(objectclass=group)"
+        return "(objectclass=organizationalUnit)"
+
+    def _csv_rows(self, entries, attrs: List[str]) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["dn"] + attrs)
+        for entry in entries:
+            row = [str(entry.dn)]
+            for attr in attrs:
+                element = entry.get(attr)
+                if element is None:
+                    row.append("")
+                else:
+                    row.append(
+                        MULTI_VALUE_SEPARATOR.join(_value_to_str(v) for v in element)
+                    )
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def _ldif_rows(self, client: SambaClient, entries) -> Iterator[str]:
+        parts: List[str] = []
+        size = 0
+        for entry in entries:
+            ldif = client.entry_to_ldif(entry)
+            parts.append(ldif)
+            size += len(ldif)
+            if size >= CHUNK_SIZE:
+                yield "".join(parts)
+                parts, size = [], 0
+        yield "".join(parts)
+
+    def _encode(self, rows: Iterator[str], compress: bool) -> Iterator[bytes]:
+        if not compress:
+            for chunk in rows:
+                if chunk:
+                    yield chunk.encode()
+            return
+        # wbits=31 emits a gzip container instead of a raw zlib stream
+        compressor = zlib.compressobj(wbits=31)
+        for chunk in rows:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
+
+    async def export(
+        self,
+        current_user: dict,
+        object_type: ExportObjectType,
+        export_format: ExportFormat,
+        attrs: Optional[List[str]] = None,
+        compress: bool = False,
+    ) -> Iterator[bytes]:
+        client = SambaClient(**current_user)
+        export_attrs = attrs or DEFAULT_EXPORT_ATTRS[object_type]
+        try:
+            search_filter = self._filter(client, object_type)
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        entries = client.paged_search(search_filter, attrs=export_attrs)
+        if export_format == ExportFormat.csv:
+            rows = self._csv_rows(entries, export_attrs)
+        else:
+            rows = self._ldif_rows(client, entries)
+        return self._encode(rows, compress)
+
+
+manager = ExportService()
@@ -0,0 +1,27 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import StreamingResponse
+
+from app.user.security import get_current_user
+
+from .services import manager
+
+api_router = APIRouter()
+
+
+@api_router.get(
+    "/changes/",
+    response_class=StreamingResponse,
+)
+async def changes(
+    cursor: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    stream = await manager.subscribe(current_user, cursor=last_event_id or cursor)
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
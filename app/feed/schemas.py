@@ -0,0 +1,18 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class FeedEvent(BaseModel):
+    """`data` of one change feed event, its `id` is the resume cursor."""
+
+    id: str
+    type: str
+    usn: int
+    n: int
+    objectClass: Optional[str] = None
+    dn: Optional[str] = None
+    guid: Optional[str] = None
+    name: Optional[str] = None
+    # the member DN of `member_add` / `member_remove`
+    member: Optional[str] = None
@@ -0,0 +1,66 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.config.settings import FEED_ALLOWED_GROUP, FEED_KEEPALIVE_SECONDS
+from app.core.samba import PASSTHROUGH_ERRORS, SambaClient
+
+from .schemas import FeedEvent
+from .watcher import watcher
+
+
+def _sse(event: dict) -> bytes:
+    data = FeedEvent(**event).json(exclude_none=True)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode()
+
+
+class FeedService(object):
+    @staticmethod
+    def _allowed(current_user: dict) -> bool:
+        client = SambaClient(**current_user)
+        return client.is_member_of(current_user["username"], FEED_ALLOWED_GROUP)
+
+    async def subscribe(
+        self, current_user: dict, cursor: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        if watcher is None:
+            raise HTTPException(503, "change feed is not configured")
+        try:
+            allowed = await run_in_threadpool(self._allowed, current_user)
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        if not allowed:
+            raise HTTPException(
+                403, f"change feed is limited to `{FEED_ALLOWED_GROUP}`"
+            )
+        try:
+            queue, replay = await watcher.subscribe(cursor)
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        return self._stream(queue, replay)
+
+    async def _stream(self, queue: asyncio.Queue, replay: list) -> AsyncIterator[bytes]:
+        try:
+            for event in replay:
+                yield _sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    # fell behind, the client reconnects with Last-Event-ID
+                    break
+                yield _sse(event)
+        finally:
+            watcher.unsubscribe(queue)
+
+
+manager = FeedService()
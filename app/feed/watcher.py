@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import uuid
+from collections import deque
+from hashlib import sha1
+from typing import Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+import ldb
+from fastapi.concurrency import run_in_threadpool
+
+from app.config.settings import (
+    FEED_BACKLOG_SIZE,
+    FEED_POLL_SECONDS,
+    FEED_QUEUE_SIZE,
+    SAMBA_SERVICE_PASSWORD,
+    SAMBA_SERVICE_USERNAME,
+)
+from app.core.samba import SambaClient, object_classes
+
+__all__ = ("ChangeWatcher", "parse_cursor", "watcher")
+
+logger = logging.getLogger(__name__)
+
+FEED_FILTER = "(|(objectClass=user)(objectClass=group)(objectClass=organizationalUnit))"
+FEED_ATTRS = [
+    "objectGUID",
+    "objectClass",
+    "name",
+    "sAMAccountName",
+    "member",
+    "isDeleted",
+    "uSNCreated",
+    "uSNChanged",
+]
+
+CREATE = "create"
+MODIFY = "modify"
+DELETE = "delete"
+MEMBER_ADD = "member_add"
+MEMBER_REMOVE = "member_remove"
+# the cursor of the client cannot be resumed, it has to resync
+RESET = "reset"
+
+# longest wait between polls while they keep failing
+MAX_POLL_BACKOFF = 60.0
+
+
+def parse_cursor(cursor: str) -> Optional[Tuple[str, int, int]]:
+    """`<dc>:<usn>:<n>` event id -> `(dc, usn, n)` or None."""
+    parts = cursor.split(":")
+    if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return parts[0], int(parts[1]), int(parts[2])
+
+
+def _guid(entry: ldb.Message) -> str:
+    value = entry.get("objectGUID", idx=0)
+    if isinstance(value, bytes) and len(value) == 16:
+        return str(uuid.UUID(bytes_le=value))
+    return str(value)
+
+
+def _text(entry: ldb.Message, attr: str) -> Optional[str]:
+    value = entry.get(attr, idx=0)
+    if isinstance(value, bytes):
+        return value.decode(errors="ignore")
+    return None if value is None else str(value)
+
+
+def _members(entry: ldb.Message) -> Set[str]:
+    return {
+        m.decode() if isinstance(m, bytes) else str(m) for m in entry.get("member", [])
+    }
+
+
+def _kind(classes: set) -> str:
+    for kind in ("computer", "user", "group"):
+        if kind in classes:
+            return kind
+    return "organizationalUnit"
+
+
+class ChangeWatcher(object):
+    """One uSNChanged poller per process, fanned out to feed subscribers.
+
+    The watcher keeps a single connection to one DC, since USNs are per DC,
+    and turns the entries changed since its cursor into create, modify,
+    delete and group membership events. Membership changes are found by
+    diffing the member values against the ones seen before. Recent events
+    are kept in a backlog so subscribers can resume from an event id.
+    """
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        poll_seconds: float,
+        backlog_size: int,
+        queue_size: int,
+    ):
+        self.username = username
+        self.password = password
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.dc: Optional[str] = None
+        self.usn = 0
+        self._client: Optional[SambaClient] = None
+        self._members: Dict[Hashable, Set[str]] = {}
+        self._backlog: Deque[dict] = deque(maxlen=backlog_size)
+        # position of the newest event which is no longer in the backlog
+        self._floor = (0, 0)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Future] = None
+        self._connecting: Optional[asyncio.Lock] = None
+
+    async def subscribe(
+        self, cursor: Optional[str] = None
+    ) -> Tuple[asyncio.Queue, List[dict]]:
+        """Register a subscriber; returns its queue and the events to replay."""
+        if self._connecting is None:
+            # created here to bind to the serving event loop
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self.dc is None:
+                # the cursor can only be checked once the DC is known
+                for event in await run_in_threadpool(self._poll):
+                    self._publish(event)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return queue, self._replay(cursor)
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _replay(self, cursor: Optional[str]) -> List[dict]:
+        if not cursor:
+            return []
+        parsed = parse_cursor(cursor)
+        if parsed is None or parsed[0] != self.dc or parsed[1:] < self._floor:
+            return [self._reset_event()]
+        position = parsed[1:]
+        return [e for e in self._backlog if (e["usn"], e["n"]) > position]
+
+    def _reset_event(self) -> dict:
+        return {
+            "id": f"{self.dc}:{self.usn}:0",
+            "type": RESET,
+            "usn": self.usn,
+            "n": 0,
+        }
+
+    async def _run(self):
+        failures = 0
+        try:
+            while self._subscribers:
+                try:
+                    events = await run_in_threadpool(self._poll)
+                    failures = 0
+                except Exception:
+                    logger.exception("feed poll of dc `%s` failed", self.dc)
+                    # reconnect, possibly to another DC, on the next round
+                    self._client = None
+                    events = []
+                    failures += 1
+                for event in events:
+                    self._publish(event)
+                await asyncio.sleep(self._delay(failures))
+        finally:
+            self._task = None
+
+    def _delay(self, failures: int) -> float:
+        """Seconds until the next poll, doubling with each failure in a row."""
+        if not failures:
+            return self.poll_seconds
+        return min(self.poll_seconds * 2 ** failures, MAX_POLL_BACKOFF)
+
+    def _publish(self, event: dict):
+        if len(self._backlog) == self._backlog.maxlen:
+            oldest = self._backlog[0]
+            self._floor = (oldest["usn"], oldest["n"])
+        self._backlog.append(event)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # too slow: end its stream, it resumes from the backlog
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def _poll(self) -> List[dict]:
+        if self._client is None:
+            return self._connect()
+        events: List[dict] = []
+        usn = self.usn
+        # member sets seen by this scan, None for deleted groups; kept apart
+        # until the scan is done, so a poll failing halfway is simply redone
+        seen: Dict[Hashable, Optional[Set[str]]] = {}
+        for entry in self._client.changed_since(
+            FEED_FILTER, FEED_ATTRS, since_usn=self.usn
+        ):
+            changed = int(entry.get("uSNChanged", idx=0))
+            usn = max(usn, changed)
+            events.extend(self._entry_events(entry, changed, seen))
+        for guid, members in seen.items():
+            if members is None:
+                self._members.pop(guid, None)
+            else:
+                self._members[guid] = members
+        events.sort(key=lambda e: e["usn"])
+        n = 0
+        for i, event in enumerate(events):
+            # events of one change share its USN, `n` orders them
+            n = n + 1 if i and events[i - 1]["usn"] == event["usn"] else 0
+            event["n"] = n
+            event["id"] = f"{self.dc}:{event['usn']}:{n}"
+        self.usn = usn
+        return events
+
+    def _connect(self) -> List[dict]:
+        client = SambaClient(self.username, self.password)
+        server, usn = client.highest_committed_usn()
+        dc = sha1(server.encode()).hexdigest()[:8]
+        self._client = client
+        if dc == self.dc:
+            # reconnected to the same DC, carry on from the cursor
+            return []
+        self._members = {
+            _guid(entry): _members(entry)
+            for entry in client.changed_since(
+                "(objectClass=group)", ["objectGUID", "member"]
+            )
+        }
+        had_dc = self.dc is not None
+        self.dc = dc
+        self.usn = int(usn)
+        self._backlog.clear()
+        self._floor = (self.usn, 0)
+        # cursors of the previous DC mean nothing here
+        return [self._reset_event()] if had_dc else []
+
+    def _entry_events(
+        self,
+        entry: ldb.Message,
+        usn: int,
+        seen: Dict[Hashable, Optional[Set[str]]],
+    ) -> List[dict]:
+        classes = object_classes(entry)
+        guid = _guid(entry)
+        base = {
+            "usn": usn,
+            "objectClass": _kind(classes),
+            "dn": str(entry.dn),
+            "guid": guid,
+            "name": _text(entry, "sAMAccountName") or _text(entry, "name"),
+        }
+        if str(entry.get("isDeleted", idx=0)).upper() == "TRUE":
+            seen[guid] = None
+            return [dict(base, type=DELETE)]
+        created = int(entry.get("uSNCreated", idx=0) or 0) > self.usn
+        events = [dict(base, type=CREATE if created else MODIFY)]
+        if "group" in classes:
+            members = _members(entry)
+            previous = seen[guid] if guid in seen else self._members.get(guid)
+            seen[guid] = members
+            previous = previous or set()
+            events.extend(
+                dict(base, type=MEMBER_ADD, member=m)
+                for m in sorted(members - previous)
+            )
+            events.extend(
+                dict(base, type=MEMBER_REMOVE, member=m)
+                for m in sorted(previous - members)
+            )
+        return events
+
+
+watcher = (
+    ChangeWatcher(
+        SAMBA_SERVICE_USERNAME,
+        SAMBA_SERVICE_PASSWORD,
+        FEED_POLL_SECONDS,
+        FEED_BACKLOG_SIZE,
+        FEED_QUEUE_SIZE,
+    )
+    if SAMBA_SERVICE_USERNAME
+    else None
+)
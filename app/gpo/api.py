@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends
 
 from app.user.security import get_current_user
+from .schemas import GPODetail
 from .services import manager
 
 
@@ -12,3 +13,11 @@ api_router = APIRouter()
 )
 async def list_gpo(current_user: dict = Depends(get_current_user)):
     return await manager.list_gpo(current_user)
+
+
+@api_router.get(
+    "/detail/",
+    response_model=GPODetail,
+)
+async def get_gpo(name: str, current_user: dict = Depends(get_current_user)):
+    return await manager.get_gpo(current_user, name)
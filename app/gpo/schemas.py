@@ -0,0 +1,56 @@
+from typing import Optional, List, Any
+
+from pydantic import BaseModel
+
+
+class GPTInfo(BaseModel):
+    version: int
+    user_version: int
+    machine_version: int
+    display_name: Optional[str] = None
+
+
+class RegistrySetting(BaseModel):
+    key: str
+    value_name: str
+    type: str
+    data: Any
+
+
+class GPOScript(BaseModel):
+    event: str
+    order: int
+    cmd_line: Optional[str] = None
+    parameters: Optional[str] = None
+
+
+class GPOScopeSettings(BaseModel):
+    registry: List[RegistrySetting] = []
+    scripts: List[GPOScript] = []
+
+
+class GPODetail(BaseModel):
+    gpo: str
+    displayname: str
+    path: str
+    dn: str
+    version: str
+    flags: str
+    gpt: GPTInfo
+    machine: GPOScopeSettings
+    user: GPOScopeSettings
+
+    @classmethod
+    def from_gpo(cls, gpo: dict, files: dict) -> "GPODetail":
+        return cls(
+            **gpo,
+            gpt=GPTInfo(**files["gpt"]),
+            machine=GPOScopeSettings(
+                registry=files["registry"]["machine"],
+                scripts=files["scripts"]["machine"],
+            ),
+            user=GPOScopeSettings(
+                registry=files["registry"]["user"],
+                scripts=files["scripts"]["user"],
+            ),
+        )
@@ -1,4 +1,9 @@
-from app.core.samba import SambaClient
+from fastapi import HTTPException
+
+from app.core.samba import PASSTHROUGH_ERRORS, SambaClient
+
+from .schemas import GPODetail
+from .sysvol import SysvolError, read_gpo_files
 
 
 class GPOService(object):
@@ -6,5 +11,21 @@ class GPOService(object):
         client = SambaClient(**current_user)
         return client.list_gpo()
 
+    async def get_gpo(self, current_user: dict, name: str) -> GPODetail:
+        client = SambaClient(**current_user)
+        try:
+            gpo = client.get_gpo(name)
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        if not gpo:
+            raise HTTPException(404, f"gpo with name `{name}` does not exists.")
+        try:
+            files = read_gpo_files(gpo["path"], gpo["version"])
+        except SysvolError as e:
+            raise HTTPException(404, str(e))
+        return GPODetail.from_gpo(gpo, files)
+
 
 manager = GPOService()
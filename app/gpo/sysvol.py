@@ -0,0 +1,264 @@
+import mmap
+import os
+import struct
+import threading
+from configparser import ConfigParser, Error as ConfigParserError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config.settings import SYSVOL_PATH
+
+__all__ = ("SysvolError", "read_gpo_files")
+
+REG_TYPES = {
+    0: "REG_NONE",
+    1: "REG_SZ",
+    2: "REG_EXPAND_SZ",
+    3: "REG_BINARY",
+    4: "REG_DWORD",
+    5: "REG_DWORD_BIG_ENDIAN",
+    6: "REG_LINK",
+    7: "REG_MULTI_SZ",
+    11: "REG_QWORD",
+}
+
+POL_SIGNATURE = b"PReg"
+POL_OPEN = "[".encode("utf-16-le")
+POL_SEP = ";".encode("utf-16-le")
+POL_CLOSE = "]".encode("utf-16-le")
+UTF16_NULL = b"\x00\x00"
+
+SCRIPT_FILES = ("scripts.ini", "psscripts.ini")
+
+
+class SysvolError(Exception):
+    pass
+
+
+class _ParsedFileCache(object):
+    """Parsed policy files keyed by path, invalidated by mtime/size/GPT version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[tuple, Any]] = {}
+
+    def get(self, path: str, version: str, parser: Callable[[mmap.mmap], Any]):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            raise SysvolError(f"cannot read `{path}`: {e}") from e
+        key = (stat.st_mtime_ns, stat.st_size, version)
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        try:
+            parsed = _map_file(path, stat.st_size, parser)
+        except OSError as e:
+            raise SysvolError(f"cannot read `{path}`: {e}") from e
+        with self._lock:
+            self._entries[path] = (key, parsed)
+        return parsed
+
+
+_cache = _ParsedFileCache()
+
+
+def _map_file(path: str, size: int, parser: Callable[[mmap.mmap], Any]):
+    if size == 0:
+        return None
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return parser(mm)
+
+
+def _decode_text(raw: bytes) -> str:
+    if raw.startswith(b"\xff\xfe") or raw.startswith(b"\xfe\xff"):
+        return raw.decode("utf-16")
+    if raw.startswith(b"\xef\xbb\xbf"):
+        return raw[3:].decode("utf-8", errors="replace")
+    if len(raw) > 1 and raw[1:2] == b"\x00":
+        return raw.decode("utf-16-le", errors="replace")
+    return raw.decode("utf-8", errors="replace")
+
+
+def _read_ini(mm: mmap.mmap) -> ConfigParser:
+    config = ConfigParser(interpolation=None, strict=False)
+    config.optionxform = str  # type: ignore
+    try:
+        config.read_string(_decode_text(mm[:]).replace("\x00", ""))
+    except (ConfigParserError, UnicodeDecodeError) as e:
+        raise SysvolError(f"malformed ini file: {e}") from e
+    return config
+
+
+def parse_gpt_ini(mm: mmap.mmap) -> dict:
+    config = _read_ini(mm)
+    section = config["General"] if config.has_section("General") else {}
+    try:
+        version = int(section.get("Version", "0") or 0)
+    except ValueError as e:
+        raise SysvolError(f"malformed GPT.INI version: {e}") from e
+    return {
+        "version": version,
+        "user_version": version >> 16,
+        "machine_version": version & 0xFFFF,
+        "display_name": section.get("displayName"),
+    }
+
+
+def _find_utf16_null(mm: mmap.mmap, pos: int) -> int:
+    idx = mm.find(UTF16_NULL, pos)
+    while idx != -1 and (idx - pos) % 2:
+        idx = mm.find(UTF16_NULL, idx + 1)
+    if idx == -1:
+        raise SysvolError("unterminated string in Registry.pol")
+    return idx
+
+
+def _expect(mm: mmap.mmap, pos: int, token: bytes) -> int:
+    if mm[pos : pos + len(token)] != token:
+        raise SysvolError(f"malformed Registry.pol at offset {pos}")
+    return pos + len(token)
+
+
+def _read_u32(mm: mmap.mmap, pos: int) -> int:
+    if pos + 4 > len(mm):
+        raise SysvolError(f"truncated Registry.pol at offset {pos}")
+    return struct.unpack_from("<I", mm, pos)[0]
+
+
+def _decode_reg_value(reg_type: int, data: bytes):
+    if reg_type in (1, 2, 6):
+        return data.decode("utf-16-le", errors="replace").rstrip("\x00")
+    if reg_type == 7:
+        value = data.decode("utf-16-le", errors="replace").rstrip("\x00")
+        return [v for v in value.split("\x00") if v]
+    if reg_type == 4 and len(data) >= 4:
+        return struct.unpack_from("<I", data)[0]
+    if reg_type == 5 and len(data) >= 4:
+        return struct.unpack_from(">I", data)[0]
+    if reg_type == 11 and len(data) >= 8:
+        return struct.unpack_from("<Q", data)[0]
+    return data.hex()
+
+
+def parse_registry_pol(mm: mmap.mmap) -> List[dict]:
+    if len(mm) < 8 or mm[:4] != POL_SIGNATURE:
+        raise SysvolError("Registry.pol has invalid signature")
+    try:
+        return _parse_registry_entries(mm)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise SysvolError(f"malformed Registry.pol: {e}") from e
+
+
+def _parse_registry_entries(mm: mmap.mmap) -> List[dict]:
+    settings = []
+    pos = 8
+    end = len(mm)
+    while pos < end:
+        pos = _expect(mm, pos, POL_OPEN)
+        key_end = _find_utf16_null(mm, pos)
+        key = mm[pos:key_end].decode("utf-16-le")
+        pos = _expect(mm, key_end + 2, POL_SEP)
+        value_end = _find_utf16_null(mm, pos)
+        value_name = mm[pos:value_end].decode("utf-16-le")
+        pos = _expect(mm, value_end + 2, POL_SEP)
+        reg_type = _read_u32(mm, pos)
+        pos = _expect(mm, pos + 4, POL_SEP)
+        size = _read_u32(mm, pos)
+        pos = _expect(mm, pos + 4, POL_SEP)
+        if pos + size > end:
+            raise SysvolError(f"truncated Registry.pol at offset {pos}")
+        data = mm[pos : pos + size]
+        pos = _expect(mm, pos + size, POL_CLOSE)
+        settings.append(
+            {
+                "key": key,
+                "value_name": value_name,
+                "type": REG_TYPES.get(reg_type, str(reg_type)),
+                "data": _decode_reg_value(reg_type, data),
+            }
+        )
+    return settings
+
+
+def parse_scripts_ini(mm: mmap.mmap) -> List[dict]:
+    config = _read_ini(mm)
+    scripts = []
+    for section in config.sections():
+        options = config[section]
+        idx = 0
+        while f"{idx}CmdLine" in options:
+            scripts.append(
+                {
+                    "event": section,
+                    "order": idx,
+                    "cmd_line": options.get(f"{idx}CmdLine"),
+                    "parameters": options.get(f"{idx}Parameters") or None,
+                }
+            )
+            idx += 1
+    return scripts
+
+
+def _resolve_ci(base: str, parts: List[str]) -> Optional[str]:
+    path = base
+    for part in parts:
+        candidate = os.path.join(path, part)
+        if not os.path.exists(candidate):
+            try:
+                names = os.listdir(path)
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+            except OSError as e:
+                raise SysvolError(f"cannot read `{path}`: {e}") from e
+            match = next((n for n in names if n.lower() == part.lower()), None)
+            if match is None:
+                return None
+            candidate = os.path.join(path, match)
+        path = candidate
+    return path
+
+
+def local_gpo_path(file_sys_path: str) -> str:
+    """Map a `gPCFileSysPath` UNC path onto the local SYSVOL share."""
+    parts = [p for p in file_sys_path.replace("/", "\\").split("\\") if p]
+    # drop `server` and `sysvol` share name: \\server\sysvol\domain\Policies\{GUID}
+    if len(parts) > 2 and parts[1].lower() == "sysvol":
+        parts = parts[2:]
+    if any(p in (".", "..") for p in parts):
+        raise SysvolError(f"invalid gpo path `{file_sys_path}`")
+    path = _resolve_ci(SYSVOL_PATH, parts)
+    if path is None or not os.path.isdir(path):
+        raise SysvolError(f"gpo folder for `{file_sys_path}` not found in sysvol")
+    return path
+
+
+def read_gpo_files(file_sys_path: str, ldap_version: str) -> dict:
+    gpo_path = local_gpo_path(file_sys_path)
+    gpt_ini = _resolve_ci(gpo_path, ["GPT.INI"])
+    gpt = (_cache.get(gpt_ini, ldap_version, parse_gpt_ini) if gpt_ini else None) or {
+        "version": 0,
+        "user_version": 0,
+        "machine_version": 0,
+    }
+    version = f"{ldap_version}:{gpt['version']}"
+
+    result: Dict[str, Any] = {"gpt": gpt, "registry": {}, "scripts": {}}
+    for scope in ("Machine", "User"):
+        pol_path = _resolve_ci(gpo_path, [scope, "Registry.pol"])
+        settings = (
+            _cache.get(pol_path, version, parse_registry_pol) if pol_path else None
+        )
+        result["registry"][scope.lower()] = settings or []
+        scripts: List[dict] = []
+        for script_file in SCRIPT_FILES:
+            script_path = _resolve_ci(gpo_path, [scope, "Scripts", script_file])
+            if script_path:
+                scripts.extend(
+                    _cache.get(script_path, version, parse_scripts_ini) or []
+                )
+        result["scripts"][scope.lower()] = scripts
+    return result
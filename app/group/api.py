@@ -1,14 +1,18 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 
 # from fastapi.exceptions import HTTPException
 from app.core.constants import DEFAULT_SUCCESS_RESPONSE
+from app.core.delta import DeltaQuery, delta_query
+from app.core.window import ListWindow, list_window
 
 from .schemas import (
     AddGroup,
     GroupUsersManage,
     GroupDetail,
+    GroupDelta,
+    GroupMembersReport,
 )
 from app.user.security import get_current_user
 from .services import manager
@@ -64,20 +68,53 @@ async def remove_users_from_group(
     return DEFAULT_SUCCESS_RESPONSE
 
 
+@api_router.post(
+    "/set_group_members/",
+    status_code=200,
+    response_model=GroupMembersReport,
+)
+async def set_group_members(
+    user_group_manage: GroupUsersManage,
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.set_group_members(current_user, user_group_manage)
+
+
 @api_router.get("/list/", status_code=200, response_model=List[GroupDetail])
 async def list_groups(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    window: ListWindow = Depends(list_window),
+    current_user: dict = Depends(get_current_user),
+):
+    groups, etag, total = await manager.list_groups(
+        current_user, if_none_match=if_none_match, window=window
+    )
+    response.headers["ETag"] = etag
+    response.headers["X-Total-Count"] = str(total)
+    return groups
+
+
+@api_router.get("/delta/", status_code=200, response_model=GroupDelta)
+async def list_groups_delta(
+    delta: DeltaQuery = Depends(delta_query),
     current_user: dict = Depends(get_current_user),
 ):
-    return await manager.list_groups(current_user)
+    return await manager.list_groups_delta(current_user, delta)
 
 
 @api_router.get("/get/", status_code=200, response_model=GroupDetail)
 async def get_group_by_name(
     name: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
 ):
-    group = await manager.get_group_by_name(current_user, name)
+    group, etag = await manager.get_group_by_name(
+        current_user, name, if_none_match=if_none_match
+    )
     if group:
+        response.headers["ETag"] = etag
         return group
     raise HTTPException(404, f"group with name `{name}` does not exists.")
 
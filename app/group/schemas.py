@@ -2,6 +2,8 @@ from typing import Optional, List
 
 from pydantic import BaseModel
 
+from app.core.delta import Tombstone
+
 
 class AddGroup(BaseModel):
     name: str
@@ -28,6 +30,12 @@ class GroupUsersManage(BaseModel):
     members: List[str]
 
 
+class GroupMembersReport(BaseModel):
+    added: int
+    removed: int
+    unchanged: int
+
+
 class GroupMemeber(BaseModel):
     usermame: str
     telephoneNumber: Optional[str]
@@ -42,6 +50,7 @@ class GroupDetail(BaseModel):
     description: Optional[str] = None
     mailaddress: Optional[str] = None
     notes: Optional[str] = None
+    uSNChanged: Optional[str] = None
 
     @classmethod
     def from_samba_message(cls, entry) -> "GroupDetail":
@@ -52,4 +61,13 @@ class GroupDetail(BaseModel):
             description=entry.get("description", idx=0),
             mailaddress=entry.get("mail", idx=0),
             notes=entry.get("info", idx=0),
+            uSNChanged=entry.get("uSNChanged", idx=0),
         )
+
+
+class GroupDelta(BaseModel):
+    dc: str
+    # `since_usn` of the next delta
+    highWaterMark: int
+    groups: List[GroupDetail]
+    removed: List[Tombstone]
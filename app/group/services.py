@@ -1,13 +1,25 @@
-from typing import Optional
+from typing import Optional, Tuple
 
 from fastapi import HTTPException
 
-from app.core.samba import SambaClient
+from app.core.delta import DeltaQuery, Tombstone, check_delta_dc, read_delta
+from app.core.etag import (
+    check_list_not_modified,
+    check_object_not_modified,
+    list_etag,
+    make_etag,
+)
+from app.core.samba import GROUP_LIST_ATTRS, PASSTHROUGH_ERRORS, SambaClient
+from app.core.shared_cache import shared_cache
+from app.core.singleflight import flight_key, reads
+from app.core.window import ListWindow
 
 from .schemas import (
     AddGroup,
     GroupUsersManage,
     GroupDetail,
+    GroupDelta,
+    GroupMembersReport,
 )
 
 
@@ -16,6 +28,8 @@ class GroupService(object):
         client = SambaClient(**current_user)
         try:
             client.add_group(add_group.to_request())
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -23,6 +37,8 @@ class GroupService(object):
         client = SambaClient(**current_user)
         try:
             client.delete_group(groupname)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -36,6 +52,8 @@ class GroupService(object):
             client.add_users_to_group(
                 user_group_manage.groupname, user_group_manage.members
             )
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -49,37 +67,124 @@ class GroupService(object):
             client.remove_users_from_group(
                 user_group_manage.groupname, user_group_manage.members
             )
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
+    async def set_group_members(
+        self,
+        current_user: dict,
+        user_group_manage: GroupUsersManage,
+    ) -> GroupMembersReport:
+        client = SambaClient(**current_user)
+        try:
+            report = client.set_group_members(
+                user_group_manage.groupname, user_group_manage.members
+            )
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        return GroupMembersReport(**report)
+
     async def list_groups(
         self,
         current_user: dict,
-    ) -> list:
+        if_none_match: Optional[str] = None,
+        window: ListWindow = ListWindow(),
+    ) -> Tuple[list, str, int]:
         client = SambaClient(**current_user)
         try:
-            result = client.list_groups()
-            return [GroupDetail.from_samba_message(row) for row in result]
+            server, usn = client.highest_committed_usn()
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
+        etag = list_etag(server, usn, "groups", current_user["username"], *window.key())
+        check_list_not_modified(if_none_match, etag)
+
+        def list_groups() -> Tuple[list, int]:
+            if window.active:
+                result, total = client.window_search(
+                    "(objectclass=group)",
+                    GROUP_LIST_ATTRS,
+                    window.sort or "sAMAccountName",
+                    descending=window.descending,
+                    offset=window.offset,
+                    count=window.count,
+                )
+            else:
+                result = client.list_groups()
+                total = len(result)
+            return [GroupDetail.from_samba_message(row) for row in result], total
+
+        try:
+            key = flight_key(current_user, "groups", etag)
+            groups, total = await reads.do(
+                key, shared_cache.get_or_load, key, list_groups
+            )
+            return groups, etag, total
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+
+    async def list_groups_delta(
+        self, current_user: dict, delta: DeltaQuery
+    ) -> GroupDelta:
+        client = SambaClient(**current_user)
+        key = flight_key(
+            current_user, "groups_delta", delta.since_usn, delta.since_time, delta.dc
+        )
+        try:
+            dc, usn, changed, removed = await reads.do(
+                key,
+                read_delta,
+                client,
+                delta,
+                "(objectclass=group)",
+                "(objectclass=group)",
+                GROUP_LIST_ATTRS,
+            )
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        check_delta_dc(delta, dc)
+        return GroupDelta(
+            dc=dc,
+            highWaterMark=usn,
+            groups=[GroupDetail.from_samba_message(e) for e in changed],
+            removed=[Tombstone.from_samba_message(e) for e in removed],
+        )
 
     async def list_users_by_group(self, current_user: dict, groupname: str) -> list:
         client = SambaClient(**current_user)
         try:
             result = client.list_users_by_group(groupname)
             return result
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
     async def get_group_by_name(
-        self, current_user: dict, groupname: str
-    ) -> Optional[GroupDetail]:
+        self,
+        current_user: dict,
+        groupname: str,
+        if_none_match: Optional[str] = None,
+    ) -> Tuple[Optional[GroupDetail], Optional[str]]:
         client = SambaClient(**current_user)
+        check_object_not_modified(client, if_none_match, "sAMAccountName", groupname)
         try:
             group = client.get_group_by_name(name=groupname)
             if group:
-                return GroupDetail.from_samba_message(group)
-            return None
+                detail = GroupDetail.from_samba_message(group)
+                return detail, make_etag(detail.dn, detail.uSNChanged, client.read_dc)
+            return None, None
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
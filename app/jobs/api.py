@@ -0,0 +1,73 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+
+from app.config.settings import IMPORT_CHUNK_SIZE
+from app.group.schemas import GroupUsersManage
+from app.user.schemas import ImportFormat, MoveUserOU
+from app.user.security import get_current_user
+
+from .schemas import JobDetail, JobProgress
+from .services import manager
+
+api_router = APIRouter()
+
+
+@api_router.post("/move_user_ou/", status_code=202, response_model=JobDetail)
+async def submit_move_user_ou(
+    moves: List[MoveUserOU],
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.submit_move_user_ou(current_user, moves)
+
+
+@api_router.post("/add_users_to_group/", status_code=202, response_model=JobDetail)
+async def submit_add_users_to_group(
+    user_group_manage: GroupUsersManage,
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.submit_group_members(
+        current_user, user_group_manage, to_add=True
+    )
+
+
+@api_router.post("/remove_users_from_group/", status_code=202, response_model=JobDetail)
+async def submit_remove_users_from_group(
+    user_group_manage: GroupUsersManage,
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.submit_group_members(
+        current_user, user_group_manage, to_add=False
+    )
+
+
+@api_router.post("/import_users/", status_code=202, response_model=JobDetail)
+async def submit_import_users(
+    format: ImportFormat = ImportFormat.csv,
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1),
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.submit_import_users(
+        current_user, file.file, import_format=format, chunk_size=chunk_size
+    )
+
+
+@api_router.get("/list/", response_model=List[JobDetail])
+async def list_jobs(current_user: dict = Depends(get_current_user)):
+    return await manager.list_jobs(current_user)
+
+
+@api_router.get("/get/", response_model=JobDetail)
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await manager.get_job(current_user, job_id)
+
+
+@api_router.get("/progress/", response_model=JobProgress)
+async def get_job_progress(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await manager.get_progress(current_user, job_id)
+
+
+@api_router.post("/cancel/", response_model=JobDetail)
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    return await manager.cancel_job(current_user, job_id)
@@ -0,0 +1,377 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from app.config.settings import JOBS_DB_PATH, JOBS_KEEP_DAYS, JOBS_MAX_WORKERS
+
+__all__ = ("JobCancelled", "JobContext", "JobStore", "JobRunner", "runner")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+# how often a running job re-reads its cancel flag / writes its progress
+CANCEL_CHECK_INTERVAL = 1.0
+PROGRESS_FLUSH_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    result TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    files TEXT,
+    boot TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+# the process behind each pid, so that a reused pid is not taken for the old one
+WORKERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    boot TEXT NOT NULL
+)
+"""
+
+# identifies this process among all that ever had its pid
+BOOT_ID = uuid.uuid4().hex
+
+
+def _new_boot_id():
+    global BOOT_ID
+    BOOT_ID = uuid.uuid4().hex
+
+
+# gunicorn --preload forks the workers after this module was imported
+os.register_at_fork(after_in_child=_new_boot_id)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _remove_files(paths: List[str]):
+    """Remove the private files of a finished job."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore(object):
+    """Job table shared by all workers through a local sqlite database."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.execute(WORKERS_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "files" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN files TEXT")
+            if "boot" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN boot TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _update(self, job_id: str, **fields):
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+            )
+
+    def create(
+        self,
+        kind: str,
+        owner: str,
+        total: Optional[int] = None,
+        files: Optional[List[str]] = None,
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            self._register(conn)
+            conn.execute(
+                "INSERT INTO jobs "
+                "(id, kind, owner, status, pid, boot, total, files, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    kind,
+                    owner,
+                    QUEUED,
+                    os.getpid(),
+                    BOOT_ID,
+                    total,
+                    json.dumps(files) if files else None,
+                    time.time(),
+                ),
+            )
+        return job_id
+
+    @staticmethod
+    def _register(conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT OR REPLACE INTO workers (pid, boot) VALUES (?, ?)",
+            (os.getpid(), BOOT_ID),
+        )
+
+    def register_worker(self):
+        """Claim this pid, the jobs of an earlier process with it are orphans."""
+        with self._connect() as conn:
+            self._register(conn)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, owner: str, limit: int = 100) -> List[dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?",
+                (owner, limit),
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def start(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? "
+                "WHERE id = ? AND status = ? AND cancel_requested = 0",
+                (RUNNING, time.time(), job_id, QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def progress(self, job_id: str, done: int, total: Optional[int] = None):
+        if total is None:
+            self._update(job_id, done=done)
+        else:
+            self._update(job_id, done=done, total=total)
+
+    def finish(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[dict] = None,
+        error: Optional[str] = None,
+    ):
+        self._update(
+            job_id,
+            status=status,
+            result=json.dumps(result) if result is not None else None,
+            error=error,
+            finished_at=time.time(),
+        )
+
+    def request_cancel(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN (?, ?)",
+                (job_id, QUEUED, RUNNING),
+            )
+            # queued jobs never reach a worker thread, close them right away
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+        return cursor.rowcount == 1
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def mark_orphans_interrupted(self):
+        """Close jobs whose worker process is gone, e.g. after a gunicorn restart."""
+        with self._connect() as conn:
+            workers = {
+                r["pid"]: r["boot"]
+                for r in conn.execute("SELECT pid, boot FROM workers")
+                if _pid_alive(r["pid"])
+            }
+            conn.execute(
+                "DELETE FROM workers WHERE pid NOT IN (%s)"
+                % ", ".join("?" * len(workers)),
+                list(workers),
+            )
+            rows = conn.execute(
+                "SELECT id, pid, boot, files FROM jobs WHERE status IN (?, ?)",
+                (QUEUED, RUNNING),
+            ).fetchall()
+            # rows from before the boot column only have the pid to go by
+            orphans = [
+                r
+                for r in rows
+                if not _pid_alive(r["pid"])
+                or (r["boot"] is not None and workers.get(r["pid"]) != r["boot"])
+            ]
+            conn.executemany(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                [(INTERRUPTED, time.time(), r["id"]) for r in orphans],
+            )
+        # nobody is left to remove them
+        for r in orphans:
+            _remove_files(json.loads(r["files"]) if r["files"] else [])
+
+    def prune(self, keep_seconds: float):
+        """Delete the jobs which ended more than `keep_seconds` ago."""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ?", (time.time() - keep_seconds,)
+            )
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job.pop("files", None)
+        job.pop("boot", None)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+
+class JobContext(object):
+    """Handed to job handlers to report progress and observe cancellation."""
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self.done = 0
+        self.total: Optional[int] = None
+        self._checked_at = 0.0
+        self._flushed_at = 0.0
+
+    def set_total(self, total: int):
+        self.total = total
+        self.store.progress(self.job_id, self.done, total)
+
+    def advance(self, count: int = 1):
+        self.done += count
+        if time.monotonic() - self._flushed_at >= PROGRESS_FLUSH_INTERVAL:
+            self.flush()
+        self.check_cancelled()
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        self.store.progress(self.job_id, self.done)
+
+    def check_cancelled(self):
+        now = time.monotonic()
+        if now - self._checked_at < CANCEL_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self.store.cancel_requested(self.job_id):
+            raise JobCancelled()
+
+
+JobHandler = Callable[[JobContext], Optional[dict]]
+
+
+class JobRunner(object):
+    """Runs jobs of this worker process on a bounded thread pool."""
+
+    def __init__(
+        self, store: JobStore, max_workers: int, keep_days: float = JOBS_KEEP_DAYS
+    ):
+        self.store = store
+        self.keep_seconds = keep_days * 86400
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.store.register_worker()
+        self.store.mark_orphans_interrupted()
+        self.store.prune(self.keep_seconds)
+
+    def submit(
+        self,
+        kind: str,
+        owner: str,
+        handler: JobHandler,
+        total: Optional[int] = None,
+        files: Optional[List[str]] = None,
+    ) -> str:
+        """Queue `handler`; `files` are removed however the job ends, also
+        when it is cancelled before it ran."""
+        self.store.prune(self.keep_seconds)
+        job_id = self.store.create(kind, owner, total=total, files=files)
+        future = self._executor.submit(self._run, job_id, handler)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id, files))
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        requested = self.store.request_cancel(job_id)
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return requested
+
+    def _forget(self, job_id: str, files: Optional[List[str]] = None):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if files:
+            _remove_files(files)
+
+    def _run(self, job_id: str, handler: JobHandler):
+        if not self.store.start(job_id):
+            return
+        context = JobContext(self.store, job_id)
+        try:
+            result = handler(context)
+        except JobCancelled:
+            context.flush()
+            self.store.finish(job_id, CANCELLED)
+        except Exception as e:
+            context.flush()
+            self.store.finish(job_id, FAILED, error=str(e))
+        else:
+            context.flush()
+            self.store.finish(job_id, SUCCEEDED, result=result)
+
+
+runner = JobRunner(JobStore(JOBS_DB_PATH), JOBS_MAX_WORKERS)
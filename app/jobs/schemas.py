@@ -0,0 +1,37 @@
+from typing import Optional, Any
+
+from pydantic import BaseModel
+
+
+class JobDetail(BaseModel):
+    id: str
+    kind: str
+    owner: str
+    status: str
+    done: int
+    total: Optional[int] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class JobProgress(BaseModel):
+    id: str
+    status: str
+    done: int
+    total: Optional[int] = None
+    percent: Optional[float] = None
+
+    @classmethod
+    def from_job(cls, job: dict) -> "JobProgress":
+        total = job["total"]
+        return cls(
+            id=job["id"],
+            status=job["status"],
+            done=job["done"],
+            total=total,
+            percent=round(job["done"] * 100 / total, 2) if total else None,
+        )
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, List
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.samba import SambaClient
+from app.group.schemas import GroupUsersManage
+from app.user.schemas import ImportFormat, MoveUserOU
+from app.user.services import manager as user_manager
+
+from .runner import JobContext, runner
+from .schemas import JobDetail, JobProgress
+
+# members sent per modify when rewriting large groups
+GROUP_MEMBERS_CHUNK = 100
+
+
+def _spool(stream: BinaryIO) -> str:
+    """Copy an upload to a private file, removed again if the copy fails."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".import") as f:
+        try:
+            shutil.copyfileobj(stream, f)
+        except BaseException:
+            os.remove(f.name)
+            raise
+    return f.name
+
+
+class JobService(object):
+    def _submit(
+        self, current_user: dict, kind: str, handler, total=None, files=None
+    ) -> JobDetail:
+        job_id = runner.submit(
+            kind, current_user["username"], handler, total=total, files=files
+        )
+        return JobDetail(**runner.store.get(job_id))
+
+    async def submit_move_user_ou(
+        self, current_user: dict, moves: List[MoveUserOU]
+    ) -> JobDetail:
+        def handler(context: JobContext):
+            client = SambaClient(**current_user)
+            for move in moves:
+                client.move_user_ou(move.from_ou, move.to_ou)
+                context.advance()
+            return {"moved": len(moves)}
+
+        return self._submit(current_user, "move_user_ou", handler, total=len(moves))
+
+    async def submit_group_members(
+        self,
+        current_user: dict,
+        user_group_manage: GroupUsersManage,
+        to_add: bool,
+    ) -> JobDetail:
+        members = user_group_manage.members
+        groupname = user_group_manage.groupname
+
+        def handler(context: JobContext):
+            client = SambaClient(**current_user)
+            for idx in range(0, len(members), GROUP_MEMBERS_CHUNK):
+                chunk = members[idx : idx + GROUP_MEMBERS_CHUNK]
+                if to_add:
+                    client.add_users_to_group(groupname, chunk)
+                else:
+                    client.remove_users_from_group(groupname, chunk)
+                context.advance(len(chunk))
+            return {"groupname": groupname, "members": len(members)}
+
+        kind = "add_users_to_group" if to_add else "remove_users_from_group"
+        return self._submit(current_user, kind, handler, total=len(members))
+
+    async def submit_import_users(
+        self,
+        current_user: dict,
+        stream: BinaryIO,
+        import_format: ImportFormat,
+        chunk_size: int,
+    ) -> JobDetail:
+        # the upload is gone once the request ends, keep a private copy for the job
+        path = await run_in_threadpool(_spool, stream)
+
+        def handler(context: JobContext):
+            client = SambaClient(**current_user)
+            with open(path, "rb") as upload:
+                report = user_manager.run_import(
+                    client,
+                    upload,
+                    import_format,
+                    chunk_size,
+                    on_row=lambda _: context.advance(),
+                )
+            return report.dict()
+
+        # it holds passwords, the runner removes it whenever the job ends
+        return self._submit(current_user, "import_users", handler, files=[path])
+
+    def _get_owned(self, current_user: dict, job_id: str) -> dict:
+        job = runner.store.get(job_id)
+        if not job or job["owner"] != current_user["username"]:
+            raise HTTPException(404, f"job with id `{job_id}` does not exists.")
+        return job
+
+    async def get_job(self, current_user: dict, job_id: str) -> JobDetail:
+        return JobDetail(**self._get_owned(current_user, job_id))
+
+    async def get_progress(self, current_user: dict, job_id: str) -> JobProgress:
+        return JobProgress.from_job(self._get_owned(current_user, job_id))
+
+    async def list_jobs(self, current_user: dict) -> List[JobDetail]:
+        return [JobDetail(**job) for job in runner.store.list(current_user["username"])]
+
+    async def cancel_job(self, current_user: dict, job_id: str) -> JobDetail:
+        self._get_owned(current_user, job_id)
+        if not runner.cancel(job_id):
+            raise HTTPException(400, f"job with id `{job_id}` already finished.")
+        return JobDetail(**runner.store.get(job_id))
+
+
+manager = JobService()
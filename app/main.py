@@ -1,11 +1,16 @@
 from starlette.middleware.sessions import SessionMiddleware
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 
 from .config import settings
+from .core.admission import AdmissionMiddleware
+from .core.etag import NotModified
+from .core.profiling import ProfilingMiddleware
+from .core.samba import DirectoryUnavailable, Forbidden
 from .docs import custom_swagger_ui_html, redoc_html, swagger_ui_redirect
 from .routers import api_router
 
@@ -23,16 +28,46 @@ app = FastAPI(
 app.mount(settings.STATIC_URL, StaticFiles(directory="app/static"), name="static")
 
 
+# inside admission, so only the profiled request's own run is sampled
+app.add_middleware(ProfilingMiddleware)
+# inside CORS, so shed requests still get CORS headers
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag",
+        "Retry-After",
+        "X-Next-Offset",
+        "X-Profile-Id",
+        "X-Total-Count",
+    ],
 )
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
 
 
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag})
+
+
+@app.exception_handler(DirectoryUnavailable)
+async def directory_unavailable_handler(request: Request, exc: DirectoryUnavailable):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(Forbidden)
+async def forbidden_handler(request: Request, exc: Forbidden):
+    return JSONResponse({"detail": str(exc)}, status_code=403)
+
+
 @app.get(settings.DOCS_URL, include_in_schema=False)
 async def get_swagger_ui_html():
     return await custom_swagger_ui_html(
@@ -1,13 +1,14 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
 
 # from fastapi.exceptions import HTTPException
 
 from app.core.constants import DEFAULT_SUCCESS_RESPONSE
+from app.core.delta import DeltaQuery, delta_query
 from app.user.security import get_current_user
 
-from .schemas import AddOrganizationUnit, OrgDetail
+from .schemas import AddOrganizationUnit, OrgDelta, OrgDetail, OUTreeNode
 from .services import manager
 
 api_router = APIRouter()
@@ -40,16 +41,41 @@ async def delete_org(
 
 @api_router.get("/list/", response_model=List[OrgDetail])
 async def list_orgs(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
 ):
-    res = await manager.list_ou(current_user)
+    res, etag = await manager.list_ou(current_user, if_none_match=if_none_match)
+    response.headers["ETag"] = etag
     return res
 
 
+@api_router.get("/delta/", response_model=OrgDelta)
+async def list_orgs_delta(
+    delta: DeltaQuery = Depends(delta_query),
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.list_ou_delta(current_user, delta)
+
+
 @api_router.get("/get/", response_model=OrgDetail)
 async def get_org(
     name: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+):
+    res, etag = await manager.get_org(current_user, name, if_none_match=if_none_match)
+    response.headers["ETag"] = etag
+    return res
+
+
+@api_router.get("/tree/", response_model=OUTreeNode)
+async def ou_tree(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
 ):
-    res = await manager.get_org(current_user, name)
+    res, etag = await manager.ou_tree(current_user, if_none_match=if_none_match)
+    response.headers["ETag"] = etag
     return res
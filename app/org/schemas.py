@@ -1,7 +1,9 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
+from app.core.delta import Tombstone
+
 
 class AddOrganizationUnit(BaseModel):
     ou_dn: str
@@ -27,6 +29,7 @@ class OrgDetail(BaseModel):
     objectCategory: list
     objectClass: list
     whenCreated: str
+    uSNChanged: Optional[str] = None
 
     @classmethod
     def from_samba_message(cls, entry) -> "OrgDetail":
@@ -36,6 +39,34 @@ class OrgDetail(BaseModel):
             name=str(entry["name"]),
             distinguishedName=str(entry["distinguishedName"]),
             whenCreated=str(entry["whenCreated"]),
+            uSNChanged=entry.get("uSNChanged", idx=0),
             objectCategory=[o for o in entry.get("objectCategory", [])],
             objectClass=[o for o in entry.get("objectClass", [])],
         )
+
+
+class OrgDelta(BaseModel):
+    dc: str
+    # `since_usn` of the next delta
+    highWaterMark: int
+    ous: List[OrgDetail]
+    removed: List[Tombstone]
+
+
+class OUCounts(BaseModel):
+    users: int
+    groups: int
+    computers: int
+
+
+class OUTreeNode(BaseModel):
+    dn: str
+    name: str
+    description: Optional[str] = None
+    # objects directly in this OU, and in this OU and all OUs below it
+    counts: OUCounts
+    totals: OUCounts
+    children: List["OUTreeNode"] = []
+
+
+OUTreeNode.update_forward_refs()
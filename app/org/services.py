@@ -1,8 +1,31 @@
+from typing import Optional, Tuple
+
 from fastapi import HTTPException
 
-from app.core.samba import SambaClient
+from app.core.delta import DeltaQuery, Tombstone, check_delta_dc, read_delta
+from app.core.etag import (
+    check_list_not_modified,
+    check_object_not_modified,
+    list_etag,
+    make_etag,
+)
+from app.core.samba import PASSTHROUGH_ERRORS, SambaClient
+from app.core.shared_cache import shared_cache
+from app.core.singleflight import flight_key, reads
+
+from .schemas import AddOrganizationUnit, OrgDelta, OrgDetail, OUTreeNode
+from .tree import OUTree, tree_cache
 
-from .schemas import AddOrganizationUnit, OrgDetail
+# attributes needed to build `OrgDetail`
+ORG_DETAIL_ATTRS = [
+    "ou",
+    "name",
+    "distinguishedName",
+    "whenCreated",
+    "uSNChanged",
+    "objectCategory",
+    "objectClass",
+]
 
 
 class OrgService(object):
@@ -14,6 +37,8 @@ class OrgService(object):
         client = SambaClient(**current_user)
         try:
             client.delete_organization_unit(ou_dn)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -29,28 +54,127 @@ class OrgService(object):
                 ou_name = add_org_unit.name
             else:
                 ou_name = add_org_unit.ou_dn.split(",")[0].lower().replace("ou=", "")
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
         entry = client.get_ou(ou_name)
         return OrgDetail.from_samba_message(entry)
 
-    async def list_ou(self, current_user: dict) -> list:
+    async def list_ou(
+        self, current_user: dict, if_none_match: Optional[str] = None
+    ) -> Tuple[list, str]:
+        client = SambaClient(**current_user)
+        try:
+            server, usn = client.highest_committed_usn()
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        etag = list_etag(server, usn, "ous", current_user["username"])
+        check_list_not_modified(if_none_match, etag)
+
+        def list_ou() -> list:
+            return [OrgDetail.from_samba_message(e) for e in client.list_ou()]
+
+        key = flight_key(current_user, "ous", etag)
+        try:
+            return await reads.do(key, shared_cache.get_or_load, key, list_ou), etag
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+
+    async def list_ou_delta(self, current_user: dict, delta: DeltaQuery) -> OrgDelta:
         client = SambaClient(**current_user)
+        key = flight_key(
+            current_user, "ous_delta", delta.since_usn, delta.since_time, delta.dc
+        )
         try:
-            res = client.list_ou()
-            return [OrgDetail.from_samba_message(e) for e in res]
+            dc, usn, changed, removed = await reads.do(
+                key,
+                read_delta,
+                client,
+                delta,
+                "(objectclass=organizationalUnit)",
+                "(objectclass=organizationalUnit)",
+                ORG_DETAIL_ATTRS,
+            )
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
+        check_delta_dc(delta, dc)
+        return OrgDelta(
+            dc=dc,
+            highWaterMark=usn,
+            ous=[OrgDetail.from_samba_message(e) for e in changed],
+            removed=[Tombstone.from_samba_message(e) for e in removed],
+        )
 
-    async def get_org(self, current_user: dict, name: str) -> OrgDetail:
+    async def ou_tree(
+        self, current_user: dict, if_none_match: Optional[str] = None
+    ) -> Tuple[OUTreeNode, str]:
         client = SambaClient(**current_user)
+        try:
+            server, usn = client.highest_committed_usn()
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        etag = list_etag(server, usn, "ou_tree", current_user["username"])
+        check_list_not_modified(if_none_match, etag)
+        key = flight_key(current_user, "ou_tree", server)
+
+        def build_tree() -> dict:
+            current_usn = int(usn)
+            tree = tree_cache.get(key)
+            if tree is not None:
+                with tree.lock:
+                    if tree.usn == current_usn:
+                        return tree.render()
+                    try:
+                        applied = tree.usn < current_usn and tree.apply(
+                            current_usn, client.ou_tree_objects(since_usn=tree.usn)
+                        )
+                    except Exception:
+                        tree_cache.discard(key)
+                        raise
+                    if applied:
+                        return tree.render()
+            tree = OUTree.build(
+                server, current_usn, client.domain_dn(), client.ou_tree_objects()
+            )
+            tree_cache.put(key, tree)
+            return tree.render()
+
+        try:
+            # not `key`, build_tree still needs the tree cache key
+            flight = flight_key(current_user, "ou_tree", etag)
+            rendered = await reads.do(
+                flight, shared_cache.get_or_load, flight, build_tree
+            )
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        return OUTreeNode(**rendered), etag
+
+    async def get_org(
+        self, current_user: dict, name: str, if_none_match: Optional[str] = None
+    ) -> Tuple[OrgDetail, str]:
+        client = SambaClient(**current_user)
+        check_object_not_modified(client, if_none_match, "name", name)
         try:
             entry = client.get_ou(name)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
         if not entry:
             raise HTTPException(404, f"ou with name - `{name}` does not exists.")
-        return OrgDetail.from_samba_message(entry)
+        org = OrgDetail.from_samba_message(entry)
+        return org, make_etag(org.dn, org.uSNChanged, client.read_dc)
 
 
 manager = OrgService()
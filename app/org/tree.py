@@ -0,0 +1,181 @@
+import threading
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import ldb
+
+from app.config.settings import OU_TREE_CACHE_SIZE
+from app.core.cache import LRUCache
+from app.core.samba import object_classes
+
+__all__ = ("OUTree", "split_dn", "tree_cache")
+
+USERS = "users"
+GROUPS = "groups"
+COMPUTERS = "computers"
+KINDS = (USERS, GROUPS, COMPUTERS)
+
+
+def split_dn(dn: str) -> List[str]:
+    """Split a DN into its RDNs, keeping escaped commas inside values."""
+    rdns = []
+    current = []
+    escaped = False
+    for char in dn:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ",":
+            rdns.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    rdns.append("".join(current).strip())
+    return rdns
+
+
+def _parent_dn(dn: str) -> str:
+    return ",".join(split_dn(dn)[1:])
+
+
+def _kind(classes: set) -> Optional[str]:
+    if "computer" in classes:
+        return COMPUTERS
+    if "user" in classes:
+        return USERS
+    if "group" in classes:
+        return GROUPS
+    return None
+
+
+def _text(entry: ldb.Message, attr: str) -> Optional[str]:
+    value = entry.get(attr, idx=0)
+    if isinstance(value, bytes):
+        return value.decode(errors="ignore")
+    return None if value is None else str(value)
+
+
+class _Node(object):
+    def __init__(self, dn: str, name: str, description: Optional[str] = None):
+        self.dn = dn
+        self.name = name
+        self.description = description
+        self.counts = dict.fromkeys(KINDS, 0)
+
+
+class OUTree(object):
+    """OU hierarchy of a domain with the objects directly in each OU counted.
+
+    Objects in plain containers such as `CN=Users` count towards the nearest
+    OU above them, or the domain root. Changes of users, groups and computers
+    are applied incrementally by objectGUID, so a moved object is taken out
+    of its old OU; any change to an OU itself needs a rebuild, as it can
+    move a whole subtree.
+    """
+
+    def __init__(self, server: str, usn: int, domain_dn: str):
+        self.server = server
+        self.usn = usn
+        self.lock = threading.Lock()
+        self._root = domain_dn.lower()
+        self._nodes: Dict[str, _Node] = {self._root: _Node(domain_dn, domain_dn)}
+        # objectGUID -> (dn of the node it is counted in, kind)
+        self._objects: Dict[Hashable, Tuple[str, str]] = {}
+        self._nearest: Dict[str, str] = {}
+
+    @classmethod
+    def build(
+        cls, server: str, usn: int, domain_dn: str, entries: Iterable[ldb.Message]
+    ) -> "OUTree":
+        tree = cls(server, usn, domain_dn)
+        objects = []
+        for entry in entries:
+            classes = object_classes(entry)
+            dn = str(entry.dn)
+            if "organizationalunit" in classes:
+                tree._nodes[dn.lower()] = _Node(
+                    dn, _text(entry, "name") or dn, _text(entry, "description")
+                )
+                continue
+            kind = _kind(classes)
+            if kind is not None:
+                objects.append((entry.get("objectGUID", idx=0), dn, kind))
+        # OUs may come after their objects in the scan, place objects last
+        for guid, dn, kind in objects:
+            tree._add(guid, dn, kind)
+        return tree
+
+    def _node_for(self, dn: str) -> str:
+        """Key of the nearest OU at or above `dn`, or of the root."""
+        key = dn.lower()
+        if key in self._nearest:
+            return self._nearest[key]
+        seen = []
+        while key and key not in self._nodes and key != self._root:
+            seen.append(key)
+            key = _parent_dn(key)
+        found = key if key in self._nodes else self._root
+        for k in seen:
+            self._nearest[k] = found
+        return found
+
+    def _add(self, guid: Hashable, dn: str, kind: str):
+        node = self._node_for(_parent_dn(dn))
+        self._nodes[node].counts[kind] += 1
+        self._objects[guid] = (node, kind)
+
+    def _remove(self, guid: Hashable):
+        placed = self._objects.pop(guid, None)
+        if placed is not None:
+            node, kind = placed
+            self._nodes[node].counts[kind] -= 1
+
+    def apply(self, usn: int, entries: Iterable[ldb.Message]) -> bool:
+        """Apply entries changed since `self.usn`.
+
+        Returns False when an OU changed; the tree is then stale and must be
+        rebuilt.
+        """
+        for entry in entries:
+            classes = object_classes(entry)
+            if "organizationalunit" in classes:
+                return False
+            kind = _kind(classes)
+            if kind is None:
+                continue
+            guid = entry.get("objectGUID", idx=0)
+            self._remove(guid)
+            if str(entry.get("isDeleted", idx=0)).upper() != "TRUE":
+                self._add(guid, str(entry.dn), kind)
+        self.usn = usn
+        return True
+
+    def render(self) -> dict:
+        """Nested dicts of the tree, with direct and subtree counts per OU."""
+        children: Dict[str, List[str]] = {key: [] for key in self._nodes}
+        for key in self._nodes:
+            if key != self._root:
+                children[self._node_for(_parent_dn(key))].append(key)
+
+        def render_node(key: str) -> dict:
+            node = self._nodes[key]
+            rendered = [render_node(child) for child in children[key]]
+            rendered.sort(key=lambda child: child["name"].lower())
+            totals = dict(node.counts)
+            for child in rendered:
+                for kind in KINDS:
+                    totals[kind] += child["totals"][kind]
+            return {
+                "dn": node.dn,
+                "name": node.name,
+                "description": node.description,
+                "counts": dict(node.counts),
+                "totals": totals,
+                "children": rendered,
+            }
+
+        return render_node(self._root)
+
+
+# OU trees per authorization context and DC
+tree_cache = LRUCache(OU_TREE_CACHE_SIZE)
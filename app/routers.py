@@ -5,6 +5,10 @@ from .gpo.api import api_router as gpo_router
 from .search.api import api_router as search_router
 from .group.api import api_router as group_router
 from .org.api import api_router as org_router
+from .export.api import api_router as export_router
+from .jobs.api import api_router as jobs_router
+from .feed.api import api_router as feed_router
+from .batch.api import api_router as batch_router
 
 api_router = APIRouter()
 
@@ -13,3 +17,7 @@ api_router.include_router(gpo_router, prefix="/gpo", tags=["gpo"])
 api_router.include_router(search_router, prefix="/search", tags=["search"])
 api_router.include_router(group_router, prefix="/group", tags=["group"])
 api_router.include_router(org_router, prefix="/org", tags=["orgranization"])
+api_router.include_router(export_router, prefix="/export", tags=["export"])
+api_router.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(feed_router, prefix="/feed", tags=["feed"])
+api_router.include_router(batch_router, prefix="/batch", tags=["batch"])
@@ -1,10 +1,10 @@
 from typing import List, Dict
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 
 from app.user.security import get_current_user
 
-from .schemas import Search, SearchDNRow, SearchByDN
+from .schemas import Search, SearchDNRow, SearchByDN, TypeaheadHit
 from .services import manager
 
 
@@ -14,8 +14,14 @@ SEARCH_RESPONSE = List[Dict]
 
 
 @api_router.post("/", response_model=SEARCH_RESPONSE)
-async def search(search: Search, current_user: dict = Depends(get_current_user)):
-    return await manager.search(current_user, search)
+async def search(
+    search: Search,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+):
+    rows, total = await manager.search(current_user, search)
+    response.headers["X-Total-Count"] = str(total)
+    return rows
 
 
 @api_router.post(
@@ -25,12 +31,28 @@ async def search(search: Search, current_user: dict = Depends(get_current_user))
 )
 async def search_by_dn(
     search_by_dn: SearchByDN,
+    response: Response,
     current_user: dict = Depends(get_current_user),
 ):
-    res = await manager.search_by_dn(
+    res, next_offset = await manager.search_by_dn(
         current_user,
         search_by_dn.dn,
         search_by_dn.object_classes,
         attrs=search_by_dn.attrs,
+        scope=search_by_dn.scope,
+        max_depth=search_by_dn.max_depth,
+        limit=search_by_dn.limit,
+        offset=search_by_dn.offset,
     )
+    if next_offset is not None:
+        response.headers["X-Next-Offset"] = str(next_offset)
     return res
+
+
+@api_router.get("/typeahead/", response_model=List[TypeaheadHit])
+async def typeahead(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.typeahead(current_user, q, limit)
@@ -1,17 +1,46 @@
+from enum import Enum
 from typing import List, Optional, Dict, Any
 
 from pydantic import BaseModel, Field
 
+from app.config.settings import SEARCH_MAX_LIMIT
+from app.core.window import ATTR_NAME_REGEX, ListWindow
+
 
 class Search(BaseModel):
     search_criteria: str
     search_target: List[str]
+    sort: Optional[str] = Field(None, regex=ATTR_NAME_REGEX)
+    descending: bool = False
+    offset: int = Field(0, ge=0)
+    count: Optional[int] = Field(None, ge=1, le=SEARCH_MAX_LIMIT)
+    # only the number of matches, sent in `X-Total-Count`
+    count_only: bool = False
+
+    def window(self) -> ListWindow:
+        return ListWindow(
+            sort=self.sort,
+            descending=self.descending,
+            offset=self.offset,
+            count=self.count,
+        )
+
+
+class SearchScope(str, Enum):
+    base = "base"
+    onelevel = "onelevel"
+    subtree = "subtree"
 
 
 class SearchByDN(BaseModel):
     dn: str
     object_classes: List[str] = Field(min_items=1)
     attrs: Optional[list] = None
+    scope: SearchScope = SearchScope.subtree
+    # levels below `dn` a subtree search descends, 0 is `dn` itself
+    max_depth: Optional[int] = Field(None, ge=0)
+    limit: Optional[int] = Field(None, ge=1, le=SEARCH_MAX_LIMIT)
+    offset: int = Field(0, ge=0)
 
 
 class SearchDNRow(BaseModel):
@@ -21,3 +50,12 @@ class SearchDNRow(BaseModel):
     objectType: str
     description: Optional[str] = None
     extra_attrs: Optional[Dict[str, Any]] = None
+
+
+class TypeaheadHit(BaseModel):
+    dn: str
+    sAMAccountName: Optional[str] = None
+    displayName: Optional[str] = None
+    givenName: Optional[str] = None
+    sn: Optional[str] = None
+    mail: Optional[str] = None
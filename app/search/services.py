@@ -1,17 +1,101 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import time
 
-from app.core.samba import SambaClient
+from fastapi import HTTPException
 
-from .schemas import Search, SearchDNRow
+from app.config.settings import TYPEAHEAD_REFRESH_SECONDS
+from app.core.samba import PASSTHROUGH_ERRORS, SambaClient
+from app.core.shared_cache import shared_cache
+from app.core.singleflight import flight_key, reads
+
+from .schemas import Search, SearchDNRow, SearchScope, TypeaheadHit
+from .typeahead import INDEX_ATTRS, TypeaheadIndex, index_cache
 
 
 class GPOService(object):
-    async def search(self, current_user: dict, search: Search) -> list:
+    async def search(self, current_user: dict, search: Search) -> Tuple[list, int]:
+        window = search.window()
         client = SambaClient(**current_user)
-        return client.search_criteria(
-            search=search.search_criteria,
-            search_target=search.search_target,
+        pinned: tuple = ()
+        if shared_cache.enabled:
+            try:
+                # pins the result, so it can be shared through the worker cache
+                pinned = client.highest_committed_usn()
+            except PASSTHROUGH_ERRORS:
+                raise
+            except Exception as e:
+                raise HTTPException(400, str(e))
+
+        def search_criteria() -> Tuple[list, int]:
+            if search.count_only:
+                return [], client.count(search.search_criteria)
+            if not window.active:
+                rows = client.search_criteria(
+                    search=search.search_criteria,
+                    search_target=search.search_target,
+                )
+                return rows, len(rows)
+            entries, total = client.window_search(
+                search.search_criteria,
+                search.search_target,
+                window.sort or "name",
+                descending=window.descending,
+                offset=window.offset,
+                count=window.count,
+            )
+            rows = [
+                {k: str(entry.get(k, idx=0)) for k in search.search_target}
+                for entry in entries
+            ]
+            return rows, total
+
+        key = flight_key(
+            current_user,
+            "search",
+            *pinned,
+            search.search_criteria,
+            tuple(search.search_target),
+            search.count_only,
+            *window.key(),
         )
+        return await reads.do(key, shared_cache.get_or_load, key, search_criteria)
+
+    async def typeahead(
+        self, current_user: dict, query: str, limit: int
+    ) -> List[TypeaheadHit]:
+        key = flight_key(current_user, "typeahead")
+        index = index_cache.get(key)
+        if (
+            index is None
+            or time.monotonic() - index.checked_at >= TYPEAHEAD_REFRESH_SECONDS
+        ):
+            try:
+                index = await reads.do(key, self._refresh_index, current_user, key)
+            except PASSTHROUGH_ERRORS:
+                raise
+            except Exception as e:
+                raise HTTPException(400, str(e))
+        return [TypeaheadHit(**hit) for hit in index.lookup(query, limit)]
+
+    def _refresh_index(self, current_user: dict, key: tuple) -> TypeaheadIndex:
+        client = SambaClient(**current_user)
+        server, usn = client.highest_committed_usn()
+        usn = int(usn)
+        index = index_cache.get(key)
+        # USNs are per DC, an index of another DC is rebuilt
+        if index is not None and index.server == server and index.usn <= usn:
+            index.apply(
+                usn,
+                client.changed_since(
+                    "(objectClass=user)", INDEX_ATTRS, since_usn=index.usn
+                ),
+            )
+        else:
+            index = TypeaheadIndex.build(
+                server, usn, client.changed_since("(objectClass=user)", INDEX_ATTRS)
+            )
+            index_cache.put(key, index)
+        return index
 
     async def search_by_dn(
         self,
@@ -19,12 +103,27 @@ class GPOService(object):
         dn: str,
         object_classes: List[str],
         attrs: Optional[list] = None,
-    ) -> list:
+        scope: SearchScope = SearchScope.subtree,
+        max_depth: Optional[int] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[list, Optional[int]]:
         client = SambaClient(**current_user)
         try:
             samba_entries = client.search_by_dn(
-                dn=dn, object_classes=object_classes, attrs=attrs
+                dn=dn,
+                object_classes=object_classes,
+                attrs=attrs,
+                scope=scope.value,
+                max_depth=max_depth,
+                # one extra entry tells whether there is a next page
+                limit=limit + 1 if limit else None,
+                offset=offset,
             )
+            next_offset = None
+            if limit and len(samba_entries) > limit:
+                samba_entries = samba_entries[:limit]
+                next_offset = offset + limit
             res = []
             if attrs:
                 extra_attrs_list = [
@@ -45,7 +144,7 @@ class GPOService(object):
                     f: str(entry.get(f, idx=0)) for f in extra_attrs_list
                 }
                 res.append(s_row)
-            return res
+            return res, next_offset
         except Exception as e:
             raise
 
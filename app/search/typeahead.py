@@ -0,0 +1,215 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import ldb
+
+from app.config.settings import TYPEAHEAD_CACHE_SIZE
+from app.core.cache import LRUCache
+from app.core.samba import object_classes
+
+__all__ = ("TypeaheadIndex", "INDEX_ATTRS", "index_cache")
+
+# indexed attributes, best ranked first
+FIELD_RANKS = {
+    "sAMAccountName": 0,
+    "displayName": 1,
+    "givenName": 2,
+    "sn": 2,
+    "mail": 3,
+}
+INDEX_ATTRS = ["objectGUID", "objectClass", "isDeleted"] + list(FIELD_RANKS)
+
+EXACT = 0
+PREFIX = 1
+SUBSTRING = 2
+
+# matches looked at per requested hit, bounds the cost of short queries
+PREFIX_SCAN_FACTOR = 20
+
+WORD_SPLIT = re.compile(r"[\s.@_\-]+")
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _text(entry: ldb.Message, attr: str) -> Optional[str]:
+    value = entry.get(attr, idx=0)
+    if isinstance(value, bytes):
+        return value.decode(errors="ignore")
+    return None if value is None else str(value)
+
+
+class _Doc(object):
+    __slots__ = ("dn", "fields", "tokens", "text")
+
+    def __init__(self, dn: str, fields: Dict[str, str]):
+        self.dn = dn
+        self.fields = fields
+        # (token, field rank) pairs in the prefix index
+        self.tokens: Set[Tuple[str, int]] = set()
+        words = set()
+        for attr, value in fields.items():
+            value = normalize(value)
+            rank = FIELD_RANKS[attr]
+            self.tokens.add((value, rank))
+            if attr == "mail":
+                # the mail domain is shared by everyone, useless for infixes
+                value = value.split("@", 1)[0]
+            for word in WORD_SPLIT.split(value):
+                if word:
+                    self.tokens.add((word, rank))
+                    words.add(word)
+        # infix matches are looked for within words
+        self.text = "\n".join(words)
+
+
+class TypeaheadIndex(object):
+    """Prefix and trigram index over the names and mail of directory users.
+
+    A sorted token list answers prefix queries with a binary search; the
+    trigram sets answer infix queries of three or more characters. Both are
+    built from one paged scan and kept current by applying the entries whose
+    uSNChanged moved past `usn`.
+    """
+
+    def __init__(self, server: str, usn: int):
+        self.server = server
+        self.usn = usn
+        self.checked_at = time.monotonic()
+        self.lock = threading.Lock()
+        self._docs: Dict[int, _Doc] = {}
+        self._ids: Dict[Hashable, int] = {}
+        self._next_id = 0
+        # sorted (token, field rank, doc id)
+        self._tokens: List[Tuple[str, int, int]] = []
+        self._trigrams: Dict[str, Set[int]] = {}
+
+    @classmethod
+    def build(
+        cls, server: str, usn: int, entries: Iterable[ldb.Message]
+    ) -> "TypeaheadIndex":
+        index = cls(server, usn)
+        for guid, doc in cls._parse(entries):
+            if doc is not None:
+                index._add(guid, doc, sort=False)
+        index._tokens.sort()
+        return index
+
+    @staticmethod
+    def _parse(
+        entries: Iterable[ldb.Message],
+    ) -> Iterable[Tuple[Hashable, Optional[_Doc]]]:
+        """Yield `(objectGUID, doc)`, doc is None for deleted users."""
+        for entry in entries:
+            classes = object_classes(entry)
+            if "user" not in classes or "computer" in classes:
+                continue
+            guid = entry.get("objectGUID", idx=0)
+            if str(entry.get("isDeleted", idx=0)).upper() == "TRUE":
+                yield guid, None
+                continue
+            fields = {}
+            for attr in FIELD_RANKS:
+                value = _text(entry, attr)
+                if value:
+                    fields[attr] = value
+            yield guid, _Doc(str(entry.dn), fields)
+
+    def _add(self, guid: Hashable, doc: _Doc, sort: bool = True):
+        doc_id = self._next_id
+        self._next_id += 1
+        self._ids[guid] = doc_id
+        self._docs[doc_id] = doc
+        for token, rank in doc.tokens:
+            if sort:
+                insort(self._tokens, (token, rank, doc_id))
+            else:
+                self._tokens.append((token, rank, doc_id))
+        for trigram in _trigrams(doc.text):
+            self._trigrams.setdefault(trigram, set()).add(doc_id)
+
+    def _remove(self, guid: Hashable):
+        doc_id = self._ids.pop(guid, None)
+        if doc_id is None:
+            return
+        doc = self._docs.pop(doc_id)
+        for token, rank in doc.tokens:
+            pos = bisect_left(self._tokens, (token, rank, doc_id))
+            if pos < len(self._tokens) and self._tokens[pos] == (token, rank, doc_id):
+                del self._tokens[pos]
+        for trigram in _trigrams(doc.text):
+            ids = self._trigrams.get(trigram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._trigrams[trigram]
+
+    def apply(self, usn: int, entries: Iterable[ldb.Message]):
+        # read the changes from the DC before locking out lookups
+        changes = list(self._parse(entries))
+        with self.lock:
+            for guid, doc in changes:
+                self._remove(guid)
+                if doc is not None:
+                    self._add(guid, doc)
+            self.usn = usn
+            self.checked_at = time.monotonic()
+
+    def lookup(self, query: str, limit: int) -> List[dict]:
+        """Best `limit` users for `query`, exact and prefix matches first."""
+        query = normalize(query)
+        if not query:
+            return []
+        with self.lock:
+            best: Dict[int, Tuple[int, int]] = {}
+            pos = bisect_left(self._tokens, (query,))
+            end = min(len(self._tokens), pos + limit * PREFIX_SCAN_FACTOR)
+            while pos < end and self._tokens[pos][0].startswith(query):
+                token, rank, doc_id = self._tokens[pos]
+                score = (EXACT if token == query else PREFIX, rank)
+                if doc_id not in best or score < best[doc_id]:
+                    best[doc_id] = score
+                pos += 1
+            if len(best) < limit and len(query) >= 3:
+                matches = (
+                    doc_id
+                    for doc_id in self._substring_matches(query)
+                    if doc_id not in best
+                )
+                for doc_id in islice(matches, limit * PREFIX_SCAN_FACTOR):
+                    best[doc_id] = (SUBSTRING, 0)
+            ranked = sorted(
+                best.items(),
+                key=lambda item: (
+                    item[1],
+                    self._docs[item[0]].fields.get("displayName", "").lower(),
+                ),
+            )
+            return [
+                dict(self._docs[doc_id].fields, dn=self._docs[doc_id].dn)
+                for doc_id, _ in ranked[:limit]
+            ]
+
+    def _substring_matches(self, query: str) -> Set[int]:
+        sets = []
+        for trigram in _trigrams(query):
+            ids = self._trigrams.get(trigram)
+            if not ids:
+                return set()
+            sets.append(ids)
+        sets.sort(key=len)
+        candidates = set(sets[0]).intersection(*sets[1:])
+        return {i for i in candidates if query in self._docs[i].text}
+
+
+# an index per authorization context, of the DC it was read from
+index_cache = LRUCache(TYPEAHEAD_CACHE_SIZE)
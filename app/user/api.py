@@ -1,9 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    File,
+    Header,
+    Query,
+    Response,
+    UploadFile,
+)
 from fastapi.security import HTTPAuthorizationCredentials
 
 # from fastapi.exceptions import HTTPException
 
+from app.config.settings import IMPORT_CHUNK_SIZE
 from app.core.constants import DEFAULT_SUCCESS_RESPONSE
+from app.core.delta import DeltaQuery, delta_query
+from app.core.window import ListWindow, list_window
 
 from .schemas import (
     AuthUser,
@@ -17,6 +31,13 @@ from .schemas import (
     UserUpdate,
     UserGroupManage,
     UserMemeberOf,
+    ImportFormat,
+    ImportReport,
+    UserFacet,
+    UserStats,
+    UserDelta,
+    UserReconcile,
+    ReconcileReport,
 )
 from .security import auth_scheme, get_current_user
 from .services import manager
@@ -54,8 +75,47 @@ async def get_me(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme
     "/list_users/",
     response_model=UserList,
 )
-async def list_users(current_user: dict = Depends(get_current_user)):
-    return await manager.get_users(current_user)
+async def list_users(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    window: ListWindow = Depends(list_window),
+    current_user: dict = Depends(get_current_user),
+):
+    users, etag, total = await manager.get_users(
+        current_user, if_none_match=if_none_match, window=window
+    )
+    response.headers["ETag"] = etag
+    response.headers["X-Total-Count"] = str(total)
+    return users
+
+
+@api_router.get(
+    "/delta/",
+    response_model=UserDelta,
+)
+async def users_delta(
+    delta: DeltaQuery = Depends(delta_query),
+    current_user: dict = Depends(get_current_user),
+):
+    """Users changed or removed since the cursor.
+
+    An account expiring changes nothing on it, so only a delta with
+    `since_time` lists the accounts which expired since as removed; with
+    `since_usn` alone they stay until they are modified or a full resync.
+    """
+    return await manager.get_users_delta(current_user, delta)
+
+
+@api_router.get(
+    "/stats/",
+    response_model=UserStats,
+)
+async def user_stats(
+    expiring_days: int = Query(7, ge=0, le=3650),
+    facets: List[UserFacet] = Query([]),
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.get_user_stats(current_user, expiring_days, facets)
 
 
 @api_router.get(
@@ -63,11 +123,17 @@ async def list_users(current_user: dict = Depends(get_current_user)):
     response_model=UserDetail,
 )
 async def get_user_by_username(
-    username: str, current_user: dict = Depends(get_current_user)
+    username: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
 ):
-    user = await manager.get_user_by_username(current_user, username)
+    user, etag = await manager.get_user_with_etag(
+        current_user, username, if_none_match=if_none_match
+    )
     if not user:
         raise HTTPException(404, f"user with `{username}` does not exists.")
+    response.headers["ETag"] = etag
     return user
 
 
@@ -82,6 +148,33 @@ async def create_user(
     return user
 
 
+@api_router.post(
+    "/import_users/",
+    response_model=ImportReport,
+)
+async def import_users(
+    format: ImportFormat = ImportFormat.csv,
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1),
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.import_users(
+        current_user, file.file, import_format=format, chunk_size=chunk_size
+    )
+
+
+@api_router.post(
+    "/reconcile_users/",
+    response_model=ReconcileReport,
+)
+async def reconcile_users(
+    users: List[UserReconcile],
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1),
+    current_user: dict = Depends(get_current_user),
+):
+    return await manager.reconcile_users(current_user, users, chunk_size=chunk_size)
+
+
 @api_router.delete(
     "/delete_user/",
     status_code=200,
@@ -119,11 +212,17 @@ async def move_user_organization(
 async def modify_user_data(
     username: str,
     user_update: UserUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
 ):
-    user_obj = await manager.update_user(
-        current_user=current_user, username=username, update_user=user_update
+    user_obj, etag = await manager.update_user(
+        current_user=current_user,
+        username=username,
+        update_user=user_update,
+        if_match=if_match,
     )
+    response.headers["ETag"] = etag
     return user_obj
 
 
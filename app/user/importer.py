@@ -0,0 +1,134 @@
+import codecs
+import csv
+from base64 import b64decode
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+__all__ = ("RowError", "iter_csv_rows", "iter_ldif_rows")
+
+# LDIF attributes which are mapped onto `AddUser` fields
+LDIF_FIELD_MAP = {
+    "samaccountname": "username",
+    "userpassword": "password",
+}
+LDIF_IGNORED = {"version", "objectclass", "changetype", "userprincipalname", "name"}
+
+
+class RowError(ValueError):
+    """A record which could not be parsed, yielded in place of its row.
+
+    Earlier rows may be written already, so a bad record fails on its own
+    instead of aborting the import.
+    """
+
+
+Row = Tuple[int, Union[dict, RowError]]
+
+
+def _text_lines(stream: BinaryIO) -> Iterator[str]:
+    # bytes which are not utf-8 become lone surrogates, `_checked` fails the
+    # record holding them instead of the whole stream
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="surrogateescape")
+    pending = ""
+    for chunk in iter(lambda: stream.read(64 * 1024), b""):
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def _checked(value: str) -> str:
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        # the value may be a password, it is not repeated
+        raise RowError("invalid utf-8")
+    return value
+
+
+def iter_csv_rows(stream: BinaryIO) -> Iterator[Row]:
+    reader = csv.DictReader(line + "\n" for line in _text_lines(stream))
+    while True:
+        try:
+            row = next(reader)
+            if reader.fieldnames:
+                for name in reader.fieldnames:
+                    _checked(name)
+            row = {
+                k: _checked(v) for k, v in row.items() if k and v not in ("", None)
+            }
+        except StopIteration:
+            return
+        except (csv.Error, RowError) as e:
+            yield reader.line_num, RowError(str(e))
+            continue
+        yield reader.line_num, row
+
+
+def _userou_from_dn(dn: str) -> Optional[str]:
+    # CN=user,OU=a,OU=b,DC=test,DC=local -> OU=a,OU=b
+    parts = [p.strip() for p in dn.split(",")]
+    container = [p for p in parts[1:] if not p.upper().startswith("DC=")]
+    return ",".join(container) or None
+
+
+def _ldif_record(lines: list) -> dict:
+    record: dict = {}
+    for line in lines:
+        attr, sep, value = _checked(line).partition(":")
+        if not sep:
+            continue
+        if value.startswith(":"):
+            value = b64decode(value[1:].strip()).decode()
+        else:
+            value = value.strip()
+        key = attr.strip()
+        if key.lower() == "dn":
+            record["userou"] = _userou_from_dn(value)
+            continue
+        if key.lower() in LDIF_IGNORED:
+            continue
+        key = LDIF_FIELD_MAP.get(key.lower(), key)
+        if key in record:
+            existing = record[key]
+            record[key] = (existing if isinstance(existing, list) else [existing]) + [
+                value
+            ]
+        else:
+            record[key] = value
+    return record
+
+
+def _parsed_record(start: int, lines: list) -> Iterator[Row]:
+    try:
+        record = _ldif_record(lines)
+    except ValueError as e:
+        # bad base64 or a value which is not utf-8
+        yield start, RowError(str(e))
+        return
+    if record:
+        yield start, record
+
+
+def iter_ldif_rows(stream: BinaryIO) -> Iterator[Row]:
+    lines: list = []
+    start = 0
+    for line_num, line in enumerate(_text_lines(stream), start=1):
+        if line.startswith("#"):
+            continue
+        if line.startswith(" ") and lines:
+            # folded line continuation
+            lines[-1] += line[1:]
+            continue
+        if not line.strip():
+            if lines:
+                yield from _parsed_record(start, lines)
+                lines = []
+            continue
+        if not lines:
+            start = line_num
+        lines.append(line)
+    if lines:
+        yield from _parsed_record(start, lines)
@@ -1,9 +1,12 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
+from enum import Enum
 from time import time
 
 from pydantic import BaseModel, validator, Field
 
 from app.config import settings
+from app.core.delta import Tombstone
+from app.core.directory import registry
 
 
 class TokenData(BaseModel):
@@ -73,6 +76,21 @@ class UserUpdate(BaseUser):
         return user_request
 
 
+class UserReconcile(UserUpdate):
+    """Desired state of a user; attributes left out are not touched."""
+
+    username: str
+
+    def to_request(self) -> dict:
+        user_request = super().to_request()
+        user_request.pop("username")
+        return user_request
+
+
+# multi-valued attributes `UserDetail` keeps as lists
+USER_LIST_ATTRS = frozenset(("objectClass", "memberOf", "postOfficeBox"))
+
+
 class UserDetail(BaseUser):
     username: str
     dn: Optional[str]
@@ -82,7 +100,7 @@ class UserDetail(BaseUser):
     whenChanged: Optional[str]
     uSNCreated: Optional[str]
     name: Optional[str]
-    objectGUID: Optional[bytes]
+    objectGUID: Optional[str]
     badPwdCount: Optional[str]
     codePage: Optional[str]
     countryCode: Optional[str]
@@ -104,20 +122,7 @@ class UserDetail(BaseUser):
 
     @classmethod
     def from_samba_message(cls, entry) -> "UserDetail":
-        obj = {}
-        for k in entry:
-            if k in ("objectClass", "memberOf", "postOfficeBox"):
-                value = [i for i in entry[k]]
-            else:
-                value = entry.get(k, idx=0)
-            if k == "dn":
-                obj[k] = str(value)
-            elif isinstance(value, bytes):
-                obj[k] = value.decode(errors="ignore")
-            elif value is None:
-                obj[k] = value
-            else:
-                obj[k] = value
+        obj = registry.decode_entry(entry, USER_LIST_ATTRS)
         obj["username"] = obj["sAMAccountName"]
         return cls(**obj)
 
@@ -126,6 +131,14 @@ class UserList(BaseModel):
     users: List[UserDetail]
 
 
+class UserDelta(BaseModel):
+    dc: str
+    # `since_usn` of the next delta
+    highWaterMark: int
+    users: List[UserDetail]
+    removed: List[Tombstone]
+
+
 class MoveUserOU(BaseModel):
     from_ou: str
     to_ou: str
@@ -142,3 +155,79 @@ class UserGroupManage(BaseModel):
 
 class UserMemeberOf(BaseModel):
     memberOf: Optional[list]
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ldif = "ldif"
+
+
+class ImportRowResult(BaseModel):
+    line: int
+    username: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+
+class ImportReport(BaseModel):
+    total: int = 0
+    created: int = 0
+    failed: int = 0
+    rolled_back: int = 0
+    # created, then could not be deleted when the chunk failed
+    not_rolled_back: int = 0
+    skipped: int = 0
+    rows: List[ImportRowResult] = []
+
+    @classmethod
+    def from_rows(cls, rows: List[ImportRowResult]) -> "ImportReport":
+        report = cls(total=len(rows), rows=rows)
+        for row in rows:
+            setattr(report, row.status, getattr(report, row.status) + 1)
+        return report
+
+
+class UserFacet(str, Enum):
+    department = "department"
+    company = "company"
+    # the container of the account
+    ou = "ou"
+
+
+class FacetBucket(BaseModel):
+    value: Optional[str] = None
+    count: int
+
+
+class UserStats(BaseModel):
+    total: int
+    enabled: int
+    disabled: int
+    expired: int
+    # not expired yet, but within `expiring_days`
+    expiring: int
+    locked_out: int
+    facets: Dict[UserFacet, List[FacetBucket]] = {}
+
+
+class ReconcileRowResult(BaseModel):
+    username: str
+    status: str
+    # the attributes which were replaced
+    attributes: List[str] = []
+    error: Optional[str] = None
+
+
+class ReconcileReport(BaseModel):
+    total: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    rows: List[ReconcileRowResult] = []
+
+    @classmethod
+    def from_rows(cls, rows: List[ReconcileRowResult]) -> "ReconcileReport":
+        report = cls(total=len(rows), rows=rows)
+        for row in rows:
+            setattr(report, row.status, getattr(report, row.status) + 1)
+        return report
@@ -1,22 +1,41 @@
-from typing import Optional
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
 import json
 from dateutil.parser import parse
 from datetime import datetime, timedelta
 from pytz import UTC
 
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials
 from jose import JWTError, jwt
+from pydantic import ValidationError
 
 from app.config.settings import (
     ACCESS_TOKEN_EXPIRE_SECONDS,
     REFRESH_TOKEN_EXPIRE_SECONDS,
+    SAMBA_BIND_MODE,
     SECRET_KEY,
     SECRET_SALT,
+    USER_LIST_ETAG_SECONDS,
 )
-from app.core.samba import SambaClient
+from app.core.authz import READ, authorizer
+from app.core.delta import DeltaQuery, Tombstone, check_delta_dc, read_delta
+from app.core.etag import (
+    check_list_not_modified,
+    check_object_not_modified,
+    list_etag,
+    make_etag,
+    parse_etag,
+    time_bucket,
+)
+from app.core.samba import PASSTHROUGH_ERRORS, PreconditionFailed, SambaClient
+from app.core.shared_cache import shared_cache
+from app.core.singleflight import flight_key, reads
+from app.core.window import ListWindow
 from app.utils.crypt import Crypt
 
+from .importer import RowError, iter_csv_rows, iter_ldif_rows
+
 from .schemas import (
     TokenData,
     AddUser,
@@ -26,17 +45,42 @@ from .schemas import (
     UserDetail,
     UserGroupManage,
     UserMemeberOf,
+    ImportFormat,
+    ImportReport,
+    ImportRowResult,
+    FacetBucket,
+    UserFacet,
+    UserStats,
+    UserDelta,
+    UserReconcile,
+    ReconcileReport,
+    ReconcileRowResult,
 )
 
 crypt = Crypt(SECRET_SALT)
 
+# attributes needed to build `UserDetail`, used for projected reads
+USER_DETAIL_ATTRS = [f for f in UserDetail.__fields__ if f not in ("username", "dn")]
+# every user object, deleted or not; `users_filter` narrows it to the listed ones
+USER_OBJECTS_FILTER = "(&(objectClass=user)(!(objectClass=computer)))"
+
 
 class AuthServiceManager:
     ALGORITHM = "HS256"
 
     async def auth(self, username: str, password: str) -> TokenData:
-        _ = SambaClient(username, password)
-        sub = {"username": username, "password": password}
+        client = SambaClient(username, password)
+        if SAMBA_BIND_MODE == "service":
+            # the only bind as the user, later requests use the service pool
+            service = SambaClient(username, permissions=[READ])
+            sub = {
+                "username": username,
+                "permissions": authorizer.permissions(client, username),
+                # a password reset ends the session at the next refresh
+                "pwdLastSet": service.sign_in_state(username),
+            }
+        else:
+            sub = {"username": username, "password": password}
         return TokenData(
             access_token=self.generate_access_token(sub),
             refresh_token=self.generate_refresh_token(sub),
@@ -104,6 +148,18 @@ class AuthServiceManager:
 
     async def update_tokens(self, refresh_token: str) -> TokenData:
         sub: dict = await self.verify_refresh_token(refresh_token)
+        if "permissions" in sub:
+            # nothing binds as the user any more, so check what a bind would
+            client = SambaClient(sub["username"], permissions=[READ])
+            pwd_last_set = client.sign_in_state(sub["username"])
+            if pwd_last_set is None or pwd_last_set != sub.get("pwdLastSet"):
+                raise HTTPException(
+                    status_code=401,
+                    detail="account disabled, locked, expired or password changed.",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            # group changes reach the session at the next refresh
+            sub["permissions"] = authorizer.permissions(client, sub["username"])
         return TokenData(
             access_token=self.generate_access_token(sub),
             refresh_token=self.generate_refresh_token(sub),
@@ -118,10 +174,108 @@ class AuthServiceManager:
             raise HTTPException(403, "invalid user token.")
         return user
 
-    async def get_users(self, current_user: dict):
+    async def get_users(
+        self,
+        current_user: dict,
+        if_none_match: Optional[str] = None,
+        window: ListWindow = ListWindow(),
+    ) -> Tuple[dict, str, int]:
+        client = SambaClient(**current_user)
+        server, usn = client.highest_committed_usn()
+        etag = list_etag(
+            server,
+            usn,
+            "users",
+            current_user["username"],
+            # expired accounts drop out without any USN changing
+            time_bucket(USER_LIST_ETAG_SECONDS),
+            *window.key(),
+        )
+        check_list_not_modified(if_none_match, etag)
+
+        def list_users() -> Tuple[dict, int]:
+            if window.active:
+                samba_messages, total = client.window_search(
+                    client.users_filter(),
+                    [],
+                    window.sort or "sAMAccountName",
+                    descending=window.descending,
+                    offset=window.offset,
+                    count=window.count,
+                )
+            else:
+                samba_messages = client.list_users()
+                total = len(samba_messages)
+            users = [UserDetail.from_samba_message(sm) for sm in samba_messages]
+            return {"users": users}, total
+
+        # the etag pins server and USN, so coalesced callers get the same state
+        key = flight_key(current_user, "users", etag)
+        users, total = await reads.do(key, shared_cache.get_or_load, key, list_users)
+        return users, etag, total
+
+    async def get_users_delta(self, current_user: dict, delta: DeltaQuery) -> UserDelta:
         client = SambaClient(**current_user)
-        samba_messages = client.list_users()
-        return {"users": [UserDetail.from_samba_message(sm) for sm in samba_messages]}
+        key = flight_key(
+            current_user, "users_delta", delta.since_usn, delta.since_time, delta.dc
+        )
+        try:
+            dc, usn, changed, removed = await reads.do(
+                key,
+                read_delta,
+                client,
+                delta,
+                USER_OBJECTS_FILTER,
+                client.users_filter(),
+                USER_DETAIL_ATTRS,
+                # users_filter drops expired accounts
+                True,
+            )
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        check_delta_dc(delta, dc)
+        return UserDelta(
+            dc=dc,
+            highWaterMark=usn,
+            users=[UserDetail.from_samba_message(e) for e in changed],
+            removed=[Tombstone.from_samba_message(e) for e in removed],
+        )
+
+    async def get_user_stats(
+        self, current_user: dict, expiring_days: int, facets: List[UserFacet]
+    ) -> UserStats:
+        client = SambaClient(**current_user)
+        try:
+            server, usn = client.highest_committed_usn()
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+
+        def user_stats() -> UserStats:
+            stats = UserStats(**client.user_stats(expiring_days))
+            for facet in facets:
+                counts = client.facet_counts(client.accounts_filter(), facet.value)
+                stats.facets[facet] = [
+                    FacetBucket(value=value, count=count)
+                    for value, count in sorted(
+                        counts.items(), key=lambda item: (-item[1], item[0] or "")
+                    )
+                ]
+            return stats
+
+        # not shared across workers, the expiry counts move with the clock
+        key = flight_key(
+            current_user, "user_stats", server, usn, expiring_days, tuple(facets)
+        )
+        try:
+            return await reads.do(key, user_stats)
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
 
     async def create_user(
         self,
@@ -143,14 +297,86 @@ class AuthServiceManager:
             )
             samba_message = client.get_user_by_username(user_data["username"])
             return UserDetail.from_samba_message(samba_message)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             # raise
             raise HTTPException(400, str(e))
 
+    def run_import(
+        self,
+        client: SambaClient,
+        stream: BinaryIO,
+        import_format: ImportFormat,
+        chunk_size: int,
+        on_row: Optional[Callable[[ImportRowResult], None]] = None,
+    ) -> ImportReport:
+        parse = iter_csv_rows if import_format == ImportFormat.csv else iter_ldif_rows
+        invalid: List[ImportRowResult] = []
+
+        def fail(line: int, username: Optional[str], error: Exception):
+            invalid.append(
+                ImportRowResult(
+                    line=line, username=username, status="failed", error=str(error)
+                )
+            )
+            if on_row is not None:
+                on_row(invalid[-1])
+
+        def valid_rows() -> Iterator[Tuple[int, dict]]:
+            for line, row in parse(stream):
+                if isinstance(row, RowError):
+                    fail(line, None, row)
+                    continue
+                try:
+                    add_user = AddUser(**row)
+                except ValidationError as e:
+                    fail(line, row.get("username"), e)
+                    continue
+                yield line, add_user.to_user_request()
+
+        rows = []
+        for r in client.import_users(valid_rows(), chunk_size):
+            row = ImportRowResult(**r)
+            rows.append(row)
+            if on_row is not None:
+                on_row(row)
+        return ImportReport.from_rows(sorted(rows + invalid, key=lambda r: r.line))
+
+    async def import_users(
+        self,
+        current_user: dict,
+        stream: BinaryIO,
+        import_format: ImportFormat,
+        chunk_size: int,
+    ) -> ImportReport:
+        client = SambaClient(**current_user)
+        # bad records are failed rows of the report, earlier ones are written
+        return self.run_import(client, stream, import_format, chunk_size)
+
+    async def reconcile_users(
+        self, current_user: dict, users: List[UserReconcile], chunk_size: int
+    ) -> ReconcileReport:
+        client = SambaClient(**current_user)
+        desired = [(user.username, user.to_request()) for user in users]
+        try:
+            # many chunks of synchronous writes, kept off the event loop
+            results = await run_in_threadpool(
+                lambda: list(client.reconcile_users(desired, chunk_size))
+            )
+            rows = [ReconcileRowResult(**row) for row in results]
+        except PASSTHROUGH_ERRORS:
+            raise
+        except Exception as e:
+            raise HTTPException(400, str(e))
+        return ReconcileReport.from_rows(rows)
+
     async def delete_user(self, current_user: dict, username: str):
         client = SambaClient(**current_user)
         try:
             client.delete_user(username)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -165,6 +391,8 @@ class AuthServiceManager:
                 update_user_password.username,
                 new_password=update_user_password.password,
             )
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -176,6 +404,8 @@ class AuthServiceManager:
         client = SambaClient(**current_user)
         try:
             client.move_user_ou(move.from_ou, move.to_ou)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -184,20 +414,52 @@ class AuthServiceManager:
         current_user: dict,
         username: str,
     ) -> Optional[UserDetail]:
+        user, _ = await self.get_user_with_etag(current_user, username)
+        return user
+
+    async def get_user_with_etag(
+        self,
+        current_user: dict,
+        username: str,
+        if_none_match: Optional[str] = None,
+    ) -> Tuple[Optional[UserDetail], Optional[str]]:
         client = SambaClient(**current_user)
+        check_object_not_modified(client, if_none_match, "sAMAccountName", username)
         try:
             samba_entry = client.get_user_by_username(username)
-            return UserDetail.from_samba_message(samba_entry)
+            user = UserDetail.from_samba_message(samba_entry)
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
+        return user, make_etag(user.dn, user.uSNChanged, client.read_dc)
 
     async def update_user(
-        self, current_user: dict, username: str, update_user: UserUpdate
-    ) -> UserDetail:
+        self,
+        current_user: dict,
+        username: str,
+        update_user: UserUpdate,
+        if_match: Optional[str] = None,
+    ) -> Tuple[UserDetail, str]:
+        precondition = None
+        if if_match:
+            precondition = parse_etag(if_match)
+            if not precondition:
+                raise HTTPException(412, "invalid `If-Match` header.")
         client = SambaClient(**current_user)
         try:
-            samba_message = client.modify_user(username, **update_user.to_request())
-            return UserDetail.from_samba_message(samba_message)
+            samba_message = client.modify_user(
+                username,
+                attrs=USER_DETAIL_ATTRS,
+                if_match=precondition,
+                **update_user.to_request(),
+            )
+            user = UserDetail.from_samba_message(samba_message)
+            return user, make_etag(user.dn, user.uSNChanged, client.write_dc)
+        except PreconditionFailed as e:
+            raise HTTPException(412, str(e))
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -215,6 +477,8 @@ class AuthServiceManager:
             return UserMemeberOf(
                 memberOf=[g for g in user_row.memberOf] if user_row.memberOf else []
             )
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
@@ -232,6 +496,8 @@ class AuthServiceManager:
             return UserMemeberOf(
                 memberOf=[g for g in user_row.memberOf] if user_row.memberOf else []
             )
+        except PASSTHROUGH_ERRORS:
+            raise
         except Exception as e:
             raise HTTPException(400, str(e))
 
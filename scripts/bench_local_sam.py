@@ -0,0 +1,73 @@
+"""Compare reads over LDAP with reads from the local sam.ldb.
+
+Run on the DC host from the repository root, with SAMBA_HOST and
+SAMBA_LOCAL_SAM_PATH set in app/.env:
+
+    python -m scripts.bench_local_sam -U administrator -P secret -n 50
+
+Every iteration builds a new `SambaClient`, as a request does, so the bind
+(or the cached password check of the local mode) is part of the timing.
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable, List, Optional
+
+from app.config.settings import SAMBA_LOCAL_AUTH_TTL, SAMBA_LOCAL_SAM_PATH
+from app.core.localsam import LocalSam
+from app.core.samba import SambaClient
+
+
+def _measure(fn: Callable[[], object], iterations: int) -> List[float]:
+    fn()  # warm up: schema load, password check
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def _report(mode: str, workload: str, timings: List[float]):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{mode:6} {workload:8} mean {statistics.mean(timings):8.2f} ms  "
+        f"p50 {statistics.median(timings):8.2f} ms  p95 {p95:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-U", "--username", required=True)
+    parser.add_argument("-P", "--password", required=True)
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument(
+        "--search", default="(objectClass=user)", help="search workload filter"
+    )
+    args = parser.parse_args()
+    if not SAMBA_LOCAL_SAM_PATH:
+        parser.error("SAMBA_LOCAL_SAM_PATH is not set")
+
+    modes = {
+        "ldap": None,
+        "local": LocalSam(SAMBA_LOCAL_SAM_PATH, SAMBA_LOCAL_AUTH_TTL),
+    }
+    for mode, sam in modes.items():
+
+        def client(sam: Optional[LocalSam] = sam) -> SambaClient:
+            return SambaClient(args.username, args.password, local_sam=sam)
+
+        workloads = {
+            "list": lambda: client().list_users(),
+            "search": lambda: client().search_criteria(
+                args.search, ["sAMAccountName", "mail"]
+            ),
+        }
+        for workload, fn in workloads.items():
+            _report(mode, workload, _measure(fn, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# settings refuse to load without a DC; nothing here connects to it
+os.environ.setdefault("SAMBA_HOST", "ldap://localhost:389")
+os.environ.setdefault("SHARED_CACHE_PATH", "")
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
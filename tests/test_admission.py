@@ -0,0 +1,22 @@
+import pytest
+
+from app.core.admission import HIGH, LOW, NORMAL, route_priority
+
+
+@pytest.mark.parametrize(
+    "path, priority",
+    [
+        ("/user/me/", HIGH),
+        ("/user/get/", NORMAL),
+        ("/gpo/", LOW),
+        ("/gpo/detail/", NORMAL),
+        ("/batch/", LOW),
+        ("/user/reconcile_users/", LOW),
+        ("/user/delta/", LOW),
+        ("/group/delta/", LOW),
+        ("/org/delta/", LOW),
+        ("/jobs/import_users/", LOW),
+    ],
+)
+def test_route_priority(path, priority):
+    assert route_priority(path) == priority
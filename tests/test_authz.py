@@ -0,0 +1,106 @@
+import re
+
+import ldb
+
+from app.core.authz import READ, WRITE, Authorizer
+from app.core.samba import SambaClient
+
+
+class Groups(object):
+    def __init__(self, memberships):
+        self.memberships = memberships
+
+    def is_member_of(self, username, groupname):
+        return groupname in self.memberships.get(username, ())
+
+
+def test_permissions_by_group():
+    authorizer = Authorizer({READ: ["Domain Users"], WRITE: ["Admins", "Ops"]})
+    client = Groups({"alice": {"Domain Users"}, "bob": {"Ops"}})
+    assert authorizer.permissions(client, "alice") == [READ]
+    assert authorizer.permissions(client, "nobody") == []
+
+
+def test_write_implies_read():
+    authorizer = Authorizer({READ: ["Domain Users"], WRITE: ["Ops"]})
+    assert authorizer.permissions(Groups({"bob": {"Ops"}}), "bob") == [READ, WRITE]
+
+
+class Entry(dict):
+    def __init__(self, dn, **attrs):
+        super().__init__(attrs)
+        self.dn = dn
+
+
+class Reader(object):
+    """Answers like a DC where alice has Domain Users (RID 513) as primary
+    group and is in no group through `member`."""
+
+    def __init__(self):
+        self.expressions = []
+
+    def domain_dn(self):
+        return "DC=x"
+
+    def transaction_start(self):
+        pass
+
+    def transaction_commit(self):
+        pass
+
+    def search(self, base, scope=None, expression=None, attrs=None):
+        self.expressions.append(expression)
+        if "objectclass=group" in expression:
+            return [Entry("CN=Domain Users,CN=Users,DC=x", primaryGroupToken="513")]
+        if re.search(r"\(primaryGroupID=513\)", expression):
+            return [Entry("CN=alice,CN=Users,DC=x")]
+        return []
+
+
+def test_is_member_of_counts_the_primary_group():
+    client = SambaClient.__new__(SambaClient)
+    client._reader = Reader()
+    assert client.is_member_of("alice", "Domain Users")
+
+
+def test_is_member_of_escapes_its_input(monkeypatch):
+    monkeypatch.setattr(ldb, "binary_encode", lambda v: v.replace("*", r"\2a"))
+    client = SambaClient.__new__(SambaClient)
+    client._reader = Reader()
+    client.is_member_of("*", "Domain*")
+    assert r"(sAMAccountName=Domain\2a)" in client._reader.expressions[0]
+    assert r"(sAMAccountName=\2a)" in client._reader.expressions[1]
+
+
+class StateReader(Reader):
+    def __init__(self, entries):
+        super().__init__()
+        self.entries = entries
+
+    def get_nttime(self):
+        return 1000
+
+    def search(self, base, scope=None, expression=None, attrs=None):
+        self.expressions.append(expression)
+        return self.entries
+
+
+def state_client(entries):
+    client = SambaClient.__new__(SambaClient)
+    client._reader = StateReader(entries)
+    client.domain_dn = lambda: "DC=x"
+    client._lockout_filter = lambda nttime: "(lockoutTime>=1)"
+    return client
+
+
+def test_sign_in_state_filters_unusable_accounts():
+    client = state_client([Entry("CN=alice,DC=x", pwdLastSet="42")])
+    assert client.sign_in_state("alice") == "42"
+    expression = client._reader.expressions[0]
+    assert "(!(userAccountControl:" in expression
+    assert "(accountExpires>=1000)" in expression
+    assert "(!(lockoutTime>=1))" in expression
+
+
+def test_sign_in_state_of_unusable_account_is_none():
+    assert state_client([]).sign_in_state("alice") is None
@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+
+from app.core.samba import BATCH_UNDO, SambaClient
+
+
+class Client(SambaClient):
+    """Records the write calls, failing the ones named in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.calls = []
+
+    @contextmanager
+    def transaction(self, samdb=None):
+        yield
+
+    def _call(self, name, **kwargs):
+        self.calls.append((name, kwargs))
+        if name in self.failing:
+            raise Exception(self.failing[name])
+
+    def create_user(self, user_data, userAccountControl, pwdLastSet, accountExpires):
+        self._call("create_user", user_data=user_data)
+
+    def delete_user(self, username):
+        self._call("delete_user", username=username)
+
+    def add_users_to_group(self, groupname, members):
+        self._call("add_users_to_group", groupname=groupname, members=members)
+
+    def remove_users_from_group(self, groupname, members):
+        self._call("remove_users_from_group", groupname=groupname, members=members)
+
+    def set_group_members(self, groupname, members):
+        self._call("set_group_members", groupname=groupname, members=members)
+        return {"added": 1, "removed": 0, "unchanged": 0}
+
+
+CREATE = (
+    "create_user",
+    {
+        "user_data": {"username": "alice"},
+        "userAccountControl": None,
+        "pwdLastSet": None,
+        "accountExpires": None,
+    },
+)
+ADD = ("add_users_to_group", {"groupname": "staff", "members": ["alice"]})
+SET = ("set_group_members", {"groupname": "staff", "members": ["bob"]})
+
+
+def statuses(results):
+    return [r["status"] for r in results]
+
+
+def test_undo_of_each_operation():
+    assert BATCH_UNDO["create_user"](CREATE[1]) == (
+        "delete_user",
+        {"username": "alice"},
+    )
+    assert BATCH_UNDO["move_user_ou"]({"from_ou": "OU=a", "to_ou": "OU=b"}) == (
+        "move_user_ou",
+        {"from_ou": "OU=b", "to_ou": "OU=a"},
+    )
+    assert BATCH_UNDO["add_users_to_group"](ADD[1]) == (
+        "remove_users_from_group",
+        ADD[1],
+    )
+
+
+def test_atomic_batch_undoes_in_reverse_order():
+    client = Client(failing={"set_group_members": "no such group"})
+    results = client.run_batch([CREATE, ADD, SET, CREATE], atomic=True)
+    assert statuses(results) == ["rolled_back", "rolled_back", "failed", "skipped"]
+    assert results[2]["error"] == "no such group"
+    assert [name for name, _ in client.calls] == [
+        "create_user",
+        "add_users_to_group",
+        "set_group_members",
+        "remove_users_from_group",
+        "delete_user",
+    ]
+
+
+def test_atomic_batch_reports_what_stayed():
+    client = Client(failing={"delete_user": "busy"})
+    delete = ("delete_user", {"username": "carol"})
+    results = client.run_batch([CREATE, SET, ADD, delete], atomic=True)
+    assert statuses(results) == [
+        "not_rolled_back",
+        "not_rolled_back",
+        "rolled_back",
+        "failed",
+    ]
+    assert results[0]["error"] == "busy"
+    assert results[1]["error"] == "cannot be undone"
+
+
+def test_independent_batch_runs_every_call():
+    client = Client(failing={"add_users_to_group": "no such group"})
+    results = client.run_batch([CREATE, ADD, SET], atomic=False)
+    assert statuses(results) == ["succeeded", "failed", "succeeded"]
+    assert results[2]["result"] == {"added": 1, "removed": 0, "unchanged": 0}
+
+
+def test_independent_batch_stops_when_the_dc_is_gone():
+    client = Client(failing={"add_users_to_group": "NT_STATUS_CONNECTION_RESET"})
+    results = client.run_batch([CREATE, ADD, SET, SET], atomic=False)
+    assert statuses(results) == ["succeeded", "failed", "skipped", "skipped"]
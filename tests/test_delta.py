@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from app.core.samba import SambaClient
+
+SINCE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# SINCE and an hour later in NT time
+SINCE_NT = 133485408000000000
+NOW_NT = SINCE_NT + 3600 * 10**7
+
+
+class Root(dict):
+    def get(self, name, idx=None):
+        return "42"
+
+
+class Reader(object):
+    def get_nttime(self):
+        return NOW_NT
+
+
+class Client(SambaClient):
+    def __init__(self):
+        self._reader = Reader()
+        self.searches = []
+
+    @contextmanager
+    def transaction(self, samdb=None):
+        yield
+
+    def get_object_by_dn(self, dn, attrs, samdb=None):
+        return Root()
+
+    def paged_search(self, expression, attrs, **kwargs):
+        self.searches.append(expression)
+        return iter([])
+
+
+def removed_filter(**kwargs):
+    client = Client()
+    client.delta_search("(objectClass=user)", "(listed=1)", [], **kwargs)
+    return client.searches[-1]
+
+
+def test_delta_by_time_removes_accounts_expired_since():
+    expression = removed_filter(since_time=SINCE, expiring=True)
+    assert f"(&(accountExpires>={SINCE_NT})(accountExpires<{NOW_NT}))" in expression
+
+
+def test_expiry_needs_a_time():
+    assert "accountExpires" not in removed_filter(since_usn=7, expiring=True)
+    assert "accountExpires" not in removed_filter(since_time=SINCE)
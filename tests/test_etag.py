@@ -0,0 +1,131 @@
+import ldb
+import pytest
+
+from app.core import etag, samba
+from app.core.etag import (
+    NotModified,
+    check_object_not_modified,
+    list_etag,
+    make_etag,
+    parse_etag,
+    time_bucket,
+)
+from app.core.samba import PreconditionFailed, SambaClient
+
+DN = "CN=alice,CN=Users,DC=x"
+
+
+class Entry(dict):
+    def get(self, name, idx=None):
+        return dict.get(self, name)
+
+
+class Directory(object):
+    def __init__(self, usn, version="v1"):
+        self.entries = {
+            DN: Entry(
+                sAMAccountName="alice",
+                name="alice",
+                uSNChanged=usn,
+                replPropertyMetaData=version,
+            )
+        }
+
+
+class Client(SambaClient):
+    """Two DCs, `dc1` is the write DC."""
+
+    def __init__(self, dc1, dc2):
+        self.dcs = {"dc1": dc1, "dc2": dc2}
+
+    @property
+    def _client(self):
+        return self.dcs["dc1"]
+
+    @property
+    def write_dc(self):
+        return "dc1"
+
+    def host_for_tag(self, tag):
+        return tag if tag in self.dcs else None
+
+    def connection(self, url):
+        return self.dcs[url]
+
+    def get_object_by_dn(self, dn, attrs, samdb=None):
+        return samdb.entries.get(dn)
+
+
+@pytest.fixture(autouse=True)
+def replicated_version(monkeypatch):
+    monkeypatch.setattr(
+        samba, "_replicated_version", lambda entry: entry["replPropertyMetaData"]
+    )
+
+
+def test_parse_etag_round_trip():
+    etag = make_etag(DN, 42, "dc1")
+    assert parse_etag(etag) == (DN, "42", "dc1")
+    assert parse_etag("W/" + etag) == (DN, "42", "dc1")
+
+
+@pytest.mark.parametrize("etag", ['"x.dc1.abc"', '"42"', '"42.dc1."', "*"])
+def test_parse_etag_rejects_garbage(etag):
+    assert parse_etag(etag) is None
+
+
+def test_not_modified_is_checked_on_the_issuing_dc():
+    client = Client(Directory(usn="7"), Directory(usn="42"))
+    etag = make_etag(DN, 42, "dc2")
+    with pytest.raises(NotModified) as e:
+        check_object_not_modified(client, etag, "sAMAccountName", "alice")
+    assert e.value.etag == etag
+
+
+def test_changed_object_is_modified():
+    client = Client(Directory(usn="7"), Directory(usn="43"))
+    etag = make_etag(DN, 42, "dc2")
+    check_object_not_modified(client, etag, "sAMAccountName", "alice")
+    check_object_not_modified(client, make_etag(DN, 42, "gone"), "name", "alice")
+
+
+def test_precondition_on_the_write_dc():
+    client = Client(Directory(usn="7"), Directory(usn="42"))
+    client._check_precondition("alice", (DN, "7", "dc1"))
+    with pytest.raises(PreconditionFailed):
+        client._check_precondition("alice", (DN, "6", "dc1"))
+
+
+def test_precondition_from_a_replica_needs_the_same_version_on_the_write_dc():
+    client = Client(Directory(usn="7"), Directory(usn="42"))
+    client._check_precondition("alice", (DN, "42", "dc2"))
+    # the write DC already has an edit the replica has not seen yet
+    client = Client(Directory(usn="8", version="v2"), Directory(usn="42"))
+    with pytest.raises(PreconditionFailed):
+        client._check_precondition("alice", (DN, "42", "dc2"))
+
+
+def test_precondition_from_an_unknown_dc():
+    client = Client(Directory(usn="7"), Directory(usn="42"))
+    with pytest.raises(PreconditionFailed):
+        client._check_precondition("alice", (DN, "42", "dc3"))
+
+
+class BrokenDirectory(object):
+    @property
+    def entries(self):
+        raise ldb.LdbError(ldb.ERR_OPERATIONS_ERROR, "operations error")
+
+
+def test_failed_lookup_is_no_match():
+    client = Client(Directory(usn="7"), BrokenDirectory())
+    check_object_not_modified(
+        client, make_etag(DN, 42, "dc2"), "sAMAccountName", "alice"
+    )
+
+
+def test_list_etag_changes_with_the_time_bucket(monkeypatch):
+    monkeypatch.setattr(etag.time, "time", lambda: 119.0)
+    first = list_etag("dc1", "42", "users", time_bucket(60))
+    monkeypatch.setattr(etag.time, "time", lambda: 120.0)
+    assert list_etag("dc1", "42", "users", time_bucket(60)) != first
@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+
+from app.core.directory import DomainInfo
+from app.core.samba import SambaClient
+
+
+class Directory(object):
+    def __init__(self, bad_password=(), undeletable=()):
+        self.bad_password = bad_password
+        self.undeletable = undeletable
+        self.entries = set()
+
+    def fullname_from_names(self, given_name=None, initials=None, surname=None):
+        return ""
+
+    def add(self, message):
+        self.entries.add(message["dn"])
+
+    def setpassword(self, search_filter, password, force_change=False):
+        if password in self.bad_password:
+            raise Exception("password does not meet the complexity requirements")
+
+    def delete(self, dn):
+        if dn in self.undeletable:
+            raise Exception("insufficient access rights")
+        self.entries.discard(dn)
+
+
+class Client(SambaClient):
+    def __init__(self, directory):
+        self.directory = directory
+
+    @property
+    def _client(self):
+        return self.directory
+
+    @contextmanager
+    def transaction(self, samdb=None):
+        yield
+
+    def domain_info(self):
+        return DomainInfo("DC=x", "CN=Users,DC=x", "x.test")
+
+
+def rows(*passwords):
+    return [
+        (i + 2, {"username": f"u{i}", "password": p}) for i, p in enumerate(passwords)
+    ]
+
+
+def statuses(results):
+    return [r["status"] for r in results]
+
+
+def test_failed_setpassword_leaves_no_account():
+    directory = Directory(bad_password={"weak"})
+    results = Client(directory)._import_users_chunk(rows("Good1!", "weak", "Good2!"))
+    assert statuses(results) == ["rolled_back", "failed", "skipped"]
+    assert directory.entries == set()
+
+
+def test_undo_failures_are_reported():
+    directory = Directory(
+        bad_password={"weak"},
+        undeletable={"CN=u0,CN=Users,DC=x", "CN=u1,CN=Users,DC=x"},
+    )
+    results = Client(directory)._import_users_chunk(rows("Good1!", "weak"))
+    assert statuses(results) == ["not_rolled_back", "failed"]
+    assert "insufficient access rights" in results[0]["error"]
+    assert "`CN=u1,CN=Users,DC=x` was left behind" in results[1]["error"]
+
+
+def test_chunk_without_errors_is_created():
+    directory = Directory()
+    results = Client(directory)._import_users_chunk(rows("Good1!", "Good2!"))
+    assert statuses(results) == ["created", "created"]
+    assert len(directory.entries) == 2
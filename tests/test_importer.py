@@ -0,0 +1,34 @@
+import io
+
+from app.user.importer import RowError, iter_csv_rows, iter_ldif_rows
+
+
+def test_bad_ldif_record_fails_on_its_own():
+    ldif = (
+        b"dn: CN=a,OU=x,DC=t\nsAMAccountName: a\n\n"
+        b"dn: CN=b,OU=x,DC=t\nsAMAccountName:: !!!notbase64\n\n"
+        b"dn: CN=c,OU=x,DC=t\nsAMAccountName:: /w==\n\n"
+        b"dn: CN=d,OU=x,DC=t\nsAMAccountName: d\n"
+    )
+    rows = list(iter_ldif_rows(io.BytesIO(ldif)))
+    assert [line for line, _ in rows] == [1, 4, 7, 10]
+    assert rows[0][1] == {"userou": "OU=x", "username": "a"}
+    assert isinstance(rows[1][1], RowError)
+    assert isinstance(rows[2][1], RowError)
+    assert rows[3][1] == {"userou": "OU=x", "username": "d"}
+
+
+def test_undecodable_ldif_record_fails_on_its_own():
+    ldif = b"sAMAccountName: a\n\nsAMAccountName: b\xff\n\nsAMAccountName: c\n"
+    rows = list(iter_ldif_rows(io.BytesIO(ldif)))
+    assert rows[0] == (1, {"username": "a"})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], RowError)
+    assert rows[2] == (5, {"username": "c"})
+
+
+def test_undecodable_csv_row_fails_on_its_own():
+    data = b"username,password\na,Secret1!\nb\xff,Secret2!\nc,Secret3!\n"
+    rows = list(iter_csv_rows(io.BytesIO(data)))
+    assert rows[0] == (2, {"username": "a", "password": "Secret1!"})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], RowError)
+    assert rows[2] == (4, {"username": "c", "password": "Secret3!"})
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+from app.jobs.runner import (
+    CANCELLED,
+    INTERRUPTED,
+    QUEUED,
+    SUCCEEDED,
+    JobRunner,
+    JobStore,
+)
+
+
+def spool(tmp_path, name="upload.import"):
+    path = tmp_path / name
+    path.write_text("username,password\nalice,Secret1!\n")
+    return str(path)
+
+
+def make_runner(tmp_path, workers=1):
+    return JobRunner(JobStore(str(tmp_path / "jobs.sqlite3")), workers)
+
+
+def test_files_are_removed_when_the_job_ends(tmp_path):
+    runner = make_runner(tmp_path)
+    path = spool(tmp_path)
+    job_id = runner.submit("import_users", "alice", lambda ctx: {}, files=[path])
+    runner._executor.shutdown(wait=True)
+    assert runner.store.get(job_id)["status"] == SUCCEEDED
+    assert not os.path.exists(path)
+
+
+def test_files_are_removed_when_a_queued_job_is_cancelled(tmp_path):
+    runner = make_runner(tmp_path)
+    busy = threading.Event()
+    runner.submit("move_user_ou", "alice", lambda ctx: busy.wait(5))
+    path = spool(tmp_path)
+    ran = []
+    job_id = runner.submit(
+        "import_users", "alice", lambda ctx: ran.append(1), files=[path]
+    )
+    assert runner.cancel(job_id)
+    busy.set()
+    runner._executor.shutdown(wait=True)
+    assert runner.store.get(job_id)["status"] == CANCELLED
+    assert ran == []
+    assert not os.path.exists(path)
+
+
+def test_files_of_orphaned_jobs_are_removed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    path = spool(tmp_path)
+    job_id = store.create("import_users", "alice", files=[path])
+    # as if created by a worker which is gone
+    store._update(job_id, pid=2**22 + 1)
+    JobRunner(store, 1)
+    assert store.get(job_id)["status"] == INTERRUPTED
+    assert not os.path.exists(path)
+
+
+def test_jobs_of_an_earlier_process_with_our_pid_are_orphans(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create("move_user_ou", "alice")
+    # the pid is alive again, but it is another process now
+    store._update(job_id, boot="gone")
+    JobRunner(store, 1)
+    assert store.get(job_id)["status"] == INTERRUPTED
+
+
+def test_jobs_of_live_workers_are_kept(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create("move_user_ou", "alice")
+    JobRunner(store, 1)
+    assert store.get(job_id)["status"] == QUEUED
+
+
+def test_finished_jobs_are_pruned(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    old = store.create("move_user_ou", "alice")
+    store.finish(old, SUCCEEDED)
+    store._update(old, finished_at=time.time() - 2 * 86400)
+    recent = store.create("move_user_ou", "alice")
+    store.finish(recent, SUCCEEDED)
+    running = store.create("move_user_ou", "alice")
+    JobRunner(store, 1, keep_days=1)
+    assert store.get(old) is None
+    assert store.get(recent)["status"] == SUCCEEDED
+    assert store.get(running) is not None
@@ -0,0 +1,60 @@
+import pytest
+
+from app.core.localsam import LocalSam
+
+
+class Entry(dict):
+    def get(self, name, default=None, idx=None):
+        value = dict.get(self, name, default)
+        if idx is not None and isinstance(value, list):
+            return value[idx] if value else None
+        return value
+
+
+class System(object):
+    def __init__(self, **attrs):
+        self.user = Entry({name: [value] for name, value in attrs.items()})
+
+    def domain_dn(self):
+        return "DC=x"
+
+    def get_nttime(self):
+        return 1000
+
+    def search(self, base, scope, expression, attrs):
+        return [self.user]
+
+
+@pytest.fixture
+def sam():
+    sam = LocalSam("/var/lib/samba/private/sam.ldb", 300)
+    sam._system = System(userAccountControl="512", pwdLastSet="100")
+    sam.remember("alice", "Secret1!", "100")
+    return sam
+
+
+def test_remembered_password_is_verified(sam):
+    assert sam.is_verified("alice", "Secret1!")
+    assert not sam.is_verified("alice", "Secret2!")
+
+
+@pytest.mark.parametrize(
+    "attrs",
+    [
+        # disabled
+        {"userAccountControl": "514", "pwdLastSet": "100"},
+        # locked out
+        {
+            "userAccountControl": "512",
+            "msDS-User-Account-Control-Computed": "16",
+            "pwdLastSet": "100",
+        },
+        # expired
+        {"userAccountControl": "512", "accountExpires": "999", "pwdLastSet": "100"},
+        # password changed
+        {"userAccountControl": "512", "pwdLastSet": "200"},
+    ],
+)
+def test_remembered_password_needs_a_usable_account(sam, attrs):
+    sam._system = System(**attrs)
+    assert not sam.is_verified("alice", "Secret1!")
@@ -0,0 +1,48 @@
+from app.core.pool import ConnectionPool
+
+
+class Conn(object):
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def search(self, base, scope=None, attrs=None):
+        if not self.alive:
+            raise Exception("NT_STATUS_CONNECTION_RESET")
+        return []
+
+
+def make_pool(size=2, idle_seconds=60):
+    return ConnectionPool("svc", "secret", size, idle_seconds)
+
+
+def test_released_connections_are_reused():
+    pool = make_pool()
+    conn = Conn()
+    connections = {"ldap://dc1": conn}
+    pool.release(connections)
+    assert connections == {}
+    assert pool.acquire("ldap://dc1") is conn
+    assert pool.acquire("ldap://dc1") is None
+    assert pool.acquire("ldap://dc2") is None
+
+
+def test_idle_connections_are_capped():
+    pool = make_pool(size=1)
+    pool.release({"ldap://dc1": Conn()})
+    pool.release({"ldap://dc1": Conn()})
+    assert pool.acquire("ldap://dc1") is not None
+    assert pool.acquire("ldap://dc1") is None
+
+
+def test_stale_connections_are_dropped():
+    pool = make_pool(idle_seconds=0)
+    pool.release({"ldap://dc1": Conn()})
+    assert pool.acquire("ldap://dc1") is None
+
+
+def test_dead_connections_are_skipped():
+    pool = make_pool()
+    live = Conn()
+    pool.release({"ldap://dc1": live})
+    pool.release({"ldap://dc1": Conn(alive=False)})
+    assert pool.acquire("ldap://dc1") is live
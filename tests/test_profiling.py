@@ -0,0 +1,65 @@
+import os
+
+from app.core import profiling
+from app.core.profiling import LDAP_FILES, SAMBA_DIR, ProfilingMiddleware, phase
+
+HANDLER = ("/srv/app/user/services.py", "get_users")
+NEW = "f" * 32
+
+
+def profile_name(i):
+    return f"{i:032x}.json"
+
+
+def test_phase_of_ldap_calls():
+    assert phase((HANDLER, (LDAP_FILES[0], "paged_search"))) == "ldap"
+    assert phase((HANDLER, (os.path.join(SAMBA_DIR, "samdb.py"), "search"))) == "ldap"
+
+
+def test_innermost_telling_frame_decides():
+    validate = ("/site-packages/pydantic/main.py", "validate_model")
+    assert phase((HANDLER, ("schemas.py", "from_samba_message"), validate)) == "decode"
+    assert phase((HANDLER, ("routing.py", "serialize_response"), validate)) == (
+        "serialize"
+    )
+    decode_in_ldap = (HANDLER, (LDAP_FILES[0], "list_users"), ("x.py", "decode_entry"))
+    assert phase(decode_in_ldap) == "decode"
+    assert phase((HANDLER,)) == "other"
+
+
+def test_write_keeps_the_newest_profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 2)
+    for i in range(4):
+        path = tmp_path / profile_name(i)
+        path.write_text("{}")
+        os.utime(path, (i, i))
+    ProfilingMiddleware._write({"id": NEW})
+    assert sorted(os.listdir(tmp_path)) == [profile_name(3), f"{NEW}.json"]
+
+
+def test_write_prunes_only_profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 1)
+    for name in ("notes.json", "README", profile_name(0)):
+        path = tmp_path / name
+        path.write_text("{}")
+        os.utime(path, (0, 0))
+    ProfilingMiddleware._write({"id": NEW})
+    assert sorted(os.listdir(tmp_path)) == ["README", f"{NEW}.json", "notes.json"]
+
+
+def test_write_ignores_profiles_removed_meanwhile(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 1)
+    (tmp_path / profile_name(0)).write_text("{}")
+    real_remove = os.remove
+
+    def remove(path):
+        # another worker pruned it first
+        real_remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(profiling.os, "remove", remove)
+    ProfilingMiddleware._write({"id": NEW})
+    assert os.listdir(tmp_path) == [f"{NEW}.json"]
@@ -0,0 +1,80 @@
+import struct
+
+import pytest
+
+from app.gpo.sysvol import SysvolError, parse_registry_pol
+
+
+def text(value):
+    return (value + "\x00").encode("utf-16-le")
+
+
+def entry(key, value_name, reg_type, data):
+    sep = ";".encode("utf-16-le")
+    return b"".join(
+        [
+            "[".encode("utf-16-le"),
+            text(key),
+            sep,
+            text(value_name),
+            sep,
+            struct.pack("<I", reg_type),
+            sep,
+            struct.pack("<I", len(data)),
+            sep,
+            data,
+            "]".encode("utf-16-le"),
+        ]
+    )
+
+
+HEADER = b"PReg" + struct.pack("<I", 1)
+
+
+def test_parse_registry_pol():
+    pol = (
+        HEADER
+        + entry("Software\\Policies\\X", "Enabled", 4, struct.pack("<I", 1))
+        + entry("Software\\Policies\\X", "Name", 1, text("abc"))
+    )
+    assert parse_registry_pol(pol) == [
+        {
+            "key": "Software\\Policies\\X",
+            "value_name": "Enabled",
+            "type": "REG_DWORD",
+            "data": 1,
+        },
+        {
+            "key": "Software\\Policies\\X",
+            "value_name": "Name",
+            "type": "REG_SZ",
+            "data": "abc",
+        },
+    ]
+
+
+def test_invalid_signature():
+    with pytest.raises(SysvolError):
+        parse_registry_pol(b"XReg" + struct.pack("<I", 1))
+
+
+@pytest.mark.parametrize("cut", [2, 8, 14, 16, 20, 22, 26, 28, 30])
+def test_truncated_registry_pol(cut):
+    pol = HEADER + entry("K", "V", 4, struct.pack("<I", 1))
+    with pytest.raises(SysvolError):
+        parse_registry_pol(pol[: len(HEADER) + cut])
+
+
+def test_size_past_the_end():
+    pol = HEADER + entry("K", "V", 3, b"\x01\x02")
+    pol = pol.replace(struct.pack("<I", 2), struct.pack("<I", 1000), 1)
+    with pytest.raises(SysvolError):
+        parse_registry_pol(pol)
+
+
+def test_invalid_utf16_key():
+    pol = HEADER + entry("K", "V", 4, struct.pack("<I", 1))
+    # a lone low surrogate
+    pol = pol.replace("K".encode("utf-16-le"), b"\x00\xdc", 1)
+    with pytest.raises(SysvolError):
+        parse_registry_pol(pol)
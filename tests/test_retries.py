@@ -0,0 +1,78 @@
+import asyncio
+
+import ldb
+import pytest
+
+from app.core import samba
+from app.core.samba import DirectoryUnavailable, SambaClient, idempotent
+
+
+class Client(object):
+    read_host = "ldap://unknown"
+
+    def __init__(self):
+        self.calls = 0
+        self.failovers = 0
+
+    def _failover(self):
+        self.failovers += 1
+
+    @idempotent
+    def read(self):
+        self.calls += 1
+        if self.calls == 1:
+            raise Exception("NT_STATUS_CONNECTION_RESET")
+        return "entry"
+
+
+def test_retry_sleeps_in_a_thread(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(samba.time, "sleep", sleeps.append)
+    client = Client()
+    assert client.read() == "entry"
+    assert client.failovers == 1
+    assert len(sleeps) == 1
+
+
+def test_retry_does_not_block_the_event_loop(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(samba.time, "sleep", sleeps.append)
+    client = Client()
+
+    async def read():
+        return client.read()
+
+    assert asyncio.run(read()) == "entry"
+    assert client.failovers == 1
+    assert sleeps == []
+
+
+def test_retry_on_the_event_loop_needs_another_dc(monkeypatch):
+    monkeypatch.setattr(samba.balancer, "has_other_healthy", lambda url: False)
+    client = Client()
+
+    async def read():
+        return client.read()
+
+    with pytest.raises(DirectoryUnavailable):
+        asyncio.run(read())
+    assert client.calls == 1
+    assert client.failovers == 0
+
+
+class Transactions(object):
+    def transaction_start(self):
+        pass
+
+    def transaction_cancel(self):
+        raise ldb.LdbError(ldb.ERR_OPERATIONS_ERROR, "no transaction")
+
+
+def test_failed_cancel_keeps_the_original_error():
+    client = SambaClient.__new__(SambaClient)
+    error = ValueError("no such group")
+    with pytest.raises(ValueError) as e:
+        with client.transaction(Transactions()):
+            raise error
+    assert e.value is error
+    assert isinstance(e.value.__cause__, ldb.LdbError)
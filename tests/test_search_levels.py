@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+
+import ldb
+import pytest
+
+from app.core.samba import SambaClient
+
+
+class Entry(dict):
+    def __init__(self, dn: str, *classes: str):
+        super().__init__(objectClass=[c.encode() for c in classes])
+        self.dn = dn
+
+
+# parent dn -> children
+TREE = {
+    "OU=top,DC=x": [
+        Entry("CN=alice,OU=top,DC=x", "top", "person", "user"),
+        Entry("OU=sub,OU=top,DC=x", "top", "organizationalUnit"),
+    ],
+    "OU=sub,OU=top,DC=x": [
+        Entry("CN=bob,OU=sub,OU=top,DC=x", "top", "person", "user"),
+        Entry("OU=deep,OU=sub,OU=top,DC=x", "top", "organizationalUnit"),
+    ],
+    "OU=deep,OU=sub,OU=top,DC=x": [
+        Entry("CN=carol,OU=deep,OU=sub,OU=top,DC=x", "top", "person", "user"),
+    ],
+}
+
+BASES = [Entry("OU=top,DC=x", "top", "organizationalUnit")]
+
+
+def make_client():
+    client = SambaClient.__new__(SambaClient)
+    searches = []
+
+    def paged_search(expression, attrs, base=None, scope=None, **kwargs):
+        searches.append((base, scope))
+        if scope == ldb.SCOPE_BASE:
+            return iter(
+                [e for e in BASES if e.dn == base and "organizational" in expression]
+            )
+        return iter(TREE.get(base, []))
+
+    @contextmanager
+    def transaction(samdb=None):
+        yield
+
+    client.paged_search = paged_search
+    client.transaction = transaction
+    client._reader = None
+    return client, searches
+
+
+def test_search_levels_stops_at_max_depth():
+    client, searches = make_client()
+    entries = client._search_levels(
+        "OU=top,DC=x", "(objectclass=user)", ["name"], ["user"], 2
+    )
+    assert [e.dn for e in entries] == [
+        "CN=alice,OU=top,DC=x",
+        "CN=bob,OU=sub,OU=top,DC=x",
+    ]
+    # the third level is never read
+    assert ("OU=deep,OU=sub,OU=top,DC=x", ldb.SCOPE_ONELEVEL) not in searches
+
+
+def test_search_levels_matches_classes_case_insensitively():
+    client, _ = make_client()
+    entries = client._search_levels(
+        "OU=top,DC=x", "(objectclass=organizationalUnit)", [], ["organizationalUnit"], 3
+    )
+    assert [e.dn for e in entries] == [
+        "OU=top,DC=x",
+        "OU=sub,OU=top,DC=x",
+        "OU=deep,OU=sub,OU=top,DC=x",
+    ]
+
+
+@pytest.mark.parametrize("depth", [0, 1, 2])
+def test_base_is_found_at_any_depth(depth):
+    client, _ = make_client()
+    entries = client.search_by_dn(
+        "OU=top,DC=x", ["organizationalUnit"], max_depth=depth
+    )
+    assert entries[0].dn == "OU=top,DC=x"
+    assert len(entries) == depth + 1
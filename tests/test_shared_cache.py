@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from app.core.shared_cache import MISSING, SharedCache
+
+
+def make_cache(tmp_path, size_mb=1):
+    private = tmp_path / "run"
+    return SharedCache(str(private / "cache.lmdb"), size_mb)
+
+
+def test_none_is_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return None
+
+    assert cache.get_or_load("k", load) is None
+    assert cache.get_or_load("k", load) is None
+    assert loads == [1]
+    assert cache.get("other") is MISSING
+
+
+def test_directory_is_created_private(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("k", 1)
+    assert os.stat(tmp_path / "run").st_mode & 0o777 == 0o700
+
+
+def test_shared_directory_is_refused(tmp_path):
+    shared = tmp_path / "run"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    with pytest.raises(RuntimeError):
+        make_cache(tmp_path).put("k", 1)
+
+
+def test_full_map_evicts_the_oldest_entries(tmp_path):
+    cache = make_cache(tmp_path)
+    value = b"x" * 64 * 1024
+    for i in range(64):
+        cache.put(i, value)
+    assert cache.get(63) == value
+    assert cache.get(0) is MISSING
+    assert any(cache.get(i) is not MISSING for i in range(1, 63))
+
+
+def test_disabled_cache_just_loads(tmp_path):
+    cache = SharedCache("", 1)
+    assert not cache.enabled
+    assert cache.get_or_load("k", lambda: 1) == 1
@@ -0,0 +1,45 @@
+import pytest
+
+from app.gpo import sysvol
+from app.gpo.sysvol import SysvolError, parse_gpt_ini, parse_scripts_ini
+
+
+def test_parse_gpt_ini():
+    ini = "[General]\r\nVersion=65538\r\ndisplayName=Default\r\n".encode("utf-16")
+    assert parse_gpt_ini(ini) == {
+        "version": 65538,
+        "user_version": 1,
+        "machine_version": 2,
+        "display_name": "Default",
+    }
+
+
+@pytest.mark.parametrize(
+    "ini",
+    [
+        # a lone surrogate behind a UTF-16 BOM
+        b"\xff\xfe[\x00G\x00\x00\xd8",
+        b"Version=1\n",
+        b"[General]\nVersion=abc\n",
+    ],
+)
+def test_malformed_gpt_ini(ini):
+    with pytest.raises(SysvolError):
+        parse_gpt_ini(ini)
+
+
+def test_malformed_scripts_ini():
+    with pytest.raises(SysvolError):
+        parse_scripts_ini(b"0CmdLine=logon.bat\n[Logon]\n")
+
+
+def test_unreadable_file(tmp_path, monkeypatch):
+    path = tmp_path / "GPT.INI"
+    path.write_bytes(b"[General]\nVersion=1\n")
+
+    def denied(path, size, parser):
+        raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(sysvol, "_map_file", denied)
+    with pytest.raises(SysvolError):
+        sysvol._ParsedFileCache().get(str(path), "1", parse_gpt_ini)
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.feed import watcher as watcher_module
+from app.feed.watcher import MAX_POLL_BACKOFF, ChangeWatcher
+
+
+class FailingWatcher(ChangeWatcher):
+    def __init__(self, results):
+        super().__init__("svc", "secret", 2, 10, 10)
+        self.results = list(results)
+        self._subscribers.add(asyncio.Queue())
+
+    def _poll(self):
+        result = self.results.pop(0)
+        if not self.results:
+            # last round
+            self._subscribers.clear()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def run(watcher, monkeypatch):
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(watcher_module.asyncio, "sleep", sleep)
+    asyncio.run(watcher._run())
+    return delays
+
+
+def test_failed_polls_are_logged_and_backed_off(monkeypatch, caplog):
+    error = Exception("NT_STATUS_CONNECTION_RESET")
+    watcher = FailingWatcher([error, error, error, [], error])
+    with caplog.at_level(logging.ERROR, logger="app.feed.watcher"):
+        delays = run(watcher, monkeypatch)
+    assert delays == [4, 8, 16, 2, 4]
+    assert len(caplog.records) == 4
+    assert caplog.records[0].exc_info[1] is error
+
+
+def test_backoff_is_capped():
+    watcher = FailingWatcher([[]])
+    assert watcher._delay(0) == 2
+    assert watcher._delay(20) == MAX_POLL_BACKOFF
+
+
+class Entry(dict):
+    def __init__(self, dn, **attrs):
+        super().__init__(attrs)
+        self.dn = dn
+
+    def get(self, name, default=None, idx=None):
+        value = dict.get(self, name, default)
+        if idx is not None and isinstance(value, list):
+            return value[idx] if value else None
+        return value
+
+
+def group(usn, *members):
+    return Entry(
+        "CN=staff,DC=x",
+        objectGUID="g1",
+        objectClass=[b"top", b"group"],
+        name="staff",
+        member=list(members),
+        uSNCreated=1,
+        uSNChanged=usn,
+    )
+
+
+class Directory(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def changed_since(self, search_filter, attrs, since_usn=0):
+        for page in self.pages.pop(0):
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+
+def test_poll_failing_partway_keeps_member_events():
+    watcher = ChangeWatcher("svc", "secret", 2, 10, 10)
+    watcher.dc, watcher.usn = "dc1", 10
+    watcher._members = {"g1": {"CN=a"}}
+    error = Exception("NT_STATUS_CONNECTION_RESET")
+    watcher._client = Directory(
+        [[group(11, "CN=a", "CN=b"), error], [group(11, "CN=a", "CN=b")]]
+    )
+    with pytest.raises(Exception) as e:
+        watcher._poll()
+    assert e.value is error
+    assert watcher._members == {"g1": {"CN=a"}}
+    assert watcher.usn == 10
+    events = watcher._poll()
+    assert [(e["type"], e.get("member")) for e in events] == [
+        ("modify", None),
+        ("member_add", "CN=b"),
+    ]
+    assert watcher._members == {"g1": {"CN=a", "CN=b"}}
+    assert watcher.usn == 11